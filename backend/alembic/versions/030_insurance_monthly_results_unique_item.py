@@ -0,0 +1,40 @@
+"""insurance_monthly_results (employee_id, year_month, item_type) 唯一約束（供整批 ON CONFLICT upsert）
+
+Revision ID: 030
+Revises: 029
+Create Date: 2026-02-20
+
+"""
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "030"
+down_revision: Union[str, None] = "029"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 先清除重複列（同員工/年月/項目僅保留 id 最大者，即最後寫入的結果）
+    op.execute(
+        """
+        DELETE FROM insurance_monthly_results
+        WHERE id NOT IN (
+            SELECT MAX(id) FROM insurance_monthly_results
+            GROUP BY employee_id, year_month, item_type
+        )
+        """
+    )
+    op.create_index(
+        "uq_insurance_monthly_result_item",
+        "insurance_monthly_results",
+        ["employee_id", "year_month", "item_type"],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("uq_insurance_monthly_result_item", table_name="insurance_monthly_results")
@@ -0,0 +1,48 @@
+"""accounting_jobs：傻瓜會計背景工作（上傳計算進度與結果）
+
+Revision ID: 031
+Revises: 030
+Create Date: 2026-02-21
+
+"""
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "031"
+down_revision: Union[str, None] = "030"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "accounting_jobs",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("kind", sa.String(40), nullable=False, comment="工作種類，如 security_payroll_upload"),
+        sa.Column("status", sa.String(20), nullable=False, comment="queued/running/succeeded/failed"),
+        sa.Column("phase", sa.String(20), nullable=False, comment="queued/parsing/calculating/writing/done"),
+        sa.Column("params", sa.JSON(), nullable=True, comment="工作參數（year/month/type/檔名等）"),
+        sa.Column("rows_parsed", sa.Integer(), nullable=False, server_default="0", comment="已解析時數列數"),
+        sa.Column("employees_resolved", sa.Integer(), nullable=False, server_default="0", comment="已對應員工數"),
+        sa.Column("rows_written", sa.Integer(), nullable=False, server_default="0", comment="已寫入結果列數"),
+        sa.Column("result", sa.JSON(), nullable=True, comment="完成後之回傳內容（results/errors...）"),
+        sa.Column("error", sa.Text(), nullable=True, comment="失敗原因"),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_accounting_jobs_kind", "accounting_jobs", ["kind"], unique=False)
+    op.create_index("ix_accounting_jobs_status", "accounting_jobs", ["status"], unique=False)
+    op.create_index("ix_accounting_jobs_created_at", "accounting_jobs", ["created_at"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_accounting_jobs_created_at", table_name="accounting_jobs")
+    op.drop_index("ix_accounting_jobs_status", table_name="accounting_jobs")
+    op.drop_index("ix_accounting_jobs_kind", table_name="accounting_jobs")
+    op.drop_table("accounting_jobs")
@@ -0,0 +1,46 @@
+"""accounting_payroll_hours：保存上傳時數明細，供單一員工/案場增量重算
+
+Revision ID: 032
+Revises: 031
+Create Date: 2026-02-22
+
+"""
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "032"
+down_revision: Union[str, None] = "031"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "accounting_payroll_hours",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("year", sa.Integer(), nullable=False, comment="西元年"),
+        sa.Column("month", sa.Integer(), nullable=False, comment="1～12"),
+        sa.Column("type", sa.String(30), nullable=False, comment="security / property / smith / cleaning"),
+        sa.Column("site", sa.String(100), nullable=False, comment="案場名稱"),
+        sa.Column("employee", sa.String(50), nullable=False, comment="員工姓名"),
+        sa.Column("work_date", sa.Date(), nullable=False, comment="出勤日"),
+        sa.Column("hours", sa.Float(), nullable=False, comment="當日工時"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_accounting_payroll_hours_period_employee",
+        "accounting_payroll_hours",
+        ["year", "month", "type", "employee"],
+        unique=False,
+    )
+    op.create_index("ix_accounting_payroll_hours_site", "accounting_payroll_hours", ["site"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_accounting_payroll_hours_site", table_name="accounting_payroll_hours")
+    op.drop_index("ix_accounting_payroll_hours_period_employee", table_name="accounting_payroll_hours")
+    op.drop_table("accounting_payroll_hours")
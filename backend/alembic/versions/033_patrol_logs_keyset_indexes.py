@@ -0,0 +1,27 @@
+"""patrol_logs 複合索引：(created_at, id) 供 keyset 分頁、(site_id, checkin_date) 供案場日期查詢
+
+Revision ID: 033
+Revises: 032
+Create Date: 2026-02-23
+
+"""
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "033"
+down_revision: Union[str, None] = "032"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_patrol_logs_created_at_id", "patrol_logs", ["created_at", "id"], unique=False)
+    op.create_index("ix_patrol_logs_site_id_checkin_date", "patrol_logs", ["site_id", "checkin_date"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_patrol_logs_site_id_checkin_date", table_name="patrol_logs")
+    op.drop_index("ix_patrol_logs_created_at_id", table_name="patrol_logs")
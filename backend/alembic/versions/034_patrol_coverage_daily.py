@@ -0,0 +1,63 @@
+"""patrol_coverage_daily：巡邏覆蓋每日彙總（巡邏點 × 日期 × 時段），並由既有 patrol_logs 回填
+
+Revision ID: 034
+Revises: 033
+Create Date: 2026-02-24
+
+"""
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "034"
+down_revision: Union[str, None] = "033"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "patrol_coverage_daily",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("site_id", sa.Integer(), nullable=True, comment="案場（打卡當下巡邏點所屬）"),
+        sa.Column("point_id", sa.Integer(), nullable=False),
+        sa.Column("scan_date", sa.Date(), nullable=False, comment="掃碼日期（Asia/Taipei）"),
+        sa.Column("period", sa.String(10), nullable=False, comment="早上/下午/晚上"),
+        sa.Column("scan_count", sa.Integer(), nullable=False),
+        sa.Column("first_scan", sa.DateTime(), nullable=False, comment="當日該時段第一次掃碼（UTC）"),
+        sa.Column("last_scan", sa.DateTime(), nullable=False, comment="當日該時段最後一次掃碼（UTC）"),
+        sa.ForeignKeyConstraint(["site_id"], ["sites.id"], ondelete="SET NULL"),
+        sa.ForeignKeyConstraint(["point_id"], ["patrol_points.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("point_id", "scan_date", "period", name="uq_patrol_coverage_point_date_period"),
+    )
+    op.create_index("ix_patrol_coverage_site_date", "patrol_coverage_daily", ["site_id", "scan_date"], unique=False)
+
+    # 回填：日期/時段依 Asia/Taipei（UTC+8，無日光節約）由 created_at 推得，與打卡端點 checkin_ampm 同規則
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql":
+        local = "(created_at + interval '8 hours')"
+        local_date = f"CAST({local} AS DATE)"
+        local_hour = f"EXTRACT(HOUR FROM {local})"
+    else:
+        local = "datetime(created_at, '+8 hours')"
+        local_date = f"date({local})"
+        local_hour = f"CAST(strftime('%H', {local}) AS INTEGER)"
+    period = f"CASE WHEN {local_hour} < 12 THEN '早上' WHEN {local_hour} < 18 THEN '下午' ELSE '晚上' END"
+    op.execute(
+        f"""
+        INSERT INTO patrol_coverage_daily (site_id, point_id, scan_date, period, scan_count, first_scan, last_scan)
+        SELECT MAX(site_id), point_id, {local_date}, {period}, COUNT(*), MIN(created_at), MAX(created_at)
+        FROM patrol_logs
+        WHERE point_id IS NOT NULL
+        GROUP BY point_id, {local_date}, {period}
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_patrol_coverage_site_date", table_name="patrol_coverage_daily")
+    op.drop_table("patrol_coverage_daily")
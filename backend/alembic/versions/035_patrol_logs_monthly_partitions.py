@@ -0,0 +1,107 @@
+"""patrol_logs 改為依 checkin_date 月份 RANGE 分區（僅 PostgreSQL；SQLite 不變）
+
+分區表主鍵須含分區鍵，故主鍵改為 (id, checkin_date)；id 仍由原序列產生。
+既有資料依月份建立分區後搬入，另建 DEFAULT 分區收容未預先建立月份的資料。
+之後每月分區由排程（app.services.patrol_partitions）預先建立。
+
+Revision ID: 035
+Revises: 034
+Create Date: 2026-02-25
+
+"""
+from __future__ import annotations
+
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "035"
+down_revision: Union[str, None] = "034"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = """
+    id INTEGER NOT NULL DEFAULT nextval('patrol_logs_id_seq'),
+    device_id INTEGER REFERENCES patrol_devices (id) ON DELETE SET NULL,
+    employee_id INTEGER REFERENCES employees (id) ON DELETE SET NULL,
+    point_id INTEGER REFERENCES patrol_points (id) ON DELETE SET NULL,
+    site_id INTEGER REFERENCES sites (id) ON DELETE SET NULL,
+    employee_name VARCHAR(80) NOT NULL,
+    site_name VARCHAR(120) NOT NULL,
+    point_code VARCHAR(80) NOT NULL,
+    point_name VARCHAR(120) NOT NULL,
+    checkin_date DATE NOT NULL,
+    checkin_time TIME WITHOUT TIME ZONE NOT NULL,
+    checkin_ampm VARCHAR(10) NOT NULL,
+    qr_value VARCHAR(1000),
+    device_info TEXT,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL
+"""
+
+COLUMN_NAMES = (
+    "id, device_id, employee_id, point_id, site_id, employee_name, site_name, point_code, point_name, "
+    "checkin_date, checkin_time, checkin_ampm, qr_value, device_info, created_at"
+)
+
+INDEXES = [
+    ("ix_patrol_logs_device_id", ["device_id"]),
+    ("ix_patrol_logs_employee_id", ["employee_id"]),
+    ("ix_patrol_logs_point_id", ["point_id"]),
+    ("ix_patrol_logs_site_id", ["site_id"]),
+    ("ix_patrol_logs_employee_name", ["employee_name"]),
+    ("ix_patrol_logs_site_name", ["site_name"]),
+    ("ix_patrol_logs_point_code", ["point_code"]),
+    ("ix_patrol_logs_checkin_date", ["checkin_date"]),
+    ("ix_patrol_logs_created_at", ["created_at"]),
+    ("ix_patrol_logs_created_at_id", ["created_at", "id"]),
+    ("ix_patrol_logs_site_id_checkin_date", ["site_id", "checkin_date"]),
+]
+
+
+def _next_month(d: date) -> date:
+    return date(d.year + d.month // 12, d.month % 12 + 1, 1)
+
+
+def _swap_table(partitioned: bool) -> None:
+    bind = op.get_bind()
+    op.execute("ALTER TABLE patrol_logs RENAME TO patrol_logs_old")
+    # 主鍵與索引名稱為 schema 層級，須先讓出；序列改由新表持有，避免隨舊表一併刪除
+    op.execute("ALTER TABLE patrol_logs_old RENAME CONSTRAINT patrol_logs_pkey TO patrol_logs_old_pkey")
+    op.execute("ALTER SEQUENCE patrol_logs_id_seq OWNED BY NONE")
+    for name, _ in INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
+    if partitioned:
+        op.execute(f"CREATE TABLE patrol_logs ({COLUMNS}, PRIMARY KEY (id, checkin_date)) PARTITION BY RANGE (checkin_date)")
+        bounds = bind.execute(sa.text("SELECT MIN(checkin_date), MAX(checkin_date) FROM patrol_logs_old")).one()
+        today = date.today().replace(day=1)
+        start = (bounds[0] or today).replace(day=1)
+        end = _next_month(max((bounds[1] or today).replace(day=1), _next_month(today)))
+        month = start
+        while month < end:
+            op.execute(
+                f"CREATE TABLE patrol_logs_y{month.year:04d}m{month.month:02d} PARTITION OF patrol_logs "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_next_month(month).isoformat()}')"
+            )
+            month = _next_month(month)
+        op.execute("CREATE TABLE patrol_logs_default PARTITION OF patrol_logs DEFAULT")
+    else:
+        op.execute(f"CREATE TABLE patrol_logs ({COLUMNS}, PRIMARY KEY (id))")
+    op.execute(f"INSERT INTO patrol_logs ({COLUMN_NAMES}) SELECT {COLUMN_NAMES} FROM patrol_logs_old")
+    op.execute("DROP TABLE patrol_logs_old")
+    op.execute("ALTER SEQUENCE patrol_logs_id_seq OWNED BY patrol_logs.id")
+    for name, columns in INDEXES:
+        op.create_index(name, "patrol_logs", columns, unique=False)
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    _swap_table(partitioned=True)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    _swap_table(partitioned=False)
@@ -0,0 +1,34 @@
+"""accounting_jobs：持有行程識別與心跳，重啟/多 worker 時只清除已無行程持有的中斷工作
+
+Revision ID: 036
+Revises: 035
+Create Date: 2026-02-26
+
+"""
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "036"
+down_revision: Union[str, None] = "035"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "accounting_jobs",
+        sa.Column("worker_id", sa.String(80), nullable=True, comment="持有工作（佇列與上傳內容）之行程識別"),
+    )
+    op.add_column(
+        "accounting_jobs",
+        sa.Column("heartbeat_at", sa.DateTime(), nullable=True, comment="持有行程最後回報存活時間"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("accounting_jobs", "heartbeat_at")
+    op.drop_column("accounting_jobs", "worker_id")
@@ -1,10 +1,21 @@
+"""
+傻瓜會計 - 假日行事曆（週六週日 + 國定假日 JSON）。
+國定假日檔只在 mtime 變更時重新讀取；每個 (年, 月) 預先算好假日集合、應出勤天數與各日 ISO 週，
+以 LRU 快取 MonthCalendar，物業薪資逐員工計算時查表為常數時間。
+"""
 import json
+from calendar import monthrange
+from dataclasses import dataclass
 from datetime import date, datetime
+from functools import lru_cache
 from pathlib import Path
-from typing import Set
+from typing import Dict, FrozenSet, Optional, Set, Tuple
 
 
 _HOLIDAY_FILE = Path(__file__).resolve().parent / "data" / "tw_holidays_2025_2027.json"
+MONTH_CACHE_SIZE = 128
+
+IsoWeek = Tuple[int, int]  # (ISO 年, ISO 週)
 
 
 def _load_holiday_map() -> dict[str, list[str]]:
@@ -16,23 +27,90 @@ def _load_holiday_map() -> dict[str, list[str]]:
         return {}
 
 
-def get_holiday_dates(year: int, month: int) -> Set[date]:
-    holidays: Set[date] = set()
-    holiday_map = _load_holiday_map()
-    for raw in holiday_map.get(str(year), []):
-        try:
-            d = datetime.strptime(raw, "%Y-%m-%d").date()
-        except ValueError:
-            continue
-        if d.month == month:
-            holidays.add(d)
+def _file_mtime() -> Optional[int]:
+    try:
+        return _HOLIDAY_FILE.stat().st_mtime_ns
+    except OSError:
+        return None
 
-    # 第一版：週六週日 + 國定假日（JSON）
-    from calendar import monthrange
 
+_national: Optional[Tuple[Optional[int], Dict[Tuple[int, int], FrozenSet[date]]]] = None
+
+
+def _national_holidays(mtime: Optional[int]) -> Dict[Tuple[int, int], FrozenSet[date]]:
+    """國定假日依 (年, 月) 分組；檔案 mtime 未變更時沿用上次解析結果。"""
+    global _national
+    if _national is None or _national[0] != mtime:
+        by_month: Dict[Tuple[int, int], Set[date]] = {}
+        for year_key, raws in _load_holiday_map().items():
+            if not str(year_key).isdigit():
+                continue
+            for raw in raws or []:
+                try:
+                    d = datetime.strptime(raw, "%Y-%m-%d").date()
+                except (TypeError, ValueError):
+                    continue
+                # 依所列年度分組（與逐次讀檔時 holiday_map[str(year)] 的取法一致）
+                by_month.setdefault((int(year_key), d.month), set()).add(d)
+        _national = (mtime, {k: frozenset(v) for k, v in by_month.items()})
+    return _national[1]
+
+
+@dataclass(frozen=True)
+class MonthCalendar:
+    year: int
+    month: int
+    days_in_month: int
+    holidays: FrozenSet[date]
+    # 第 i 日（0 起算）所屬 ISO 週
+    day_weeks: Tuple[IsoWeek, ...]
+
+    @property
+    def holiday_count(self) -> int:
+        return len(self.holidays)
+
+    @property
+    def required_workdays(self) -> int:
+        """應出勤天數 = 當月天數 - 假日天數。"""
+        return max(self.days_in_month - len(self.holidays), 0)
+
+    @property
+    def iso_weeks(self) -> Tuple[IsoWeek, ...]:
+        """當月橫跨的 ISO 週（依序、不重複）。"""
+        return tuple(dict.fromkeys(self.day_weeks))
+
+    def iso_week(self, d: date) -> IsoWeek:
+        """當月日期所屬 ISO 週；非當月日期改為即時計算。"""
+        if d.year == self.year and d.month == self.month:
+            return self.day_weeks[d.day - 1]
+        iso = d.isocalendar()
+        return (iso.year, iso.week)
+
+
+@lru_cache(maxsize=MONTH_CACHE_SIZE)
+def _month_calendar(year: int, month: int, mtime: Optional[int]) -> MonthCalendar:
     _, last_day = monthrange(year, month)
-    for day in range(1, last_day + 1):
-        d = date(year, month, day)
-        if d.weekday() >= 5:
-            holidays.add(d)
-    return holidays
+    days = [date(year, month, day) for day in range(1, last_day + 1)]
+    # 第一版：週六週日 + 國定假日（JSON）
+    holidays = set(_national_holidays(mtime).get((year, month), ()))
+    holidays.update(d for d in days if d.weekday() >= 5)
+    weeks = []
+    for d in days:
+        iso = d.isocalendar()
+        weeks.append((iso.year, iso.week))
+    return MonthCalendar(
+        year=year,
+        month=month,
+        days_in_month=last_day,
+        holidays=frozenset(holidays),
+        day_weeks=tuple(weeks),
+    )
+
+
+def get_month_calendar(year: int, month: int) -> MonthCalendar:
+    """取得 (年, 月) 行事曆；假日檔變更後自動重算（mtime 為快取 key 的一部分）。"""
+    return _month_calendar(year, month, _file_mtime())
+
+
+def get_holiday_dates(year: int, month: int) -> Set[date]:
+    return set(get_month_calendar(year, month).holidays)
@@ -0,0 +1,162 @@
+"""
+傻瓜會計 - 時數檔解析快取。
+以檔案內容 SHA-256 + (year, month, 副檔名) + 解析邏輯版本（HOURS_PARSER_VERSION）為 key，將解析結果（records, parse_errors）以欄式 + zlib 壓縮
+pickle 存於 upload_dir/parse_cache；同一檔案重複上傳時略過解析，只重跑 validate_and_calculate。
+總大小超過 parse_cache_max_mb 時依最後使用時間（mtime）淘汰最舊者（LRU）。
+"""
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import zlib
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from app.config import settings
+from app.accounting.security_payroll_service import HOURS_PARSER_VERSION
+
+logger = logging.getLogger(__name__)
+
+_CACHE_SUFFIX = ".parse.bin"
+_FORMAT_VERSION = 1
+
+
+def _cache_dir() -> Path:
+    return Path(settings.upload_dir) / "parse_cache"
+
+
+def _enabled() -> bool:
+    return settings.parse_cache_max_mb > 0
+
+
+def cache_key(content: bytes, filename: str, year: Optional[int], month: Optional[int]) -> str:
+    ext = (filename or "").lower().split(".")[-1]
+    digest = hashlib.sha256(content).hexdigest()
+    return f"{digest}_{year or 0}_{month or 0}_{ext}_p{HOURS_PARSER_VERSION}"
+
+
+def _encode(records: List[dict], parse_errors: List[str]) -> bytes:
+    """欄式儲存：案場/員工以字典編碼，其餘欄位各一個 list。"""
+    sites: List[str] = []
+    employees: List[str] = []
+    site_idx: dict = {}
+    employee_idx: dict = {}
+    site_codes: List[int] = []
+    employee_codes: List[int] = []
+    for r in records:
+        s = r.get("site")
+        e = r.get("employee")
+        if s not in site_idx:
+            site_idx[s] = len(sites)
+            sites.append(s)
+        if e not in employee_idx:
+            employee_idx[e] = len(employees)
+            employees.append(e)
+        site_codes.append(site_idx[s])
+        employee_codes.append(employee_idx[e])
+    payload = {
+        "v": _FORMAT_VERSION,
+        "sites": sites,
+        "employees": employees,
+        "site": site_codes,
+        "employee": employee_codes,
+        "date": [r.get("date") for r in records],
+        "hours": [r.get("hours") for r in records],
+        "errors": list(parse_errors),
+    }
+    return zlib.compress(pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def _decode(blob: bytes) -> Optional[Tuple[List[dict], List[str]]]:
+    payload = pickle.loads(zlib.decompress(blob))
+    if payload.get("v") != _FORMAT_VERSION:
+        return None
+    sites = payload["sites"]
+    employees = payload["employees"]
+    records = [
+        {"site": sites[s], "employee": employees[e], "date": d, "hours": h}
+        for s, e, d, h in zip(payload["site"], payload["employee"], payload["date"], payload["hours"])
+    ]
+    return records, list(payload["errors"])
+
+
+def load(key: str) -> Optional[Tuple[List[dict], List[str]]]:
+    """讀取快取；命中時更新 mtime 作為 LRU 使用時間。損毀檔案視同未命中並刪除。"""
+    if not _enabled():
+        return None
+    path = _cache_dir() / f"{key}{_CACHE_SUFFIX}"
+    try:
+        blob = path.read_bytes()
+    except OSError:
+        return None
+    try:
+        result = _decode(blob)
+    except Exception:
+        logger.warning("解析快取檔損毀，已略過：%s", path.name)
+        result = None
+    if result is None:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+        return None
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+    return result
+
+
+def store(key: str, records: List[dict], parse_errors: List[str]) -> None:
+    """寫入快取（暫存檔 + os.replace，避免讀到半寫入檔），再依大小上限淘汰。"""
+    if not _enabled():
+        return
+    cache_dir = _cache_dir()
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    blob = _encode(records, parse_errors)
+    fd, tmp_path = tempfile.mkstemp(dir=str(cache_dir), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(blob)
+        os.replace(tmp_path, cache_dir / f"{key}{_CACHE_SUFFIX}")
+    except OSError:
+        logger.warning("解析快取寫入失敗：%s", key)
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return
+    _evict(cache_dir)
+
+
+def _evict(cache_dir: Path) -> None:
+    max_bytes = settings.parse_cache_max_mb * 1024 * 1024
+    entries = []
+    for p in cache_dir.glob(f"*{_CACHE_SUFFIX}"):
+        try:
+            st = p.stat()
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, p))
+    total = sum(size for _, size, _ in entries)
+    for _, size, p in sorted(entries, key=lambda x: x[0]):
+        if total <= max_bytes:
+            break
+        try:
+            p.unlink()
+            total -= size
+        except OSError:
+            continue
+
+
+def clear() -> int:
+    """清空解析快取，回傳刪除檔數。"""
+    count = 0
+    for p in _cache_dir().glob(f"*{_CACHE_SUFFIX}"):
+        try:
+            p.unlink()
+            count += 1
+        except OSError:
+            continue
+    return count
@@ -0,0 +1,126 @@
+"""
+傻瓜會計 - 時數檔解析行程池。
+上傳解析為純 CPU 工作，改交給有上限的 ProcessPoolExecutor，避免阻塞 event loop：
+xlsx 多 sheet 月曆矩陣型一個 sheet 一個工作、依 sheet 順序合併；其他格式整份檔案一個工作。
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Tuple
+
+from app.config import settings
+from app.accounting import parse_cache
+from app.accounting.security_payroll_service import (
+    finish_calendar_matrix_parse,
+    list_workbook_sheet_names,
+    parse_calendar_matrix_sheet,
+    parse_security_hours_file,
+)
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_parse_pool() -> Optional[ProcessPoolExecutor]:
+    """取得共用解析行程池；parse_pool_max_workers <= 0 時不建立（改用執行緒就地解析）。"""
+    global _executor
+    if settings.parse_pool_max_workers <= 0:
+        return None
+    if _executor is None:
+        # spawn：與 Windows 行為一致，且不繼承 event loop / DB 連線
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.parse_pool_max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+def shutdown_parse_pool() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def _run(func, *args):
+    loop = asyncio.get_running_loop()
+    pool = get_parse_pool()
+    if pool is None:
+        return await asyncio.to_thread(func, *args)
+    try:
+        return await loop.run_in_executor(pool, func, *args)
+    except BrokenProcessPool:
+        logger.warning("解析行程池已損毀，重建後改以執行緒解析本次檔案")
+        shutdown_parse_pool()
+        return await asyncio.to_thread(func, *args)
+
+
+async def _parse_calendar_sheets(path: str, year: int, month: int) -> Tuple[List[dict], List[str]]:
+    try:
+        sheet_names = await asyncio.to_thread(list_workbook_sheet_names, path)
+    except Exception:
+        raise ValueError("檔案沒有任何可解析的 sheet")
+    results = await asyncio.gather(
+        *(_run(parse_calendar_matrix_sheet, path, idx, year, month) for idx in range(len(sheet_names))),
+        return_exceptions=True,
+    )
+    # 與同步解析（iter_calendar_matrix_records）一致：任一 sheet 讀取失敗即視為整份檔案無法解析
+    for name, res in zip(sheet_names, results):
+        if isinstance(res, BaseException):
+            if not isinstance(res, Exception):
+                raise res
+            logger.warning("時數檔 sheet【%s】解析失敗", name, exc_info=res)
+            raise ValueError("檔案沒有任何可解析的 sheet") from res
+    all_records: List[dict] = []
+    parse_errors: List[str] = []
+    for recs, errs in results:
+        parse_errors.extend(errs)
+        all_records.extend(recs)
+    return finish_calendar_matrix_parse(all_records, parse_errors)
+
+
+async def parse_security_hours_file_async(
+    content: bytes,
+    filename: str,
+    year: Optional[int] = None,
+    month: Optional[int] = None,
+) -> Tuple[List[dict], List[str]]:
+    """
+    parse_security_hours_file 的非阻塞版本，回傳值與錯誤（ValueError）相同。
+    同內容/年月/格式已解析過則直接取解析快取；解析失敗（ValueError）不快取。
+    """
+    key = parse_cache.cache_key(content, filename, year, month)
+    cached = await asyncio.to_thread(parse_cache.load, key)
+    if cached is not None:
+        return cached
+    records, parse_errors = await _parse_uncached(content, filename, year, month)
+    await asyncio.to_thread(parse_cache.store, key, records, parse_errors)
+    return records, parse_errors
+
+
+async def _parse_uncached(
+    content: bytes,
+    filename: str,
+    year: Optional[int],
+    month: Optional[int],
+) -> Tuple[List[dict], List[str]]:
+    """xlsx + year/month：先寫入暫存檔，各 sheet 由工作行程自行唯讀開啟，不重複傳送檔案內容。"""
+    ext = (filename or "").lower().split(".")[-1]
+    if ext != "xlsx" or year is None or month is None:
+        return await _run(parse_security_hours_file, content, filename, year, month)
+
+    fd, path = tempfile.mkstemp(suffix=".xlsx", dir=str(settings.upload_dir))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        return await _parse_calendar_sheets(path, year, month)
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,84 @@
+"""
+傻瓜會計 - 薪資計算用員工/案場名錄（單次計算範圍）。
+依上傳檔中出現的姓名/案場名稱，以少量 IN (...) 查詢一次載入候選員工（含 salary_profile）與案場，
+登載身份優先序在記憶體中解析，取代逐列查詢。
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.crud import list_employees_by_names, list_sites_by_names
+from app.models import Employee, Site
+
+
+def _ordered_registration_types(current_type: str, extra_types: Optional[List[str]]) -> List[str]:
+    """與 get_employee_by_name_with_registration_priority 相同：current 先，extra 依傳入順序，去重去空。"""
+    seen: set[str] = set()
+    ordered: List[str] = []
+    for t in [current_type, *(extra_types or [])]:
+        key = (t or "").strip()
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        ordered.append(key)
+    return ordered
+
+
+class PayrollDirectory:
+    """
+    單次薪資計算的員工/案場名錄。以 load() 建立後，lookup 皆為記憶體查詢。
+    同名同身份多筆時取 id 最小者；同名案場多筆時取 id 最小者（與原 .limit(1) 查詢一致）。
+    """
+
+    def __init__(
+        self,
+        employees: Dict[Tuple[str, str], Employee],
+        sites: Dict[str, Site],
+        registration_types: List[str],
+    ):
+        self._employees = employees
+        self._sites = sites
+        self._registration_types = registration_types
+
+    @classmethod
+    async def load(
+        cls,
+        db: AsyncSession,
+        employee_names: Iterable[str],
+        site_names: Iterable[str],
+        current_registration_type: str,
+        extra_registration_types: Optional[List[str]] = None,
+    ) -> "PayrollDirectory":
+        registration_types = _ordered_registration_types(current_registration_type, extra_registration_types)
+        employees: Dict[Tuple[str, str], Employee] = {}
+        if registration_types:
+            rows = await list_employees_by_names(
+                db,
+                list(employee_names),
+                registration_types=registration_types,
+                load_salary_profile=True,
+            )
+            for emp in rows:
+                key = ((emp.name or "").strip(), (emp.registration_type or "").strip())
+                employees.setdefault(key, emp)
+        sites: Dict[str, Site] = {}
+        for site in await list_sites_by_names(db, list(site_names)):
+            sites.setdefault((site.name or "").strip(), site)
+        return cls(employees, sites, registration_types)
+
+    def get_employee(self, name: str) -> Optional[Employee]:
+        """依登載身份優先序取員工；找不到回傳 None。"""
+        target = (name or "").strip()
+        if not target:
+            return None
+        for registration_type in self._registration_types:
+            emp = self._employees.get((target, registration_type))
+            if emp is not None:
+                return emp
+        return None
+
+    def get_site(self, name: str) -> Optional[Site]:
+        target = (name or "").strip()
+        if not target:
+            return None
+        return self._sites.get(target)
@@ -0,0 +1,136 @@
+"""
+傻瓜會計 - 向量化每日金額計算引擎（pandas / NumPy）。
+與 security_payroll_service._aggregate_groups 結果一致：每日金額先算 raw，再四捨五入到整元（與 Python round 同為
+銀行家捨入），只把 rounded 加入加總；按 (site, employee) 依首次出現順序彙總。適用 10 萬列以上的月份資料。
+"""
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def _row_date(value) -> Optional[date]:
+    d = value.date() if isinstance(value, datetime) else value
+    return d if isinstance(d, date) else None
+
+
+def _build_pay_frame(valid_rows: List[dict], payroll_type: str) -> Tuple[pd.DataFrame, Dict[str, dict]]:
+    """每位員工一列：pay_type 旗標、日薪/時薪、是否物業特殊模式。"""
+    from app.accounting.security_payroll_service import PROPERTY_PAY_MODES
+
+    per_employee: Dict[str, dict] = {}
+    for r in valid_rows:
+        per_employee[r["employee"]] = r
+    names = list(per_employee.keys())
+    pay_infos = [per_employee[n]["_pay_info"] for n in names]
+    frame = pd.DataFrame(
+        {
+            "uses_daily_rate": np.array(
+                [p["pay_type"] in ("monthly", "daily") for p in pay_infos], dtype=bool
+            ),
+            "daily_rate": np.array([p.get("daily_wage") or 0 for p in pay_infos], dtype=np.int64),
+            "hourly_rate": np.array([p.get("hourly_wage") or 0 for p in pay_infos], dtype=np.int64),
+            "special": np.array(
+                [
+                    payroll_type == "property"
+                    and (p.get("property_pay_mode") or "").strip().upper() in PROPERTY_PAY_MODES
+                    for p in pay_infos
+                ],
+                dtype=bool,
+            ),
+        },
+        index=pd.Index(names, name="employee", dtype=object),
+    )
+    return frame, per_employee
+
+
+def _debug_entries(rows: List[dict], special: bool) -> Tuple[List[dict], List[float]]:
+    """除錯員工逐日明細（最多 5 筆）與 raw 清單，格式與逐列引擎相同。"""
+    debug_days: List[dict] = []
+    daily_raw: List[float] = []
+    day_idx = 0
+    for r in rows:
+        pay_info = r["_pay_info"]
+        h = r["hours"]
+        if special:
+            raw, rounded = 0.0, 0
+        else:
+            if pay_info["pay_type"] in ("monthly", "daily") and h >= 12:
+                raw = pay_info.get("daily_wage") or 0
+            else:
+                raw = (pay_info.get("hourly_wage") or 0) * h
+            rounded = int(round(raw, 0))
+            day_idx += 1
+        daily_raw.append(raw)
+        if len(debug_days) < 5:
+            debug_days.append(
+                {"day": day_idx, "hours": h, "daily_amount_raw": raw, "daily_amount_rounded": rounded}
+            )
+    return debug_days, daily_raw
+
+
+def aggregate_groups_vectorized(
+    valid_rows: List[dict],
+    payroll_type: str,
+    debug_employee: Optional[str] = None,
+) -> Dict[Tuple[str, str], dict]:
+    """
+    向量化版 _aggregate_groups。valid_rows 為已通過驗證、帶 _pay_info/_enroll_date 的列。
+    回傳 {(site, employee): {total_hours, daily_gross, pay_info, enroll_date, daily_hours_by_date, ...}}。
+    """
+    if not valid_rows:
+        return {}
+    pay_frame, per_employee = _build_pay_frame(valid_rows, payroll_type)
+
+    df = pd.DataFrame(
+        {
+            "site": pd.Series([r["site"] for r in valid_rows], dtype=object),
+            "employee": pd.Series([r["employee"] for r in valid_rows], dtype=object),
+            "date": pd.Series([_row_date(r["date"]) for r in valid_rows], dtype=object),
+            "hours": np.array([r["hours"] for r in valid_rows], dtype=np.float64),
+        }
+    )
+    df = df.join(pay_frame, on="employee")
+
+    hours = df["hours"].to_numpy()
+    raw = np.where(
+        df["uses_daily_rate"].to_numpy() & (hours >= 12),
+        df["daily_rate"].to_numpy().astype(np.float64),
+        df["hourly_rate"].to_numpy() * hours,
+    )
+    df["daily_rounded"] = np.where(df["special"].to_numpy(), 0.0, np.round(raw, 0))
+
+    totals = df.groupby(["site", "employee"], sort=False).agg(
+        total_hours=("hours", "sum"),
+        daily_gross=("daily_rounded", "sum"),
+    )
+
+    groups: Dict[Tuple[str, str], dict] = {}
+    for (site_name, employee_name), total_hours, daily_gross in zip(
+        totals.index, totals["total_hours"].to_numpy(), totals["daily_gross"].to_numpy()
+    ):
+        src = per_employee[employee_name]
+        groups[(site_name, employee_name)] = {
+            "pay_info": src["_pay_info"],
+            "enroll_date": src["_enroll_date"],
+            "employee_registration_type": src.get("_employee_registration_type") or "",
+            "daily_hours_by_date": defaultdict(float),
+            "total_hours": float(total_hours),
+            "daily_gross": int(daily_gross),
+        }
+
+    by_day = df.groupby(["site", "employee", "date"], sort=False)["hours"].sum()
+    for (site_name, employee_name, d), day_hours in by_day.items():
+        groups[(site_name, employee_name)]["daily_hours_by_date"][d] = float(day_hours)
+
+    if debug_employee and debug_employee in per_employee:
+        special = bool(pay_frame.at[debug_employee, "special"])
+        debug_rows: Dict[Tuple[str, str], List[dict]] = defaultdict(list)
+        for r in valid_rows:
+            if r["employee"] == debug_employee:
+                debug_rows[(r["site"], r["employee"])].append(r)
+        for key, rows in debug_rows.items():
+            groups[key]["_debug_days"], groups[key]["_daily_raw"] = _debug_entries(rows, special)
+    return groups
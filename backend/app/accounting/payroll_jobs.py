@@ -0,0 +1,252 @@
+"""
+傻瓜會計 - 背景工作佇列。
+上傳計算（解析 → 計算 → 刪除舊資料 → 寫入）移出 HTTP 請求：上傳端點建立一筆 accounting_jobs 後立即回傳 job id，
+由行程內 asyncio worker 執行；CPU 密集的解析仍交給解析行程池（parse_pool）。
+各階段結束即 commit 進度（phase 與計數），供 GET /api/accounting/jobs/{id} 輪詢；
+刪除舊資料、寫入結果與工作完成狀態在同一 transaction，失敗時整批 rollback 後標記 failed。
+每筆工作記錄持有行程（WORKER_ID）並由該行程定期更新心跳；只有心跳逾時（持有行程已結束）的未完成工作
+才會被標記為中斷，新舊行程並存（重啟、滾動部署）時不影響仍存活行程的工作。
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud
+from app.config import settings
+from app.models import AccountingJob
+from app.accounting.parse_pool import parse_security_hours_file_async
+from app.accounting.security_payroll_service import SecurityPayrollCalculator
+
+logger = logging.getLogger(__name__)
+
+SECURITY_PAYROLL_UPLOAD = "security_payroll_upload"
+# 本行程識別：工作的佇列項目與上傳內容只存在此行程記憶體
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+INTERRUPTED_REASON = "服務重新啟動，工作已中斷，請重新上傳"
+
+JobHandler = Callable[[AsyncSession, AccountingJob, Any], Awaitable[Dict[str, Any]]]
+
+
+class JobError(Exception):
+    """工作可預期的失敗（訊息直接顯示給使用者）。"""
+
+
+async def _set_phase(db: AsyncSession, job: AccountingJob, phase: str, **counters: int) -> None:
+    job.phase = phase
+    for key, value in counters.items():
+        setattr(job, key, value)
+    await db.commit()
+
+
+async def run_security_payroll_upload(db: AsyncSession, job: AccountingJob, content: bytes) -> Dict[str, Any]:
+    """保全/物業等薪資上傳計算；回傳內容與原同步上傳端點相同。"""
+    params = job.params or {}
+    y, m = int(params["year"]), int(params["month"])
+    payroll_type = params["payroll_type"]
+
+    await _set_phase(db, job, "parsing")
+    try:
+        rows, parse_errors = await parse_security_hours_file_async(content, params.get("filename") or "", year=y, month=m)
+    except ValueError as e:
+        raise JobError(str(e))
+
+    await _set_phase(db, job, "calculating", rows_parsed=len(rows))
+    calculator = SecurityPayrollCalculator(db)
+    results, calc_errors, debug = await calculator.validate_and_calculate(
+        rows,
+        year=y,
+        month=m,
+        payroll_type=payroll_type,
+        extra_payroll_types=list(params.get("extra_payroll_types") or []),
+    )
+    errors = [{"type": "parse_error", "message": msg} for msg in parse_errors] + calc_errors
+
+    await _set_phase(
+        db, job, "writing",
+        employees_resolved=len({r.get("employee") for r in results}),
+    )
+    # 同年月同類型：先刪除舊資料再插入（覆蓋，不累積）；與工作完成狀態同一 transaction
+    # 每日時數明細一併保存，供之後單一員工/案場重算（POST /security-payroll/recalculate）
+    await crud.replace_payroll_hours(db, y, m, payroll_type, rows)
+    deleted_before_insert = await crud.delete_payroll_results_for_period(db, y, m, payroll_type)
+    if results:
+        await crud.save_payroll_results(db, y, m, payroll_type, results)
+    job.rows_written = len(results)
+
+    out = {
+        "results": results,
+        "errors": errors,
+        "deleted_before_insert": deleted_before_insert,
+        "inserted": len(results),
+    }
+    if debug is not None:
+        out["debug"] = debug
+    return out
+
+
+JOB_HANDLERS: Dict[str, JobHandler] = {
+    SECURITY_PAYROLL_UPLOAD: run_security_payroll_upload,
+}
+
+
+def register_job_handler(kind: str, handler: JobHandler) -> None:
+    JOB_HANDLERS[kind] = handler
+
+
+async def run_job(session_factory, job_id: int, payload: Any = None) -> None:
+    """執行單一工作（佇列 worker 呼叫）；僅處理 queued 狀態者。"""
+    async with session_factory() as db:
+        job = await crud.get_accounting_job(db, job_id)
+        if job is None or job.status != "queued":
+            return
+        handler = JOB_HANDLERS.get(job.kind)
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        await db.commit()
+        try:
+            if handler is None:
+                raise JobError(f"未知的工作種類：{job.kind}")
+            result = await handler(db, job, payload)
+            job.result = jsonable_encoder(result)
+            job.status = "succeeded"
+            job.phase = "done"
+            job.finished_at = datetime.utcnow()
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            if not isinstance(e, JobError):
+                logger.exception("會計背景工作 %s 執行失敗", job_id)
+            job = await crud.get_accounting_job(db, job_id)
+            if job is None:
+                return
+            job.status = "failed"
+            job.error = str(e) if isinstance(e, JobError) else f"工作執行失敗：{e}"
+            job.finished_at = datetime.utcnow()
+            await db.commit()
+
+
+class JobQueue:
+    """行程內工作佇列：worker 數由 job_worker_concurrency 決定，第一次 submit 時啟動。"""
+
+    def __init__(self, session_factory=None):
+        self.session_factory = session_factory
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    def _session_factory(self):
+        if self.session_factory is not None:
+            return self.session_factory
+        from app.database import AsyncSessionLocal
+        return AsyncSessionLocal
+
+    def submit(self, job_id: int, payload: Any = None) -> None:
+        """排入工作；payload（如上傳檔內容）僅存於記憶體，不落表。"""
+        self._ensure_workers()
+        self._queue.put_nowait((job_id, payload))
+
+    def _ensure_workers(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._workers = [t for t in self._workers if not t.done()]
+        while len(self._workers) < max(1, settings.job_worker_concurrency):
+            self._workers.append(asyncio.create_task(self._worker()))
+        self.start_heartbeat()
+
+    def start_heartbeat(self) -> None:
+        """啟動心跳：定期更新本行程工作的 heartbeat_at，並清除其他已結束行程遺留的逾時工作。"""
+        if self._heartbeat is None or self._heartbeat.done():
+            self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            await asyncio.sleep(max(1, settings.job_heartbeat_seconds))
+            try:
+                async with self._session_factory()() as db:
+                    await crud.touch_accounting_jobs(db, WORKER_ID)
+                    count = await crud.fail_unfinished_accounting_jobs(
+                        db, INTERRUPTED_REASON, _stale_before(), exclude_worker_id=WORKER_ID
+                    )
+                    await db.commit()
+                if count:
+                    logger.warning("已將 %s 筆心跳逾時的會計背景工作標記為失敗", count)
+            except Exception:
+                logger.warning("會計背景工作心跳更新失敗", exc_info=True)
+
+    async def _worker(self) -> None:
+        while True:
+            job_id, payload = await self._queue.get()
+            try:
+                await run_job(self._session_factory(), job_id, payload)
+            except Exception:
+                logger.exception("會計背景工作 %s 無法更新狀態", job_id)
+            finally:
+                self._queue.task_done()
+
+    async def join(self) -> None:
+        """等待目前已排入的工作全部完成。"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def shutdown(self) -> None:
+        tasks = self._workers + ([self._heartbeat] if self._heartbeat is not None else [])
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._heartbeat = None
+        self._queue = None
+
+
+job_queue = JobQueue()
+
+
+def _stale_before() -> datetime:
+    return datetime.utcnow() - timedelta(seconds=max(settings.job_stale_seconds, 2 * settings.job_heartbeat_seconds))
+
+
+async def fail_interrupted_jobs() -> None:
+    """
+    啟動時呼叫：心跳已逾時的未完成工作（持有行程已結束，佇列與上傳內容已遺失）標記為失敗。
+    其他行程仍在執行的工作不動；剛結束的行程遺留之工作由之後的心跳清除。
+    """
+    from app.database import AsyncSessionLocal
+
+    try:
+        async with AsyncSessionLocal() as db:
+            count = await crud.fail_unfinished_accounting_jobs(db, INTERRUPTED_REASON, _stale_before())
+            await db.commit()
+        if count:
+            logger.warning("已將 %s 筆中斷的會計背景工作標記為失敗", count)
+    except Exception:
+        logger.warning("無法檢查中斷的會計背景工作（accounting_jobs 可能尚未建立）", exc_info=True)
+    job_queue.start_heartbeat()
+
+
+def job_to_dict(job: AccountingJob, include_result: bool = True) -> Dict[str, Any]:
+    out = {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "phase": job.phase,
+        "params": job.params or {},
+        "progress": {
+            "rows_parsed": job.rows_parsed or 0,
+            "employees_resolved": job.employees_resolved or 0,
+            "rows_written": job.rows_written or 0,
+        },
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+    if include_result:
+        out["result"] = job.result
+    return out
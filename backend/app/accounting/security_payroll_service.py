@@ -7,7 +7,7 @@ import calendar
 import logging
 import re
 from datetime import date, datetime, timedelta
-from typing import List, Tuple, Optional, Any, Dict
+from typing import List, Tuple, Optional, Any, Dict, Iterator
 from collections import defaultdict
 import io
 
@@ -16,17 +16,20 @@ logger = logging.getLogger(__name__)
 PROPERTY_PAY_MODES = {"WEEKLY_2H", "MONTHLY_8H_HOLIDAY"}
 EMPLOYEE_REGISTRATION_TYPES = {"security", "property", "smith", "lixiang", "cleaning"}
 COMPANY_PAY_MODES = {"monthly", "daily", "hourly"}
+PAYROLL_ENGINES = {"python", "vectorized"}
+# debug 輸出僅針對此員工（每日 raw/rounded 與加總）
+DEBUG_EMPLOYEE = "游念棠"
+# 時數檔解析邏輯版本：修改 parse_security_hours_file / 月曆矩陣解析結果時遞增，使解析快取（parse_cache）失效
+HOURS_PARSER_VERSION = 1
 
 import pandas as pd
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.crud import (
-    get_employee_by_name_with_registration_priority,
-    get_site_by_name,
-    get_latest_bracket_import,
-    get_bracket_by_level,
-)
-from app.accounting.holiday_calendar import get_holiday_dates
+from app.accounting.holiday_calendar import get_month_calendar
+from app.accounting.payroll_directory import PayrollDirectory
+from app.accounting.payroll_engine_vectorized import aggregate_groups_vectorized
+from app.config import settings
+from app.services.bracket_cache import get_bracket_index
 
 
 # 一列一筆格式：必要欄位與可接受之表頭別名（小寫比對）
@@ -227,6 +230,167 @@ def _parse_calendar_matrix_one_sheet(
     return out, []
 
 
+def _openpyxl_cell(val: Any) -> Any:
+    """與 pandas openpyxl 讀取一致：整數值的 float 轉 int。"""
+    if isinstance(val, float) and val.is_integer():
+        return int(val)
+    return val
+
+
+def _row_cell(row: tuple, j: int) -> Any:
+    return _openpyxl_cell(row[j]) if j < len(row) else None
+
+
+def _parse_calendar_matrix_rows(
+    rows: Iterator[tuple],
+    year: int,
+    month: int,
+    sheet_name: Optional[str] = None,
+    site_override: Optional[str] = None,
+) -> Tuple[List[dict], List[str]]:
+    """
+    串流版 _parse_calendar_matrix_one_sheet：逐列讀 values_only tuple，不建 DataFrame。
+    只保留每位員工每日工時累計（員工數 × 31），回傳 (records, sheet_errors)，結果與 DataFrame 版相同。
+    """
+    err_prefix = f"sheet【{sheet_name}】" if sheet_name else ""
+    header_row_idx: Optional[int] = None
+    day_columns: dict[int, int] = {}
+    site_name: Optional[str] = site_override
+    last_nonempty_idx = -1
+    last_name: Any = None
+    has_data_rows = False
+    _, last_day = calendar.monthrange(year, month)
+    employee_hours: dict[str, List[float]] = {}
+
+    for i, row in enumerate(rows):
+        if any(v is not None for v in row):
+            last_nonempty_idx = i
+        if header_row_idx is None:
+            c0, c1, c2 = (_cell_str(_row_cell(row, j)) for j in range(3))
+            if c0 == "類別" and c1 == "姓名" and c2 == "日期":
+                for j in range(3, min(len(row), 3 + 35)):
+                    try:
+                        v = _row_cell(row, j)
+                        if pd.isna(v):
+                            continue
+                        d = int(float(v)) if isinstance(v, (int, float)) else int(str(v).strip())
+                        if 1 <= d <= 31:
+                            day_columns[d] = j
+                    except (ValueError, TypeError):
+                        continue
+                if len(day_columns) < 1:
+                    return [], [f"{err_prefix}找不到日期欄位（1~31）"]
+                header_row_idx = i
+            elif not site_override and _is_twodigit_label(_row_cell(row, 0)) and _cell_str(_row_cell(row, 1)):
+                # 案場名稱：表頭之前最接近表頭的「兩位數標籤 + 名稱」列
+                site_name = _cell_str(_row_cell(row, 1))
+            continue
+        if i < header_row_idx + 2:
+            continue
+        name_val = _row_cell(row, 1)
+        if pd.isna(name_val):
+            name_val = last_name
+        else:
+            last_name = name_val
+        if str(_row_cell(row, 2)).strip() not in ("日", "夜"):
+            continue
+        has_data_rows = True
+        name = _cell_str(name_val)
+        if not name:
+            continue
+        day_hours = employee_hours.get(name)
+        if day_hours is None:
+            day_hours = employee_hours[name] = [0.0] * (last_day + 1)
+        for day in range(1, last_day + 1):
+            col_idx = day_columns.get(day)
+            if col_idx is None:
+                continue
+            day_hours[day] += _cell_float(_row_cell(row, col_idx))
+
+    if last_nonempty_idx < 0:
+        # 空白 sheet：與 DataFrame 版一致，略過不報錯
+        return [], []
+    if last_nonempty_idx < 2 or header_row_idx is None:
+        return [], [f"{err_prefix}找不到表頭：類別/姓名/日期/1..31"]
+    if not has_data_rows:
+        return [], [f"{err_prefix}找不到任何員工（日/夜）資料列"]
+
+    site_name = site_name or "未填案場"
+    out: List[dict] = []
+    for employee, day_hours in employee_hours.items():
+        for day in range(1, last_day + 1):
+            if day not in day_columns:
+                continue
+            out.append({"site": site_name, "employee": employee, "date": datetime(year, month, day), "hours": day_hours[day]})
+    return out, []
+
+
+def _open_workbook_read_only(source: Any):
+    """source 可為 bytes 或檔案路徑；以 pandas 相同參數唯讀開啟。"""
+    from openpyxl import load_workbook
+
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    return load_workbook(source, read_only=True, data_only=True, keep_links=False)
+
+
+def list_workbook_sheet_names(source: Any) -> List[str]:
+    """列出 xlsx 的 sheet 名稱（依活頁簿順序），不讀取儲存格。"""
+    wb = _open_workbook_read_only(source)
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+
+
+def parse_calendar_matrix_sheet(source: Any, sheet_index: int, year: int, month: int) -> Tuple[List[dict], List[str]]:
+    """
+    解析 xlsx 中第 sheet_index 個 sheet（月曆矩陣型），回傳 (records, sheet_errors)。
+    為頂層函式，可直接交給 ProcessPoolExecutor 執行（source 建議傳暫存檔路徑以免重複傳送檔案內容）。
+    """
+    wb = _open_workbook_read_only(source)
+    try:
+        ws = wb.worksheets[sheet_index]
+        return _parse_calendar_matrix_rows(
+            ws.iter_rows(values_only=True), year, month, sheet_name=ws.title, site_override=_site_from_sheet_name(ws.title)
+        )
+    finally:
+        wb.close()
+
+
+def iter_calendar_matrix_records(
+    content: bytes,
+    year: int,
+    month: int,
+    parse_errors: Optional[List[str]] = None,
+) -> Iterator[dict]:
+    """
+    串流解析 xlsx 多 sheet 月曆矩陣型：openpyxl read_only + iter_rows(values_only=True)，逐 sheet 產出
+    {"site", "employee", "date", "hours"}，不一次載入所有 sheet。各 sheet 錯誤（帶 sheet【名稱】前綴）附加到 parse_errors。
+    """
+    wb = _open_workbook_read_only(content)
+    try:
+        for ws in wb.worksheets:
+            site_from_sheet = _site_from_sheet_name(ws.title)
+            recs, errs = _parse_calendar_matrix_rows(
+                ws.iter_rows(values_only=True), year, month, sheet_name=ws.title, site_override=site_from_sheet
+            )
+            if parse_errors is not None:
+                parse_errors.extend(errs)
+            yield from recs
+    finally:
+        wb.close()
+
+
+def finish_calendar_matrix_parse(all_records: List[dict], parse_errors: List[str]) -> Tuple[List[dict], List[str]]:
+    """多 sheet 月曆矩陣型解析結果收尾：有資料即回傳，否則依是否有 sheet 錯誤拋出 ValueError。"""
+    if all_records:
+        return (all_records, parse_errors)
+    if parse_errors:
+        raise ValueError("檔案格式不支援：找不到表頭（類別/姓名/日期）或日期欄位（1~31）")
+    raise ValueError("檔案沒有任何可解析的 sheet")
+
+
 def parse_security_hours_file(
     content: bytes,
     filename: str,
@@ -245,12 +409,16 @@ def parse_security_hours_file(
 
     # 多 sheet 月曆矩陣型（xlsx / ods；xls 多 sheet 依引擎而定）
     if year is not None and month is not None and ext in ("xlsx", "ods"):
+        if ext == "xlsx":
+            # xlsx：串流逐 sheet 解析，記憶體只與單一 sheet 的員工數相關
+            try:
+                all_records = list(iter_calendar_matrix_records(content, year, month, parse_errors))
+            except Exception:
+                raise ValueError("檔案沒有任何可解析的 sheet")
+            return finish_calendar_matrix_parse(all_records, parse_errors)
         buf = io.BytesIO(content)
         try:
-            if ext == "ods":
-                all_sheets = pd.read_excel(buf, engine="odf", sheet_name=None, header=None)
-            else:
-                all_sheets = pd.read_excel(buf, engine="openpyxl", sheet_name=None, header=None)
+            all_sheets = pd.read_excel(buf, engine="odf", sheet_name=None, header=None)
         except Exception:
             all_sheets = {}
         if isinstance(all_sheets, dict) and all_sheets:
@@ -264,11 +432,7 @@ def parse_security_hours_file(
                 )
                 parse_errors.extend(errs)
                 all_records.extend(recs)
-            if all_records:
-                return (all_records, parse_errors)
-            if parse_errors:
-                raise ValueError("檔案格式不支援：找不到表頭（類別/姓名/日期）或日期欄位（1~31）")
-            raise ValueError("檔案沒有任何可解析的 sheet")
+            return finish_calendar_matrix_parse(all_records, parse_errors)
         elif isinstance(all_sheets, dict) and not all_sheets:
             raise ValueError("檔案沒有任何可解析的 sheet")
 
@@ -423,7 +587,7 @@ def _calc_group_insurance(
 
 def get_holiday_count(year: int, month: int) -> int:
     """計算指定月份假日天數（週六週日 + 國定假日）。"""
-    return len(get_holiday_dates(year, month))
+    return get_month_calendar(year, month).holiday_count
 
 
 def _registration_type_label(registration_type: Optional[str]) -> str:
@@ -542,30 +706,100 @@ def _get_property_pay_info(employee: Any) -> Optional[dict]:
     }
 
 
+def _aggregate_groups(valid_rows: List[dict], payroll_type: str) -> Dict[Tuple[str, str], dict]:
+    """
+    逐列計算每日金額並按 (site, employee) 彙總（依首次出現順序）。
+    每組含 total_hours、daily_gross（每日先四捨五入再加總）、daily_hours_by_date 與 pay_info 等。
+    """
+    groups: dict[Tuple[str, str], dict] = defaultdict(
+        lambda: {
+            "hours_list": [],
+            "daily_salaries": [],
+            "pay_info": None,
+            "enroll_date": None,
+            "daily_hours_by_date": defaultdict(float),
+            "employee_registration_type": "",
+        }
+    )
+    for r in valid_rows:
+        key = (r["site"], r["employee"])
+        employee_name = r["employee"]
+        groups[key]["pay_info"] = r["_pay_info"]
+        groups[key]["enroll_date"] = r["_enroll_date"]
+        groups[key]["employee_registration_type"] = r.get("_employee_registration_type") or ""
+        groups[key]["hours_list"].append(r["hours"])
+        row_date = r["date"].date() if isinstance(r["date"], datetime) else r["date"]
+        if isinstance(row_date, date):
+            groups[key]["daily_hours_by_date"][row_date] += r["hours"]
+        pt = r["_pay_info"]["pay_type"]
+        daily_rate = r["_pay_info"].get("daily_wage") or 0
+        hourly_rate = r["_pay_info"].get("hourly_wage") or 0
+        monthly_sal = r["_pay_info"].get("monthly_salary") or 0
+        h = r["hours"]
+        # 規則：每日金額先算 raw，再四捨五入到整元，只把 rounded 加入加總（可驗證）
+        special_property_mode = (
+            payroll_type == "property"
+            and ((r["_pay_info"].get("property_pay_mode") or "").strip().upper() in PROPERTY_PAY_MODES)
+        )
+        if special_property_mode:
+            daily_amount_raw = 0.0
+            daily_amount_rounded = 0
+        else:
+            if pt == "monthly":
+                if h >= 12:
+                    daily_amount_raw = daily_rate
+                else:
+                    daily_amount_raw = hourly_rate * h
+            elif pt == "daily":
+                if h >= 12:
+                    daily_amount_raw = daily_rate
+                else:
+                    daily_amount_raw = hourly_rate * h
+            else:
+                daily_amount_raw = hourly_rate * h
+            daily_amount_rounded = int(round(daily_amount_raw, 0))
+            groups[key]["daily_salaries"].append(daily_amount_rounded)
+        if employee_name == DEBUG_EMPLOYEE:
+            if "_debug_days" not in groups[key]:
+                groups[key]["_debug_days"] = []
+                groups[key]["_daily_raw"] = []
+            day_idx = len(groups[key]["daily_salaries"])
+            groups[key]["_daily_raw"].append(daily_amount_raw)
+            if len(groups[key]["_debug_days"]) < 5:
+                groups[key]["_debug_days"].append({
+                    "day": day_idx,
+                    "hours": h,
+                    "daily_amount_raw": daily_amount_raw,
+                    "daily_amount_rounded": daily_amount_rounded,
+                })
+    for data in groups.values():
+        data["total_hours"] = sum(data["hours_list"])
+        data["daily_gross"] = sum(data["daily_salaries"])
+    return groups
+
+
 class SecurityPayrollCalculator:
     """
     保全薪資計算（升級版）：月/日/時薪制、勞健保/團保/自提6% 扣款。
     案場未建檔仍計算並標示 status=案場未建檔。
+    engine：每日金額計算引擎，python=逐列（預設）、vectorized=pandas/NumPy 向量化；未指定時依設定 payroll_engine。
     """
 
-    def __init__(self, db: AsyncSession):
+    def __init__(self, db: AsyncSession, engine: Optional[str] = None):
         self.db = db
+        engine_key = (engine or settings.payroll_engine or "python").strip().lower()
+        self.engine = engine_key if engine_key in PAYROLL_ENGINES else "python"
 
     def _property_weekly_required_weeks(self, year: int, month: int) -> int:
-        _, last_day = calendar.monthrange(year, month)
-        all_weeks = {
-            (date(year, month, day).isocalendar().year, date(year, month, day).isocalendar().week)
-            for day in range(1, last_day + 1)
-        }
-        return len(all_weeks)
+        return len(get_month_calendar(year, month).iso_weeks)
 
     def _property_weekly_completed_weeks(self, daily_hours_by_date: Dict[date, float], year: int, month: int) -> int:
+        month_calendar = get_month_calendar(year, month)
         weekly_totals: Dict[Tuple[int, int], float] = defaultdict(float)
         for d, hours in daily_hours_by_date.items():
             if d.year != year or d.month != month:
                 continue
-            week_key = (d.isocalendar().year, d.isocalendar().week)
-            weekly_totals[week_key] += float(hours or 0)
+            weekly_totals[month_calendar.iso_week(d)] += float(hours or 0)
         return sum(1 for total in weekly_totals.values() if total >= 2)
 
     def _build_property_weekly_result(
@@ -633,6 +867,7 @@ class SecurityPayrollCalculator:
         weekly_amount_int = int(round(float(weekly_amount), 0))
         property_salary_int = int(round(float(property_salary), 0))
 
+        month_calendar = get_month_calendar(year, month)
         weekly_totals: Dict[Tuple[int, int], float] = defaultdict(float)
         appeared_sites: set[str] = set()
         for site_name, day_map in (site_daily_hours or {}).items():
@@ -640,8 +875,7 @@ class SecurityPayrollCalculator:
                 if d.year != year or d.month != month:
                     continue
                 appeared_sites.add(site_name)
-                week_key = (d.isocalendar().year, d.isocalendar().week)
-                weekly_totals[week_key] += float(hours or 0)
+                weekly_totals[month_calendar.iso_week(d)] += float(hours or 0)
 
         completed_weeks = sum(1 for weekly_hours in weekly_totals.values() if weekly_hours >= 2)
         gross_total = min(property_salary_int, weekly_amount_int * completed_weeks)
@@ -677,9 +911,7 @@ class SecurityPayrollCalculator:
             )
             return 0, "未設定物業薪資"
 
-        _, last_day = calendar.monthrange(year, month)
-        holiday_dates = get_holiday_dates(year, month)
-        required_work_days = max(last_day - len(holiday_dates), 0)
+        required_work_days = get_month_calendar(year, month).required_workdays
         if required_work_days <= 0:
             return 0, "出勤 0/0（按比例）"
 
@@ -750,6 +982,15 @@ class SecurityPayrollCalculator:
             seen_extra_types.add(key)
             dedup_extra_types.append(key)
 
+        # 一次載入本次上傳所有候選員工/案場，之後逐列查詢皆走記憶體
+        directory = await PayrollDirectory.load(
+            self.db,
+            employee_names={(r.get("employee") or "").strip() for r in rows},
+            site_names={(r.get("site") or "").strip() for r in rows},
+            current_registration_type=current_type,
+            extra_registration_types=dedup_extra_types,
+        )
+
         for r in rows:
             site_name = (r.get("site") or "").strip()
             employee_name = (r.get("employee") or "").strip()
@@ -778,13 +1019,7 @@ class SecurityPayrollCalculator:
                     )
                 continue
 
-            employee = await get_employee_by_name_with_registration_priority(
-                self.db,
-                employee_name,
-                current_registration_type=current_type,
-                extra_registration_types=dedup_extra_types,
-                load_salary_profile=True,
-            )
+            employee = directory.get_employee(employee_name)
             if not employee:
                 if employee_name not in seen_employee_err:
                     seen_employee_err.add(employee_name)
@@ -845,7 +1080,7 @@ class SecurityPayrollCalculator:
                     )
                 continue
 
-            site = await get_site_by_name(self.db, site_name)
+            site = directory.get_site(site_name)
             if not site and site_name not in seen_site_err:
                 seen_site_err.add(site_name)
                 errors.append(
@@ -867,81 +1102,23 @@ class SecurityPayrollCalculator:
                 "_employee_registration_type": (getattr(employee, "registration_type", None) or "").strip().lower(),
             })
 
-        groups: dict[Tuple[str, str], dict] = defaultdict(
-            lambda: {
-                "hours_list": [],
-                "daily_salaries": [],
-                "pay_info": None,
-                "enroll_date": None,
-                "daily_hours_by_date": defaultdict(float),
-                "employee_registration_type": "",
-            }
-        )
-        DEBUG_EMPLOYEE = "游念棠"
-        for r in valid_rows:
-            key = (r["site"], r["employee"])
-            employee_name = r["employee"]
-            groups[key]["pay_info"] = r["_pay_info"]
-            groups[key]["enroll_date"] = r["_enroll_date"]
-            groups[key]["employee_registration_type"] = r.get("_employee_registration_type") or ""
-            groups[key]["hours_list"].append(r["hours"])
-            row_date = r["date"].date() if isinstance(r["date"], datetime) else r["date"]
-            if isinstance(row_date, date):
-                groups[key]["daily_hours_by_date"][row_date] += r["hours"]
-            pt = r["_pay_info"]["pay_type"]
-            daily_rate = r["_pay_info"].get("daily_wage") or 0
-            hourly_rate = r["_pay_info"].get("hourly_wage") or 0
-            monthly_sal = r["_pay_info"].get("monthly_salary") or 0
-            h = r["hours"]
-            # 規則：每日金額先算 raw，再四捨五入到整元，只把 rounded 加入加總（可驗證）
-            special_property_mode = (
-                payroll_type == "property"
-                and ((r["_pay_info"].get("property_pay_mode") or "").strip().upper() in PROPERTY_PAY_MODES)
-            )
-            if special_property_mode:
-                daily_amount_raw = 0.0
-                daily_amount_rounded = 0
-            else:
-                if pt == "monthly":
-                    if h >= 12:
-                        daily_amount_raw = daily_rate
-                    else:
-                        daily_amount_raw = hourly_rate * h
-                elif pt == "daily":
-                    if h >= 12:
-                        daily_amount_raw = daily_rate
-                    else:
-                        daily_amount_raw = hourly_rate * h
-                else:
-                    daily_amount_raw = hourly_rate * h
-                daily_amount_rounded = int(round(daily_amount_raw, 0))
-                groups[key]["daily_salaries"].append(daily_amount_rounded)
-            if employee_name == DEBUG_EMPLOYEE:
-                if "_debug_days" not in groups[key]:
-                    groups[key]["_debug_days"] = []
-                    groups[key]["_daily_raw"] = []
-                day_idx = len(groups[key]["daily_salaries"])
-                groups[key]["_daily_raw"].append(daily_amount_raw)
-                if len(groups[key]["_debug_days"]) < 5:
-                    groups[key]["_debug_days"].append({
-                        "day": day_idx,
-                        "hours": h,
-                        "daily_amount_raw": daily_amount_raw,
-                        "daily_amount_rounded": daily_amount_rounded,
-                    })
+        if self.engine == "vectorized":
+            groups = aggregate_groups_vectorized(valid_rows, payroll_type, debug_employee=DEBUG_EMPLOYEE)
+        else:
+            groups = _aggregate_groups(valid_rows, payroll_type)
 
         # 步驟1：產出各 (案場, 員工) 的工時與應發，不在此處算保險
         site_rows: List[dict] = []
         for (site_name, employee_name), data in groups.items():
             pay_info = data["pay_info"]
-            total_hours = sum(data["hours_list"])
+            total_hours = data["total_hours"]
             pt = pay_info["pay_type"]
             special_property_mode = (
                 payroll_type == "property"
                 and ((pay_info.get("property_pay_mode") or "").strip().upper() in PROPERTY_PAY_MODES)
             )
             if not special_property_mode:
-                gross = int(round(sum(data["daily_salaries"]), 0))
+                gross = int(round(data["daily_gross"], 0))
                 monthly_sal = pay_info.get("monthly_salary") or 0
                 if pt == "monthly" and total_hours >= 288:
                     gross = int(round(monthly_sal, 0))
@@ -955,7 +1132,7 @@ class SecurityPayrollCalculator:
             else:
                 gross = 0
                 status = "未設定物業模式"
-            site = await get_site_by_name(self.db, site_name)
+            site = directory.get_site(site_name)
             if not site:
                 status = "案場未建檔"
             site_rows.append({
@@ -976,7 +1153,7 @@ class SecurityPayrollCalculator:
             by_employee[row["employee"]].append(row)
 
         # 步驟3：對每個員工只計算一次保險，並將扣款放在「該員工第一筆案場」
-        bracket_import = await get_latest_bracket_import(self.db)
+        bracket_index = await get_bracket_index(self.db)
         results = []
         for employee_name, rows in by_employee.items():
             rows_sorted = sorted(rows, key=lambda r: (r["site"], r["employee"]))
@@ -1035,7 +1212,7 @@ class SecurityPayrollCalculator:
                         }
                     )
             else:
-                if not bracket_import:
+                if not bracket_index:
                     if (insured_level,) not in seen_bracket_err:
                         seen_bracket_err.add((insured_level,))
                         errors.append(
@@ -1046,7 +1223,7 @@ class SecurityPayrollCalculator:
                             }
                         )
                 else:
-                    bracket = await get_bracket_by_level(self.db, bracket_import.id, int(insured_level))
+                    bracket = bracket_index.get(int(insured_level))
                     if not bracket:
                         if (insured_level,) not in seen_bracket_err:
                             seen_bracket_err.add((insured_level,))
@@ -1174,7 +1351,7 @@ class SecurityPayrollCalculator:
                 "hourly_rate": pay_info.get("hourly_wage"),
                 "first_5_days": data["_debug_days"][:5],
                 "gross_by_sum_raw": int(round(sum(data["_daily_raw"]), 0)),
-                "gross_by_sum_rounded_daily": int(round(sum(data["daily_salaries"]), 0)),
+                "gross_by_sum_rounded_daily": int(round(data["daily_gross"], 0)),
                 "gross_final": gross_final,
             }
             break
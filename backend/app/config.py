@@ -1,4 +1,11 @@
-"""應用設定與環境變數"""
+"""
+應用設定與環境變數。
+
+部署模型：API 以單一 uvicorn 行程服務（不使用 --workers）。巡邏冷卻追蹤、打卡即時事件（SSE）、
+巡邏點/設備快取皆為行程內狀態並依此假設；重啟或滾動部署時新舊行程可能短暫並存，
+此期間會計背景工作（心跳）與巡邏紀錄分區維護（advisory lock）仍可安全執行，
+而 SSE 只推送同一行程處理的打卡、快取最多延遲 patrol_cache_ttl_seconds。
+"""
 from pathlib import Path
 from typing import Optional
 from pydantic_settings import BaseSettings
@@ -25,6 +32,26 @@ class Settings(BaseSettings):
     backup_schedule_time: str = "00:00"
     # 團保固定月費（不從 Excel 級距表讀取，系統固定參數；全由員工負擔）
     group_insurance_monthly_fee: int = 350
+    # 會計薪資每日金額計算引擎：python（逐列）/ vectorized（pandas/NumPy，大量資料用）
+    payroll_engine: str = "python"
+    # 時數檔解析行程池上限（每個 sheet 一個工作）；0 表示不用行程池，改以執行緒解析
+    parse_pool_max_workers: int = 2
+    # 時數檔解析快取（upload_dir/parse_cache）總大小上限 MB；0 表示停用
+    parse_cache_max_mb: int = 200
+    # 會計背景工作（上傳計算）worker 數；SQLite 寫入為序列化，預設 1
+    job_worker_concurrency: int = 1
+    # 會計背景工作心跳間隔；未完成工作超過 job_stale_seconds 未更新心跳者（持有行程已結束）標記為失敗
+    job_heartbeat_seconds: int = 15
+    job_stale_seconds: int = 90
+    # 巡邏打卡巡邏點/設備快取存活秒數（新舊行程並存時，另一行程的異動最多延遲此秒數）；0 表示停用
+    patrol_cache_ttl_seconds: int = 30
+    # 巡邏登入 bcrypt 雜湊/驗證執行緒數（同時執行上限，超過者排隊）
+    password_hash_workers: int = 4
+    # 巡邏紀錄歸檔（僅 PostgreSQL 月分區）：保留最近 N 個月於資料庫，更早的分區匯出後卸除；0 表示不歸檔
+    patrol_log_retention_months: int = 0
+    # 歸檔目錄（相對專案根或絕對路徑）與格式：csv（gzip 壓縮）/ parquet（需安裝 pyarrow，否則改用 csv）
+    patrol_archive_dir: Path = Path("server/backup/patrol_logs")
+    patrol_archive_format: str = "csv"
     # 巡邏綁定 QR 對外公開網址（手機可連線）；未設時 fallback 本機
     public_base_url: str = "http://127.0.0.1:8000"
 
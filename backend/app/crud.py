@@ -13,7 +13,7 @@ from app.models import (
     SalaryProfile, InsuranceMonthlyResult, Site, SiteEmployeeAssignment,
     SiteContractFile, SiteRebate, SiteMonthlyReceipt,
     Schedule, ScheduleShift, ScheduleAssignment, SHIFT_CODES, ASSIGNMENT_ROLES, SCHEDULE_STATUSES,
-    AccountingPayrollResult,
+    AccountingPayrollResult, AccountingJob, AccountingPayrollHours,
 )
 from app.schemas import (
     EmployeeCreate, EmployeeUpdate, DependentCreate, DependentUpdate,
@@ -88,6 +88,38 @@ async def get_employee_by_name_with_registration_priority(
     return None
 
 
+# IN (...) 參數分批上限（SQLite 預設變數上限較低）
+NAME_LOOKUP_CHUNK_SIZE = 500
+
+
+async def list_employees_by_names(
+    db: AsyncSession,
+    names: List[str],
+    registration_types: Optional[List[str]] = None,
+    load_salary_profile: bool = False,
+) -> List[Employee]:
+    """
+    依姓名清單（精確比對）批次查詢員工，可限定登載身份；依 id 排序。
+    供會計薪資一次載入整份上傳檔的候選員工，避免逐列查詢。
+    """
+    target_names = sorted({str(n).strip() for n in (names or []) if n and str(n).strip()})
+    if not target_names:
+        return []
+    types = [t for t in (registration_types or []) if t]
+    out: List[Employee] = []
+    for i in range(0, len(target_names), NAME_LOOKUP_CHUNK_SIZE):
+        chunk = target_names[i:i + NAME_LOOKUP_CHUNK_SIZE]
+        q = select(Employee).where(Employee.name.in_(chunk))
+        if types:
+            q = q.where(Employee.registration_type.in_(types))
+        if load_salary_profile:
+            q = q.options(selectinload(Employee.salary_profile))
+        r = await db.execute(q.order_by(Employee.id))
+        out.extend(r.scalars().all())
+    out.sort(key=lambda e: e.id)
+    return out
+
+
 async def list_employees(
     db: AsyncSession,
     skip: int = 0,
@@ -305,6 +337,8 @@ async def get_insurance_config(db: AsyncSession, config_key: str) -> Optional[st
 
 async def set_insurance_config(db: AsyncSession, config_key: str, config_value: str, description: Optional[str] = None) -> InsuranceConfig:
     from datetime import datetime
+    from app.services.insurance_rules_cache import mark_rules_dirty
+    mark_rules_dirty(db)
     r = await db.execute(select(InsuranceConfig).where(InsuranceConfig.config_key == config_key))
     row = r.scalar_one_or_none()
     if row:
@@ -324,16 +358,25 @@ async def set_insurance_config(db: AsyncSession, config_key: str, config_value:
 
 async def get_all_insurance_rules(db: AsyncSession, year: Optional[int] = None, month: Optional[int] = None) -> dict:
     """
-    取得費率/級距。若提供 year, month，優先依「計算月份」從 rate_tables 取當月有效版本；
-    缺的類型或無有效表時，以設定表(insurance_config)或 YAML 補齊。
+    取得費率/級距（可修改的 dict 副本）。若提供 year, month，優先依「計算月份」從 rate_tables 取當月有效版本；
+    缺的類型或無有效表時，以設定表(insurance_config)或 YAML 補齊。結果經 insurance_rules_cache 依月份快取。
     """
+    from app.services.insurance_rules_cache import get_resolved_rules
+    return (await get_resolved_rules(db, year, month)).to_dict()
+
+
+async def resolve_insurance_rules(db: AsyncSession, year: Optional[int] = None, month: Optional[int] = None) -> dict:
+    """get_all_insurance_rules 的實際解析（不經快取）：YAML → insurance_config → 當月有效 rate_tables。"""
     import json
     from app.services.insurance_calc import _load_rules_from_yaml
-    fallback = _load_rules_from_yaml()
-    result = dict(fallback)
+    result = dict(_load_rules_from_yaml())
     # 先從設定表補齊（舊方式）
+    r = await db.execute(
+        select(InsuranceConfig.config_key, InsuranceConfig.config_value).where(InsuranceConfig.config_key.in_(INSURANCE_KEYS))
+    )
+    configured = dict(r.all())
     for key in INSURANCE_KEYS:
-        val = await get_insurance_config(db, key)
+        val = configured.get(key)
         if val:
             try:
                 result[key] = json.loads(val)
@@ -411,6 +454,7 @@ async def get_effective_rate_table(db: AsyncSession, table_type: str, as_of: dat
         .where(RateTable.effective_from <= as_of)
         .where((RateTable.effective_to.is_(None)) | (RateTable.effective_to >= as_of))
         .order_by(RateTable.effective_from.desc())
+        .options(selectinload(RateTable.items))
     )
     r = await db.execute(q)
     return r.scalar_one_or_none()
@@ -446,6 +490,27 @@ async def get_latest_bracket_import(db: AsyncSession) -> Optional[InsuranceBrack
     return r.scalar_one_or_none()
 
 
+async def get_latest_bracket_import_ref(db: AsyncSession) -> Optional[Tuple[int, Any]]:
+    """取得最近一筆級距表匯入的 (id, imported_at)，不載入 brackets；供級距索引判斷是否需重建。"""
+    r = await db.execute(
+        select(InsuranceBracketImport.id, InsuranceBracketImport.imported_at)
+        .order_by(InsuranceBracketImport.imported_at.desc())
+        .limit(1)
+    )
+    row = r.first()
+    return (row.id, row.imported_at) if row else None
+
+
+async def get_bracket_import(db: AsyncSession, import_id: int) -> Optional[InsuranceBracketImport]:
+    """依 id 取得級距表匯入（含 brackets）"""
+    r = await db.execute(
+        select(InsuranceBracketImport)
+        .where(InsuranceBracketImport.id == import_id)
+        .options(selectinload(InsuranceBracketImport.brackets))
+    )
+    return r.scalar_one_or_none()
+
+
 async def get_bracket_by_level(
     db: AsyncSession, import_id: int, insured_salary_level: int
 ) -> Optional[InsuranceBracket]:
@@ -492,6 +557,8 @@ async def create_bracket_import(
             db.add(b)
     await db.flush()
     await db.refresh(imp)
+    from app.services.bracket_cache import invalidate_bracket_index
+    invalidate_bracket_index()
     return imp
 
 
@@ -597,6 +664,53 @@ async def upsert_insurance_monthly_result(
     return row
 
 
+INSURANCE_RESULT_UPSERT_CHUNK_SIZE = 1000
+
+
+async def bulk_upsert_insurance_monthly_results(db: AsyncSession, rows: List[Dict[str, Any]]) -> int:
+    """
+    整批寫入保險結果：單一 INSERT ... ON CONFLICT (employee_id, year_month, item_type) DO UPDATE，
+    取代逐筆 upsert_insurance_monthly_result 的 SELECT + UPDATE/INSERT。
+    rows 每筆需含 employee_id, year_month, item_type, employee_amount, employer_amount，可選 gov_amount。
+    回傳寫入筆數。
+    """
+    from datetime import datetime
+
+    if not rows:
+        return 0
+    conn = await db.connection()
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    created_at = datetime.utcnow()
+    values = [
+        {
+            "employee_id": r["employee_id"],
+            "year_month": r["year_month"],
+            "item_type": r["item_type"],
+            "employee_amount": r["employee_amount"],
+            "employer_amount": r["employer_amount"],
+            "gov_amount": r.get("gov_amount"),
+            "created_at": created_at,
+        }
+        for r in rows
+    ]
+    # 分段送出，避免超過 SQLite / PostgreSQL 單一語句參數上限
+    for i in range(0, len(values), INSURANCE_RESULT_UPSERT_CHUNK_SIZE):
+        stmt = dialect_insert(InsuranceMonthlyResult).values(values[i:i + INSURANCE_RESULT_UPSERT_CHUNK_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["employee_id", "year_month", "item_type"],
+            set_={
+                "employee_amount": stmt.excluded.employee_amount,
+                "employer_amount": stmt.excluded.employer_amount,
+                "gov_amount": stmt.excluded.gov_amount,
+            },
+        )
+        await db.execute(stmt)
+    return len(values)
+
+
 async def delete_insurance_monthly_results_for_month(db: AsyncSession, year_month: int) -> int:
     """刪除某年月的保險結果（重新產生前可先清空）"""
     from sqlalchemy import delete
@@ -621,6 +735,20 @@ async def get_site_by_name(db: AsyncSession, name: str) -> Optional[Site]:
     return r.scalars().first()
 
 
+async def list_sites_by_names(db: AsyncSession, names: List[str]) -> List[Site]:
+    """依案場名稱清單（精確比對）批次查詢，依 id 排序；供會計保全薪資一次載入。"""
+    target_names = sorted({str(n).strip() for n in (names or []) if n and str(n).strip()})
+    if not target_names:
+        return []
+    out: List[Site] = []
+    for i in range(0, len(target_names), NAME_LOOKUP_CHUNK_SIZE):
+        chunk = target_names[i:i + NAME_LOOKUP_CHUNK_SIZE]
+        r = await db.execute(select(Site).where(Site.name.in_(chunk)).order_by(Site.id))
+        out.extend(r.scalars().all())
+    out.sort(key=lambda s: s.id)
+    return out
+
+
 ARCHIVED_REASON_EXPIRED_NO_RENEW = "expired_no_renew"
 
 
@@ -1408,6 +1536,39 @@ async def delete_payroll_results_for_period(
     return r.rowcount or 0
 
 
+PAYROLL_RESULT_COPY_COLUMNS = (
+    "year", "month", "type", "site", "employee", "pay_type", "total_hours",
+    "gross_salary", "labor_insurance_employee", "health_insurance_employee", "group_insurance",
+    "self_pension_6", "deductions_total", "net_salary", "total_salary", "status", "created_at",
+)
+
+
+def _optional_float(v: Any) -> Optional[float]:
+    return None if v is None else float(v)
+
+
+def _payroll_result_values(year: int, month: int, payroll_type: str, row: Dict[str, Any], created_at) -> Dict[str, Any]:
+    return {
+        "year": year,
+        "month": month,
+        "type": payroll_type,
+        "site": row.get("site", ""),
+        "employee": row.get("employee", ""),
+        "pay_type": row.get("pay_type"),
+        "total_hours": float(row.get("total_hours", 0)),
+        "gross_salary": _optional_float(row.get("gross_salary")),
+        "labor_insurance_employee": _optional_float(row.get("labor_insurance_employee")),
+        "health_insurance_employee": _optional_float(row.get("health_insurance_employee")),
+        "group_insurance": _optional_float(row.get("group_insurance")),
+        "self_pension_6": _optional_float(row.get("self_pension_6")),
+        "deductions_total": _optional_float(row.get("deductions_total")),
+        "net_salary": _optional_float(row.get("net_salary")),
+        "total_salary": float(row.get("total_salary", 0) or row.get("net_salary", 0)),
+        "status": row.get("status", ""),
+        "created_at": created_at,
+    }
+
+
 async def save_payroll_results(
     db: AsyncSession,
     year: int,
@@ -1415,29 +1576,154 @@ async def save_payroll_results(
     payroll_type: str,
     results: List[Dict[str, Any]],
 ) -> None:
-    """儲存計算結果至 accounting_payroll_results（含應發/扣款/實發）。"""
-    for row in results:
-        db.add(
-            AccountingPayrollResult(
-                year=year,
-                month=month,
-                type=payroll_type,
-                site=row.get("site", ""),
-                employee=row.get("employee", ""),
-                pay_type=row.get("pay_type"),
-                total_hours=float(row.get("total_hours", 0)),
-                gross_salary=row.get("gross_salary"),
-                labor_insurance_employee=row.get("labor_insurance_employee"),
-                health_insurance_employee=row.get("health_insurance_employee"),
-                group_insurance=row.get("group_insurance"),
-                self_pension_6=row.get("self_pension_6"),
-                deductions_total=row.get("deductions_total"),
-                net_salary=row.get("net_salary"),
-                total_salary=float(row.get("total_salary", 0) or row.get("net_salary", 0)),
-                status=row.get("status", ""),
+    """
+    儲存計算結果至 accounting_payroll_results（含應發/扣款/實發）。
+    整批寫入：PostgreSQL（asyncpg）走 COPY；其他資料庫以單一多列 INSERT（insertmanyvalues）寫入，
+    不逐筆建立 ORM 物件。
+    """
+    from datetime import datetime
+    from sqlalchemy import insert
+
+    if not results:
+        return
+    created_at = datetime.utcnow()
+    values = [_payroll_result_values(year, month, payroll_type, row, created_at) for row in results]
+    await db.flush()
+    conn = await db.connection()
+    if conn.dialect.name == "postgresql" and conn.dialect.driver == "asyncpg":
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            AccountingPayrollResult.__tablename__,
+            records=[tuple(v[c] for c in PAYROLL_RESULT_COPY_COLUMNS) for v in values],
+            columns=list(PAYROLL_RESULT_COPY_COLUMNS),
+        )
+        return
+    await db.execute(insert(AccountingPayrollResult), values)
+
+
+async def delete_payroll_results_for_employees(
+    db: AsyncSession, year: int, month: int, payroll_type: str, employee_names: List[str]
+) -> int:
+    """刪除指定年/月/類型下特定員工（所有案場）的已存結果，回傳刪除筆數。"""
+    total = 0
+    names = sorted({n for n in employee_names if n})
+    for i in range(0, len(names), NAME_LOOKUP_CHUNK_SIZE):
+        r = await db.execute(
+            delete(AccountingPayrollResult).where(
+                AccountingPayrollResult.year == year,
+                AccountingPayrollResult.month == month,
+                AccountingPayrollResult.type == payroll_type,
+                AccountingPayrollResult.employee.in_(names[i:i + NAME_LOOKUP_CHUNK_SIZE]),
             )
         )
-    await db.flush()
+        total += r.rowcount or 0
+    return total
+
+
+async def replace_payroll_hours(
+    db: AsyncSession,
+    year: int,
+    month: int,
+    payroll_type: str,
+    rows: List[Dict[str, Any]],
+) -> int:
+    """以本次上傳解析出的每日時數取代該年/月/類型之時數明細（整批寫入），回傳寫入筆數。"""
+    from datetime import datetime
+    from sqlalchemy import insert
+
+    await db.execute(
+        delete(AccountingPayrollHours).where(
+            AccountingPayrollHours.year == year,
+            AccountingPayrollHours.month == month,
+            AccountingPayrollHours.type == payroll_type,
+        )
+    )
+    values = []
+    for r in rows:
+        d = r.get("date")
+        if isinstance(d, datetime):
+            d = d.date()
+        if not isinstance(d, date):
+            continue
+        try:
+            hours = float(r.get("hours", 0.0))
+        except (TypeError, ValueError):
+            hours = 0.0
+        values.append({
+            "year": year,
+            "month": month,
+            "type": payroll_type,
+            "site": (r.get("site") or "").strip(),
+            "employee": (r.get("employee") or "").strip(),
+            "work_date": d,
+            "hours": hours,
+        })
+    if values:
+        await db.execute(insert(AccountingPayrollHours), values)
+    return len(values)
+
+
+async def list_payroll_hours(
+    db: AsyncSession,
+    year: int,
+    month: int,
+    payroll_type: str,
+    employee_names: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    讀回已保存的每日時數，格式與 parse_security_hours_file 相同（date 為 datetime），可直接交給 validate_and_calculate。
+    employee_names 指定時只取這些員工（所有案場）。
+    """
+    from datetime import datetime
+
+    base = select(AccountingPayrollHours).where(
+        AccountingPayrollHours.year == year,
+        AccountingPayrollHours.month == month,
+        AccountingPayrollHours.type == payroll_type,
+    )
+    if employee_names is None:
+        chunks = [base]
+    else:
+        names = sorted({n for n in employee_names if n})
+        chunks = [
+            base.where(AccountingPayrollHours.employee.in_(names[i:i + NAME_LOOKUP_CHUNK_SIZE]))
+            for i in range(0, len(names), NAME_LOOKUP_CHUNK_SIZE)
+        ]
+    records: List[AccountingPayrollHours] = []
+    for q in chunks:
+        r = await db.execute(q)
+        records.extend(r.scalars().all())
+    records.sort(key=lambda h: h.id)
+    return [
+        {
+            "site": h.site,
+            "employee": h.employee,
+            "date": datetime.combine(h.work_date, datetime.min.time()),
+            "hours": h.hours,
+        }
+        for h in records
+    ]
+
+
+async def list_payroll_hour_employees_for_sites(
+    db: AsyncSession, year: int, month: int, payroll_type: str, site_names: List[str]
+) -> List[str]:
+    """指定案場在該年/月/類型時數明細中出現過的員工姓名。"""
+    names = sorted({n for n in site_names if n})
+    employees: set = set()
+    for i in range(0, len(names), NAME_LOOKUP_CHUNK_SIZE):
+        r = await db.execute(
+            select(AccountingPayrollHours.employee)
+            .where(
+                AccountingPayrollHours.year == year,
+                AccountingPayrollHours.month == month,
+                AccountingPayrollHours.type == payroll_type,
+                AccountingPayrollHours.site.in_(names[i:i + NAME_LOOKUP_CHUNK_SIZE]),
+            )
+            .distinct()
+        )
+        employees.update(r.scalars().all())
+    return sorted(employees)
 
 
 async def get_payroll_results_for_period(
@@ -1675,3 +1961,80 @@ async def get_payroll_history_months(
     )
     rows = r.all()
     return [{"year": y, "month": m} for y, m in rows]
+
+
+# ---------- 傻瓜會計背景工作 accounting_jobs ----------
+
+
+async def create_accounting_job(
+    db: AsyncSession, kind: str, params: Optional[Dict[str, Any]] = None, worker_id: Optional[str] = None
+) -> AccountingJob:
+    from datetime import datetime
+
+    job = AccountingJob(
+        kind=kind, status="queued", phase="queued", params=params or {},
+        worker_id=worker_id, heartbeat_at=datetime.utcnow(),
+    )
+    db.add(job)
+    await db.flush()
+    await db.refresh(job)
+    return job
+
+
+async def get_accounting_job(db: AsyncSession, job_id: int) -> Optional[AccountingJob]:
+    r = await db.execute(select(AccountingJob).where(AccountingJob.id == job_id))
+    return r.scalar_one_or_none()
+
+
+async def get_latest_succeeded_job_params(
+    db: AsyncSession, kind: str, match: Dict[str, Any], scan_limit: int = 200
+) -> Optional[Dict[str, Any]]:
+    """最近一次成功完成、且 params 符合 match 各鍵值之工作的 params（params 為 JSON，於 Python 端比對）。"""
+    r = await db.execute(
+        select(AccountingJob.params)
+        .where(AccountingJob.kind == kind, AccountingJob.status == "succeeded")
+        .order_by(AccountingJob.id.desc())
+        .limit(scan_limit)
+    )
+    for params in r.scalars():
+        params = params or {}
+        if all(params.get(k) == v for k, v in match.items()):
+            return params
+    return None
+
+
+async def touch_accounting_jobs(db: AsyncSession, worker_id: str) -> int:
+    """更新此行程持有之未完成工作的心跳時間，回傳筆數。"""
+    from datetime import datetime
+    from sqlalchemy import update
+
+    r = await db.execute(
+        update(AccountingJob)
+        .where(AccountingJob.worker_id == worker_id, AccountingJob.status.in_(("queued", "running")))
+        .values(heartbeat_at=datetime.utcnow())
+    )
+    return r.rowcount or 0
+
+
+async def fail_unfinished_accounting_jobs(
+    db: AsyncSession, reason: str, stale_before: "datetime", exclude_worker_id: Optional[str] = None
+) -> int:
+    """
+    將尚未完成（queued/running）且心跳早於 stale_before 的工作標記為失敗（持有行程已結束，佇列與上傳內容已遺失）。
+    仍有存活行程更新心跳的工作不受影響；exclude_worker_id 指定時略過該行程自己的工作。
+    """
+    from datetime import datetime
+    from sqlalchemy import update
+
+    q = (
+        update(AccountingJob)
+        .where(
+            AccountingJob.status.in_(("queued", "running")),
+            func.coalesce(AccountingJob.heartbeat_at, AccountingJob.created_at) < stale_before,
+        )
+        .values(status="failed", error=reason, finished_at=datetime.utcnow())
+    )
+    if exclude_worker_id is not None:
+        q = q.where(or_(AccountingJob.worker_id.is_(None), AccountingJob.worker_id != exclude_worker_id))
+    r = await db.execute(q.execution_options(synchronize_session=False))
+    return r.rowcount or 0
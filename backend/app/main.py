@@ -29,6 +29,12 @@ from app.routers import (
     patrol,
 )
 from app.services.backup_job import run_scheduled_backup
+from app.services.patrol_coverage import run_scheduled_rebuild as rebuild_patrol_coverage
+from app.services.patrol_partitions import run_scheduled_maintenance as maintain_patrol_partitions
+from app.accounting.parse_pool import shutdown_parse_pool
+from app.services.password_pool import shutdown_password_pool
+from app.accounting.payroll_jobs import fail_interrupted_jobs, job_queue
+from app.services.patrol_cooldown import warm_tracker as warm_patrol_cooldown
 
 logger = logging.getLogger(__name__)
 _scheduler: AsyncIOScheduler | None = None
@@ -41,6 +47,20 @@ async def _daily_backup_job():
         logger.exception("每日人事備份排程執行失敗")
 
 
+async def _patrol_coverage_job():
+    try:
+        await rebuild_patrol_coverage()
+    except Exception:
+        logger.exception("巡邏覆蓋彙總重建排程執行失敗")
+
+
+async def _patrol_partition_job():
+    try:
+        await maintain_patrol_partitions()
+    except Exception:
+        logger.exception("巡邏紀錄分區維護排程執行失敗")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # ✅ Render/正式環境（PostgreSQL）不要在啟動時自動建表/補欄位
@@ -87,12 +107,45 @@ async def lifespan(app: FastAPI):
             replace_existing=True,
         )
 
+    # 巡邏覆蓋彙總：每日重建最近幾日，校正增量更新無法反映的異動（如刪除巡邏點）
+    _scheduler.add_job(
+        _patrol_coverage_job,
+        "cron",
+        hour=0,
+        minute=30,
+        id="patrol_coverage_rebuild",
+        replace_existing=True,
+    )
+    # 巡邏紀錄月分區（僅 PostgreSQL）：預先建立下個月分區、歸檔過期分區
+    _scheduler.add_job(
+        _patrol_partition_job,
+        "cron",
+        hour=1,
+        minute=0,
+        id="patrol_log_partitions",
+        replace_existing=True,
+    )
+
     _scheduler.start()
 
+    # 已無行程持有（心跳逾時）的會計背景工作無法續跑，標記為失敗；並啟動本行程工作心跳
+    await fail_interrupted_jobs()
+    # 巡邏重複掃碼冷卻：由最近 5 分鐘打卡紀錄預熱
+    await warm_patrol_cooldown()
+    # 巡邏紀錄月分區：啟動時補建本月/下個月分區（歸檔留給排程）
+    if not is_sqlite:
+        try:
+            await maintain_patrol_partitions(archive=False)
+        except Exception:
+            logger.warning("巡邏紀錄分區檢查失敗", exc_info=True)
+
     yield
 
     if _scheduler:
         _scheduler.shutdown(wait=False)
+    await job_queue.shutdown()
+    shutdown_parse_pool()
+    shutdown_password_pool()
 
 
 app = FastAPI(
@@ -112,6 +165,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 app.include_router(auth.router)
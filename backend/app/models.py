@@ -3,7 +3,7 @@
 from datetime import date, datetime, time
 from decimal import Decimal
 from typing import Optional, List
-from sqlalchemy import String, Date, Time, Text, Numeric, ForeignKey, DateTime, Boolean, Integer, UniqueConstraint, JSON
+from sqlalchemy import String, Date, Time, Text, Numeric, ForeignKey, DateTime, Boolean, Integer, UniqueConstraint, JSON, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from app.database import Base
 
@@ -192,6 +192,9 @@ class InsuranceMonthlyResult(Base):
     """保險費用計算結果落表，供會計抓 company cost。
     employee_id, year_month, item_type, employee_amount, employer_amount, gov_amount。"""
     __tablename__ = "insurance_monthly_results"
+    __table_args__ = (
+        Index("uq_insurance_monthly_result_item", "employee_id", "year_month", "item_type", unique=True),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     employee_id: Mapped[int] = mapped_column(ForeignKey("employees.id", ondelete="CASCADE"), index=True)
@@ -426,6 +429,48 @@ class AccountingPayrollResult(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
 
+class AccountingPayrollHours(Base):
+    """傻瓜會計上傳時數明細（每人每案場每日），依年/月/類型保存最近一次上傳，供單一員工/案場重算。"""
+    __tablename__ = "accounting_payroll_hours"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    year: Mapped[int] = mapped_column(Integer, comment="西元年")
+    month: Mapped[int] = mapped_column(Integer, comment="1～12")
+    type: Mapped[str] = mapped_column(String(30), comment="security / property / smith / cleaning")
+    site: Mapped[str] = mapped_column(String(100), index=True, comment="案場名稱")
+    employee: Mapped[str] = mapped_column(String(50), comment="員工姓名")
+    work_date: Mapped[date] = mapped_column(Date, comment="出勤日")
+    hours: Mapped[float] = mapped_column(nullable=False, comment="當日工時")
+
+    __table_args__ = (
+        Index("ix_accounting_payroll_hours_period_employee", "year", "month", "type", "employee"),
+    )
+
+
+ACCOUNTING_JOB_STATUSES = ("queued", "running", "succeeded", "failed")
+
+
+class AccountingJob(Base):
+    """傻瓜會計背景工作（如薪資時數檔上傳計算）：狀態、階段、進度計數與最終結果/錯誤。"""
+    __tablename__ = "accounting_jobs"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    kind: Mapped[str] = mapped_column(String(40), index=True, comment="工作種類，如 security_payroll_upload")
+    status: Mapped[str] = mapped_column(String(20), default="queued", index=True, comment="queued/running/succeeded/failed")
+    phase: Mapped[str] = mapped_column(String(20), default="queued", comment="queued/parsing/calculating/writing/done")
+    params: Mapped[Optional[dict]] = mapped_column(JSON, comment="工作參數（year/month/type/檔名等）")
+    rows_parsed: Mapped[int] = mapped_column(Integer, default=0, comment="已解析時數列數")
+    employees_resolved: Mapped[int] = mapped_column(Integer, default=0, comment="已對應員工數")
+    rows_written: Mapped[int] = mapped_column(Integer, default=0, comment="已寫入結果列數")
+    result: Mapped[Optional[dict]] = mapped_column(JSON, comment="完成後之回傳內容（results/errors...）")
+    error: Mapped[Optional[str]] = mapped_column(Text, comment="失敗原因")
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    worker_id: Mapped[Optional[str]] = mapped_column(String(80), comment="持有工作（佇列與上傳內容）之行程識別")
+    heartbeat_at: Mapped[Optional[datetime]] = mapped_column(DateTime, comment="持有行程最後回報存活時間")
+
+
 class PatrolBindingCode(Base):
     """手機設備綁定碼（一次性，具有效期）。"""
     __tablename__ = "patrol_binding_codes"
@@ -511,6 +556,10 @@ class PatrolPoint(Base):
 class PatrolLog(Base):
     """巡邏打點紀錄。"""
     __tablename__ = "patrol_logs"
+    __table_args__ = (
+        Index("ix_patrol_logs_created_at_id", "created_at", "id"),
+        Index("ix_patrol_logs_site_id_checkin_date", "site_id", "checkin_date"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     device_id: Mapped[Optional[int]] = mapped_column(ForeignKey("patrol_devices.id", ondelete="SET NULL"), nullable=True, index=True)
@@ -530,3 +579,21 @@ class PatrolLog(Base):
 
     device: Mapped[Optional["PatrolDevice"]] = relationship("PatrolDevice", back_populates="logs")
     point: Mapped[Optional["PatrolPoint"]] = relationship("PatrolPoint", back_populates="logs")
+
+
+class PatrolCoverageDaily(Base):
+    """巡邏覆蓋每日彙總：每巡邏點每日（Asia/Taipei）每時段的掃碼次數，打卡寫入時增量更新、每日排程重建校正。"""
+    __tablename__ = "patrol_coverage_daily"
+    __table_args__ = (
+        UniqueConstraint("point_id", "scan_date", "period", name="uq_patrol_coverage_point_date_period"),
+        Index("ix_patrol_coverage_site_date", "site_id", "scan_date"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    site_id: Mapped[Optional[int]] = mapped_column(ForeignKey("sites.id", ondelete="SET NULL"), nullable=True, comment="案場（打卡當下巡邏點所屬）")
+    point_id: Mapped[int] = mapped_column(ForeignKey("patrol_points.id", ondelete="CASCADE"))
+    scan_date: Mapped[date] = mapped_column(Date, comment="掃碼日期（Asia/Taipei）")
+    period: Mapped[str] = mapped_column(String(10), comment="早上/下午/晚上")
+    scan_count: Mapped[int] = mapped_column(Integer, default=0)
+    first_scan: Mapped[datetime] = mapped_column(DateTime, comment="當日該時段第一次掃碼（UTC）")
+    last_scan: Mapped[datetime] = mapped_column(DateTime, comment="當日該時段最後一次掃碼（UTC）")
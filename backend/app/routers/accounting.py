@@ -1,19 +1,19 @@
 """傻瓜會計 API：保全核心計算（上傳時數檔 → 計算薪資）、歷史查詢、Excel 匯出。"""
-import io
 import json
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query
-from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import get_db
 from app import crud
 from app.accounting.security_payroll_service import (
-    parse_security_hours_file,
     SecurityPayrollCalculator,
     compute_test_rounding,
 )
-from app.accounting.payroll_export import build_payroll_excel, build_payroll_excel_grouped
+from app.accounting import payroll_jobs
+from app.accounting.payroll_export import payroll_workbook, payroll_workbook_grouped
+from app.schemas import SecurityPayrollRecalculateRequest
 from app.utils.http_headers import build_content_disposition
+from app.utils.xlsx_stream import xlsx_streaming_response
 
 router = APIRouter(prefix="/api/accounting", tags=["accounting"])
 
@@ -32,7 +32,7 @@ def _payroll_type_label(payroll_type: str) -> str:
     }.get((payroll_type or "").strip().lower(), "薪資")
 
 
-@router.post("/security-payroll/upload")
+@router.post("/security-payroll/upload", status_code=202)
 async def security_payroll_upload(
     file: UploadFile = File(...),
     year: int | None = Form(None),
@@ -44,7 +44,8 @@ async def security_payroll_upload(
 ):
     """
     上傳時數檔案（xlsx / xls / ods），必須帶入 year, month, type。
-    解析後驗證並計算每人每月工時與薪資（依 type 套用對應規則），回傳結果含 year, month, type。
+    參數驗證後建立背景工作並立即回傳 job_id；解析、驗證並計算每人每月工時與薪資（依 type 套用對應規則）
+    由背景 worker 執行，進度與結果請輪詢 GET /api/accounting/jobs/{job_id}。
     同年月重複上傳會先刪除該月份該類別舊資料再寫入（覆蓋）。
     """
     if not file.filename:
@@ -93,27 +94,85 @@ async def security_payroll_upload(
         raise HTTPException(status_code=400, detail="僅支援 xlsx / xls / ods 格式")
 
     content = await file.read()
-    try:
-        rows, parse_errors = parse_security_hours_file(content, file.filename or "", year=y, month=m)
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    job = await crud.create_accounting_job(
+        db,
+        payroll_jobs.SECURITY_PAYROLL_UPLOAD,
+        params={
+            "year": y,
+            "month": m,
+            "payroll_type": payroll_type,
+            "extra_payroll_types": dedup_extra_types,
+            "filename": file.filename,
+        },
+        worker_id=payroll_jobs.WORKER_ID,
+    )
+    # 先 commit 讓 worker（另一個 session）讀得到工作
+    await db.commit()
+    payroll_jobs.job_queue.submit(job.id, content)
+    return {"job_id": job.id, "status": job.status, "phase": job.phase}
+
+
+@router.post("/security-payroll/recalculate")
+async def security_payroll_recalculate(
+    body: SecurityPayrollRecalculateRequest,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    不重新上傳：以該年/月/類型最近一次上傳保存的時數明細，只重算受影響員工。
+    指定案場時，該案場出現過的員工全部納入；每位員工一律重算其所有案場（保險每人只扣一次）。
+    只刪除並重寫實際算出結果之員工的 accounting_payroll_results；其他員工與計算失敗（errors）者不動。
+    未帶 extra_payroll_types 時沿用該月份最近一次上傳的設定。
+    """
+    payroll_type = (body.payroll_type or "").strip().lower()
+    if payroll_type not in PAYROLL_TYPES:
+        raise HTTPException(status_code=400, detail="計算類型無效，請傳入 type=security/property/smith/cleaning")
+    employees = {(n or "").strip() for n in body.employees} - {""}
+    sites = [(n or "").strip() for n in body.sites if (n or "").strip()]
+    if not employees and not sites:
+        raise HTTPException(status_code=400, detail="請指定要重算的員工或案場")
+    if sites:
+        employees.update(
+            await crud.list_payroll_hour_employees_for_sites(db, body.year, body.month, payroll_type, sites)
+        )
+    requested_extra = body.extra_payroll_types
+    if requested_extra is None:
+        # 未指定時沿用產生這份時數明細的上傳設定（時數與該上傳工作同一 transaction 寫入）
+        upload_params = await crud.get_latest_succeeded_job_params(
+            db,
+            payroll_jobs.SECURITY_PAYROLL_UPLOAD,
+            {"year": body.year, "month": body.month, "payroll_type": payroll_type},
+        )
+        requested_extra = (upload_params or {}).get("extra_payroll_types") or []
+    extra_types = []
+    for item in requested_extra:
+        key = (item or "").strip().lower()
+        if key and key != payroll_type and key in EMPLOYEE_LOOKUP_TYPES and key not in extra_types:
+            extra_types.append(key)
+
+    rows = await crud.list_payroll_hours(db, body.year, body.month, payroll_type, employee_names=sorted(employees))
+    if not rows:
+        raise HTTPException(status_code=404, detail="查無可重算的時數資料，請先上傳該月份時數檔")
 
     calculator = SecurityPayrollCalculator(db)
-    results, calc_errors, debug = await calculator.validate_and_calculate(
+    results, errors, debug = await calculator.validate_and_calculate(
         rows,
-        year=y,
-        month=m,
+        year=body.year,
+        month=body.month,
         payroll_type=payroll_type,
-        extra_payroll_types=dedup_extra_types,
+        extra_payroll_types=extra_types,
+    )
+    affected = sorted({r["employee"] for r in rows})
+    # 只覆寫本次有算出結果的員工；對應失敗（列於 errors）者保留原結果
+    recalculated = sorted({r.get("employee", "") for r in results})
+    deleted_before_insert = await crud.delete_payroll_results_for_employees(
+        db, body.year, body.month, payroll_type, recalculated
     )
-    errors = [{"type": "parse_error", "message": msg} for msg in parse_errors] + calc_errors
-
-    # 同年月同類型：先刪除舊資料再插入，同一 transaction 內完成（覆蓋，不累積）；失敗會 rollback
-    deleted_before_insert = await crud.delete_payroll_results_for_period(db, y, m, payroll_type)
     if results:
-        await crud.save_payroll_results(db, y, m, payroll_type, results)
+        await crud.save_payroll_results(db, body.year, body.month, payroll_type, results)
 
     out = {
+        "employees": affected,
+        "recalculated_employees": recalculated,
         "results": results,
         "errors": errors,
         "deleted_before_insert": deleted_before_insert,
@@ -124,6 +183,19 @@ async def security_payroll_upload(
     return out
 
 
+@router.get("/jobs/{job_id}")
+async def get_accounting_job(
+    job_id: int,
+    include_result: bool = Query(True, description="是否附上完成結果（results/errors）"),
+    db: AsyncSession = Depends(get_db),
+):
+    """查詢背景工作狀態：status、phase、progress（rows_parsed / employees_resolved / rows_written）與完成結果或錯誤。"""
+    job = await crud.get_accounting_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="找不到此工作")
+    return payroll_jobs.job_to_dict(job, include_result=include_result)
+
+
 @router.get("/security-payroll/test-rounding")
 def security_payroll_test_rounding():
     """
@@ -321,14 +393,10 @@ async def security_payroll_export_post(
         raise HTTPException(status_code=400, detail="月份須為 1～12")
     label = f"{y}年{str(m).zfill(2)}月"
     sheet_name = f"{_payroll_type_label(payroll_type)}薪資_{label}"
-    content = build_payroll_excel(results, sheet_name=sheet_name)
+    wb = payroll_workbook(results, sheet_name=sheet_name)
     ascii_name = f"{payroll_type}_payroll_{y}_{m:02d}.xlsx"
     unicode_name = f"{_payroll_type_label(payroll_type)}核薪_{y}_{m:02d}.xlsx"
-    return StreamingResponse(
-        io.BytesIO(content),
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": build_content_disposition(ascii_name, unicode_name)},
-    )
+    return await xlsx_streaming_response(wb, build_content_disposition(ascii_name, unicode_name))
 
 
 @router.get("/security-payroll/export")
@@ -345,11 +413,7 @@ async def security_payroll_export_get(
     if not results:
         raise HTTPException(status_code=404, detail="該月份尚無存檔資料")
     enriched_results, stats = await crud.enrich_history_records(db, results)
-    content = build_payroll_excel_grouped(enriched_results, stats)
+    wb = payroll_workbook_grouped(enriched_results, stats)
     ascii_name = f"{payroll_type}_payroll_{year}_{month:02d}.xlsx"
     unicode_name = f"{_payroll_type_label(payroll_type)}核薪_{year}_{month:02d}.xlsx"
-    return StreamingResponse(
-        io.BytesIO(content),
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": build_content_disposition(ascii_name, unicode_name)},
-    )
+    return await xlsx_streaming_response(wb, build_content_disposition(ascii_name, unicode_name))
@@ -8,7 +8,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import get_db
 from app import crud
-from app.crud import INSURANCE_ITEM_TYPES, delete_insurance_monthly_results_for_month, upsert_insurance_monthly_result
+from app.crud import INSURANCE_ITEM_TYPES, bulk_upsert_insurance_monthly_results, delete_insurance_monthly_results_for_month
 from app.schemas import (
     InsuranceEstimateRequest,
     InsuranceEstimateResponse,
@@ -16,35 +16,26 @@ from app.schemas import (
     SalaryBracketItem,
     InsuranceMonthlyResultRead,
 )
-from app.services.insurance_calc import get_brackets, salary_to_level
+from app.services.insurance_calc import salary_index_for, salary_to_level
+from app.services.bracket_cache import BracketIndex, get_bracket_index
+from app.services.insurance_rules_cache import get_resolved_rules
 from app.config import settings
 
 router = APIRouter(prefix="/api/insurance", tags=["insurance"])
 
 
-def _brackets_from_db(imp) -> list[SalaryBracketItem]:
-    """由最新匯入的 insurance_brackets 組出 [ { level, low, high } ]：level 排序後，low=前一級+1（首筆 1），high=本級距（末筆 999999）。"""
-    if not imp or not getattr(imp, "brackets", None) or not imp.brackets:
-        return []
-    levels = sorted([int(b.insured_salary_level) for b in imp.brackets])
-    out = []
-    for i, lev in enumerate(levels):
-        low = 1 if i == 0 else levels[i - 1] + 1
-        high = lev if i < len(levels) - 1 else 999999
-        out.append(SalaryBracketItem(level=Decimal(lev), low=low, high=high))
-    return out
+def _brackets_from_index(index: BracketIndex) -> list[SalaryBracketItem]:
+    """級距下拉選單 [ { level, low, high } ]：直接取薪資 → 級距索引的區間，與 /salary-to-level 同源。"""
+    return [SalaryBracketItem(level=level, low=int(low), high=int(high)) for low, high, level in index.ranges()]
 
 
 @router.get("/brackets", response_model=list[SalaryBracketItem])
 async def list_brackets(db: AsyncSession = Depends(get_db)):
     """取得投保薪資級距列表：以 DB 最新匯入的 insurance_brackets 為準；無匯入時 fallback 至 YAML。"""
-    imp = await crud.get_latest_bracket_import(db)
-    from_db = _brackets_from_db(imp)
-    if from_db:
-        return from_db
-    rules = await crud.get_all_insurance_rules(db)
-    raw = get_brackets(rules)
-    return [SalaryBracketItem(level=Decimal(str(b[2])), low=int(b[0]), high=int(b[1])) for b in raw]
+    index = await get_bracket_index(db)
+    if index:
+        return _brackets_from_index(index.salary_index)
+    return _brackets_from_index(salary_index_for(await get_resolved_rules(db)))
 
 
 @router.get("/salary-to-level")
@@ -53,16 +44,10 @@ async def map_salary_to_level(
     db: AsyncSession = Depends(get_db),
 ):
     """輸入金額後自動對應級距：與下拉選單同源（DB 最新匯入）；無匯入時用 YAML。"""
-    imp = await crud.get_latest_bracket_import(db)
-    items = _brackets_from_db(imp)
-    if items:
-        for it in items:
-            if it.low <= salary <= it.high:
-                return {"salary": salary, "insured_salary_level": float(it.level)}
-        if salary > items[-1].high:
-            return {"salary": salary, "insured_salary_level": float(items[-1].level)}
-        return {"salary": salary, "insured_salary_level": float(items[0].level)}
-    rules = await crud.get_all_insurance_rules(db)
+    index = await get_bracket_index(db)
+    if index:
+        return {"salary": salary, "insured_salary_level": float(index.salary_index.lookup(salary))}
+    rules = await get_resolved_rules(db)
     level = salary_to_level(Decimal(str(salary)), rules)
     return {"salary": salary, "insured_salary_level": float(level)}
 
@@ -118,10 +103,10 @@ async def insurance_estimate(
     if level_int is None:
         raise HTTPException(status_code=400, detail="請提供投保級距或選擇已設定投保級距的員工")
 
-    imp = await crud.get_latest_bracket_import(db)
-    if not imp or not getattr(imp, "brackets", None):
+    bracket_index = await get_bracket_index(db)
+    if not bracket_index:
         raise HTTPException(status_code=400, detail="查無級距，請先匯入級距表或確認員工級距金額")
-    bracket = await crud.get_bracket_by_level(db, imp.id, level_int)
+    bracket = bracket_index.get(level_int)
     if not bracket:
         raise HTTPException(status_code=400, detail="查無級距，請先匯入級距表或確認員工級距金額")
 
@@ -146,7 +131,7 @@ async def insurance_estimate(
         pension_self_6_item = ItemBreakdown(name="自提6%", employer=Decimal("0"), employee=pension, total=pension)
         total_employee = total_employee + pension
         total = total_employer + total_employee
-    imported_at_str = imp.imported_at.strftime("%Y-%m-%d %H:%M") if imp.imported_at else ""
+    imported_at_str = bracket_index.imported_at.strftime("%Y-%m-%d %H:%M") if bracket_index.imported_at else ""
 
     return InsuranceEstimateResponse(
         insured_salary_level=Decimal(level_int),
@@ -166,7 +151,7 @@ async def insurance_estimate(
         total=total,
         dependent_count=dep_count or 0,
         from_bracket_table=True,
-        bracket_source={"file_name": imp.file_name or "", "imported_at": imported_at_str},
+        bracket_source={"file_name": bracket_index.file_name or "", "imported_at": imported_at_str},
     )
 
 
@@ -281,13 +266,16 @@ async def generate_monthly_insurance_result(
     year_month = year * 100 + month
     if overwrite:
         await delete_insurance_monthly_results_for_month(db, year_month)
-    imp = await crud.get_latest_bracket_import(db)
-    if not imp or not getattr(imp, "brackets", None):
+    bracket_index = await get_bracket_index(db)
+    if not bracket_index:
         raise HTTPException(
             status_code=400,
             detail="級距表尚未匯入，請先至「級距表匯入」上傳 Excel 後再產生月結果",
         )
     employees = await crud.list_employees(db, skip=0, limit=10000, load_dependents=True)
+    # 團保固定月費由 config，全由員工負擔（不從級距表）
+    group_monthly = Decimal(str(settings.group_insurance_monthly_fee))
+    rows = []
     count = 0
     for e in employees:
         level_raw = e.insured_salary_level
@@ -297,33 +285,26 @@ async def generate_monthly_insurance_result(
             level_int = int(Decimal(str(level_raw)))
         except (ValueError, TypeError):
             continue
-        bracket = await crud.get_bracket_by_level(db, imp.id, level_int)
+        bracket = bracket_index.get(level_int)
         if not bracket:
             continue
-        lab_gov = None
-        await upsert_insurance_monthly_result(
-            db, e.id, year_month, "labor_insurance",
-            bracket.labor_employee, bracket.labor_employer, lab_gov,
-        )
-        await upsert_insurance_monthly_result(
-            db, e.id, year_month, "health_insurance",
-            bracket.health_employee, bracket.health_employer, None,
-        )
-        await upsert_insurance_monthly_result(
-            db, e.id, year_month, "occupational_accident",
-            Decimal("0"), bracket.occupational_accident, None,
-        )
-        await upsert_insurance_monthly_result(
-            db, e.id, year_month, "labor_pension",
-            Decimal("0"), bracket.labor_pension, None,
-        )
-        # 團保固定月費由 config，全由員工負擔（不從級距表）
-        _group_monthly = Decimal(str(settings.group_insurance_monthly_fee))
-        await upsert_insurance_monthly_result(
-            db, e.id, year_month, "group_insurance",
-            _group_monthly, Decimal("0"), None,
-        )
+        for item_type, employee_amount, employer_amount in (
+            ("labor_insurance", bracket.labor_employee, bracket.labor_employer),
+            ("health_insurance", bracket.health_employee, bracket.health_employer),
+            ("occupational_accident", Decimal("0"), bracket.occupational_accident),
+            ("labor_pension", Decimal("0"), bracket.labor_pension),
+            ("group_insurance", group_monthly, Decimal("0")),
+        ):
+            rows.append({
+                "employee_id": e.id,
+                "year_month": year_month,
+                "item_type": item_type,
+                "employee_amount": employee_amount,
+                "employer_amount": employer_amount,
+                "gov_amount": None,
+            })
         count += 1
+    await bulk_upsert_insurance_monthly_results(db, rows)
     await db.commit()
     return {"year": year, "month": month, "year_month": year_month, "employees_processed": count}
 
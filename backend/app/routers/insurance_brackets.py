@@ -10,12 +10,12 @@ from app.database import get_db
 from app.config import settings
 from app.crud import (
     get_latest_bracket_import,
-    get_bracket_by_level,
     create_bracket_import,
     get_employee,
 )
 from app.schemas import ItemBreakdown, InsuranceEstimateResponse
 from app.services.bracket_excel_parser import parse_bracket_excel
+from app.services.bracket_cache import get_bracket_index
 
 router = APIRouter(prefix="/api/insurance-brackets", tags=["insurance-brackets"])
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
@@ -125,13 +125,13 @@ async def estimate_by_bracket(
     db: AsyncSession = Depends(get_db),
 ):
     """以級距表為唯一依據：依投保級距查表，回傳公司/員工/合計；找不到級距時回傳明確錯誤。"""
-    imp = await get_latest_bracket_import(db)
-    if not imp or not imp.brackets:
+    bracket_index = await get_bracket_index(db)
+    if not bracket_index:
         raise HTTPException(
             status_code=400,
             detail="級距表尚未匯入，請先至「級距表匯入」上傳 Excel 後再試算",
         )
-    bracket = await get_bracket_by_level(db, imp.id, insured_salary_level)
+    bracket = bracket_index.get(insured_salary_level)
     if not bracket:
         raise HTTPException(
             status_code=400,
@@ -150,7 +150,7 @@ async def estimate_by_bracket(
     total_employer = labor_employer + health_employer + occ + pension + group_employer
     total_employee = labor_employee + health_employee + group_employee
     total = total_employer + total_employee
-    imported_at_str = imp.imported_at.strftime("%Y-%m-%d %H:%M") if imp.imported_at else ""
+    imported_at_str = bracket_index.imported_at.strftime("%Y-%m-%d %H:%M") if bracket_index.imported_at else ""
     return {
         "insured_salary_level": insured_salary_level,
         "labor_insurance": ItemBreakdown(
@@ -168,7 +168,7 @@ async def estimate_by_bracket(
         "dependent_count": 0,
         "from_bracket_table": True,
         "bracket_source": {
-            "file_name": imp.file_name,
+            "file_name": bracket_index.file_name,
             "imported_at": imported_at_str,
         },
     }
@@ -1,6 +1,8 @@
 """巡邏管理 API：手機綁定、巡邏點、打點與巡邏紀錄匯出。"""
 from __future__ import annotations
 
+import asyncio
+import base64
 import hashlib
 import hmac
 import json
@@ -9,25 +11,25 @@ import uuid
 from datetime import date, datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 
-from io import BytesIO
 from urllib.parse import parse_qs, quote, urlparse
 
-from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
 from fastapi.responses import JSONResponse, StreamingResponse
-from openpyxl import Workbook
-from passlib.context import CryptContext
-from sqlalchemy import Select, and_, or_, func, select
+from sqlalchemy import Select, and_, or_, func, insert, select, tuple_
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import models, schemas
 from app.config import settings
 from app.database import get_db
+from app.services import password_pool, patrol_cache, patrol_cooldown, patrol_coverage, patrol_events, patrol_qr
+from app.utils.xlsx_stream import create_sheet, new_workbook, xlsx_streaming_response
 
 router = APIRouter(prefix="/api/patrol", tags=["patrol"])
 
 _PATROL_QR_SECRET = "patrol-qr-secret-change-me"
-_pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# 巡邏紀錄匯出：伺服器端游標每批筆數
+EXPORT_FETCH_SIZE = 1000
 
 
 def _client_ip(request: Request) -> str | None:
@@ -86,50 +88,74 @@ async def _get_device_by_token(db: AsyncSession, token: str) -> models.PatrolDev
     return device
 
 
-async def _resolve_point_from_qr(db: AsyncSession, qr_value: str) -> models.PatrolPoint:
+async def _get_checkin_device(db: AsyncSession, token: str) -> patrol_cache.CachedDevice:
+    """打卡用：同 _get_device_by_token，但走 patrol_cache 快取。"""
+    device = await patrol_cache.get_device_by_token(db, token)
+    if not device:
+        raise HTTPException(status_code=401, detail="設備憑證無效，請重新綁定")
+    if not device.is_active:
+        raise HTTPException(status_code=401, detail="此設備已解除綁定，請重新綁定")
+    return device
+
+
+def _parse_qr_value(qr_value: str) -> tuple[list[patrol_cache.PointLookup], HTTPException]:
+    """
+    解析 QR 內容為依序嘗試的巡邏點查詢條件，與全部查無時應回的錯誤；空白內容直接 raise HTTPException。
+    """
     v = (qr_value or "").strip()
     if not v:
         raise HTTPException(status_code=422, detail="QR 內容不可為空")
 
     parsed = urlparse(v)
-    if parsed.scheme:
-        path_parts = [p for p in (parsed.path or "").split("/") if p]
-        if len(path_parts) >= 3 and path_parts[-2] == "checkin":
-            public_id = path_parts[-1].strip()
-            if public_id:
-                point = await db.scalar(select(models.PatrolPoint).where(models.PatrolPoint.public_id == public_id))
-                if point:
-                    return point
-        q = parse_qs(parsed.query or "")
-        point_id_raw = (q.get("point_id") or [None])[0]
-        nonce = (q.get("nonce") or [None])[0]
-        sig = (q.get("sig") or [None])[0]
-        point_code_raw = (q.get("point_code") or [None])[0]
-        if point_id_raw and nonce and sig:
-            try:
-                point_id = int(point_id_raw)
-            except ValueError as exc:
-                raise HTTPException(status_code=422, detail="QR point_id 格式錯誤") from exc
-            expected = _sign_point_payload(point_id, nonce)
-            if not hmac.compare_digest(expected, sig):
-                raise HTTPException(status_code=400, detail="QR 驗章失敗，請使用系統產生之巡邏點 QR")
-            point = await db.get(models.PatrolPoint, point_id)
-            if not point:
-                raise HTTPException(status_code=404, detail="巡邏點不存在")
-            return point
-        if point_code_raw:
-            point = await db.scalar(select(models.PatrolPoint).where(models.PatrolPoint.point_code == point_code_raw.strip()))
-            if point:
-                return point
-        raise HTTPException(status_code=400, detail="無法解析巡邏點 QR")
-
-    point = await db.scalar(select(models.PatrolPoint).where(models.PatrolPoint.point_code == v))
-    if point:
-        return point
-    point = await db.scalar(select(models.PatrolPoint).where(models.PatrolPoint.public_id == v))
-    if point:
-        return point
-    raise HTTPException(status_code=404, detail="巡邏點不存在")
+    if not parsed.scheme:
+        return [("point_code", v), ("public_id", v)], HTTPException(status_code=404, detail="巡邏點不存在")
+
+    lookups: list[patrol_cache.PointLookup] = []
+    path_parts = [p for p in (parsed.path or "").split("/") if p]
+    if len(path_parts) >= 3 and path_parts[-2] == "checkin":
+        public_id = path_parts[-1].strip()
+        if public_id:
+            lookups.append(("public_id", public_id))
+    q = parse_qs(parsed.query or "")
+    point_id_raw = (q.get("point_id") or [None])[0]
+    nonce = (q.get("nonce") or [None])[0]
+    sig = (q.get("sig") or [None])[0]
+    point_code_raw = (q.get("point_code") or [None])[0]
+    if point_id_raw and nonce and sig:
+        # 驗章失敗時仍以路徑中的 public_id 為準；查無才回驗章錯誤
+        try:
+            point_id = int(point_id_raw)
+        except ValueError:
+            return lookups, HTTPException(status_code=422, detail="QR point_id 格式錯誤")
+        expected = _sign_point_payload(point_id, nonce)
+        if not hmac.compare_digest(expected, sig):
+            return lookups, HTTPException(status_code=400, detail="QR 驗章失敗，請使用系統產生之巡邏點 QR")
+        lookups.append(("id", point_id))
+        return lookups, HTTPException(status_code=404, detail="巡邏點不存在")
+    if point_code_raw:
+        lookups.append(("point_code", point_code_raw.strip()))
+    return lookups, HTTPException(status_code=400, detail="無法解析巡邏點 QR")
+
+
+async def _resolve_points_from_qr(
+    db: AsyncSession, qr_values: list[str]
+) -> list[patrol_cache.CachedPoint | HTTPException]:
+    """多筆 QR 一次解析；快取未命中者以單一查詢取回。無法解析或查無者以對應的 HTTPException 佔位。"""
+    parsed: list[tuple[list[patrol_cache.PointLookup], HTTPException]] = []
+    for qr_value in qr_values:
+        try:
+            parsed.append(_parse_qr_value(qr_value))
+        except HTTPException as exc:
+            parsed.append(([], exc))
+    points = await patrol_cache.get_points_bulk(db, [lookups for lookups, _ in parsed])
+    return [point or not_found for point, (_, not_found) in zip(points, parsed)]
+
+
+async def _resolve_point_from_qr(db: AsyncSession, qr_value: str) -> patrol_cache.CachedPoint:
+    point = (await _resolve_points_from_qr(db, [qr_value]))[0]
+    if isinstance(point, HTTPException):
+        raise point
+    return point
 
 
 DEFAULT_PATROL_SITE_NAME = "未分類(舊資料)"
@@ -241,6 +267,7 @@ async def _upsert_active_patrol_device(
     device.password_hash = password_hash
     device.is_active = True
     device.unbound_at = None
+    patrol_cache.invalidate_devices(db)
     return device
 
 
@@ -330,7 +357,7 @@ async def bind_device(
     client_ip = _client_ip(request)
     fingerprint.pop("ip", None)
     device_public_id = (body.device_public_id or "").strip() or str(uuid.uuid4())
-    password_hash = _pwd_context.hash(body.password.strip())
+    password_hash = await password_pool.hash_password(body.password.strip())
     employee_name = body.employee_name.strip()
     site_name = body.site_name.strip()
 
@@ -539,7 +566,7 @@ async def bind_device_by_public_id(
     fingerprint = body.device_fingerprint.model_dump()
     fingerprint.pop("ip", None)
     client_ip = _client_ip(request)
-    password_hash = _pwd_context.hash(body.password.strip())
+    password_hash = await password_pool.hash_password(body.password.strip())
 
     binding = await db.scalar(
         select(models.PatrolDeviceBinding).where(models.PatrolDeviceBinding.device_public_id == normalized_public_id)
@@ -609,7 +636,7 @@ async def bound_login(
     )
     if not device:
         raise HTTPException(status_code=404, detail="此裝置尚未綁定，請先完成綁定")
-    if not device.password_hash or not _pwd_context.verify(body.password.strip(), device.password_hash):
+    if not await password_pool.verify_password(body.password.strip(), device.password_hash):
         raise HTTPException(status_code=401, detail="密碼錯誤")
     return schemas.PatrolBoundLoginResponse(
         device_token=device.device_token,
@@ -634,7 +661,7 @@ async def login_by_device_public_id(
     )
     if not binding or not binding.is_bound:
         raise HTTPException(status_code=404, detail="此永久裝置尚未綁定，請先綁定")
-    if not binding.password_hash or not _pwd_context.verify(body.password.strip(), binding.password_hash):
+    if not await password_pool.verify_password(body.password.strip(), binding.password_hash):
         raise HTTPException(status_code=401, detail="密碼錯誤")
     if body.employee_name and binding.employee_name and body.employee_name.strip() != binding.employee_name:
         raise HTTPException(status_code=401, detail="員工姓名與綁定資料不符")
@@ -709,13 +736,13 @@ async def update_device_password_by_public_id(
         raise HTTPException(status_code=404, detail="device not found")
     if not binding.is_bound:
         raise HTTPException(status_code=404, detail="此永久裝置尚未綁定，請先綁定")
-    if not binding.password_hash or not _pwd_context.verify(body.current_password.strip(), binding.password_hash):
+    if not await password_pool.verify_password(body.current_password.strip(), binding.password_hash):
         raise HTTPException(status_code=401, detail="目前密碼錯誤")
     if body.employee_name and binding.employee_name and body.employee_name.strip() != binding.employee_name:
         raise HTTPException(status_code=401, detail="員工姓名與綁定資料不符")
 
     now = datetime.utcnow()
-    new_hash = _pwd_context.hash(body.new_password.strip())
+    new_hash = await password_pool.hash_password(body.new_password.strip())
     binding.password_hash = new_hash
     binding.last_seen_at = now
     await db.execute(
@@ -748,7 +775,7 @@ async def unbind_by_device_public_id(
         raise HTTPException(status_code=404, detail="device not found")
     if not binding.is_bound:
         raise HTTPException(status_code=404, detail="找不到有效綁定紀錄")
-    if not binding.password_hash or not _pwd_context.verify(body.password.strip(), binding.password_hash):
+    if not await password_pool.verify_password(body.password.strip(), binding.password_hash):
         raise HTTPException(status_code=401, detail="密碼錯誤，無法解除綁定")
     if body.employee_name and binding.employee_name and body.employee_name.strip() != binding.employee_name:
         raise HTTPException(status_code=401, detail="員工姓名與綁定資料不符")
@@ -763,6 +790,7 @@ async def unbind_by_device_public_id(
         )
         .values(is_active=False, unbound_at=now)
     )
+    patrol_cache.invalidate_devices(db)
     return schemas.PatrolUnbindResponse(success=True, message="解除綁定成功", unbound_at=now)
 
 
@@ -783,15 +811,54 @@ async def unbind_device(
     )
     if not device:
         raise HTTPException(status_code=404, detail="找不到有效綁定紀錄")
-    if not device.password_hash or not _pwd_context.verify(body.password.strip(), device.password_hash):
+    if not await password_pool.verify_password(body.password.strip(), device.password_hash):
         raise HTTPException(status_code=401, detail="密碼錯誤，無法解除綁定")
     now = datetime.utcnow()
     device.is_active = False
     device.unbound_at = now
     await db.flush()
+    patrol_cache.invalidate_devices(db)
     return schemas.PatrolUnbindResponse(success=True, message="解除綁定成功", unbound_at=now)
 
 
+@router.get("/metrics/password-hashing", summary="巡邏登入密碼雜湊延遲統計")
+async def password_hashing_metrics():
+    """bcrypt 雜湊/驗證的排隊（*_wait）與執行（*_run）時間直方圖，單位毫秒。"""
+    return password_pool.latency_stats()
+
+
+async def _latest_devices_by_public_id(db: AsyncSession, public_ids: list[str]) -> dict[str, models.PatrolDevice]:
+    """
+    各 device_public_id 最新（id 最大）的 PatrolDevice，單一查詢取回：
+    PostgreSQL 用 DISTINCT ON，其他資料庫（SQLite）用 ROW_NUMBER() 視窗函式。
+    """
+    ids = sorted({pid for pid in public_ids if pid})
+    if not ids:
+        return {}
+    conn = await db.connection()
+    if conn.dialect.name == "postgresql":
+        stmt = (
+            select(models.PatrolDevice)
+            .where(models.PatrolDevice.device_public_id.in_(ids))
+            .distinct(models.PatrolDevice.device_public_id)
+            .order_by(models.PatrolDevice.device_public_id, models.PatrolDevice.id.desc())
+        )
+    else:
+        ranked = (
+            select(
+                models.PatrolDevice.id,
+                func.row_number()
+                .over(partition_by=models.PatrolDevice.device_public_id, order_by=models.PatrolDevice.id.desc())
+                .label("rn"),
+            )
+            .where(models.PatrolDevice.device_public_id.in_(ids))
+            .subquery()
+        )
+        stmt = select(models.PatrolDevice).join(ranked, ranked.c.id == models.PatrolDevice.id).where(ranked.c.rn == 1)
+    devices = (await db.scalars(stmt)).all()
+    return {d.device_public_id: d for d in devices}
+
+
 @router.get("/device-bindings", response_model=schemas.PatrolDeviceBindingAdminListResponse, summary="後台查詢裝置綁定列表")
 async def list_device_bindings(
     query: str | None = Query(None),
@@ -835,15 +902,7 @@ async def list_device_bindings(
     stmt = stmt.order_by(models.PatrolDeviceBinding.bound_at.desc(), models.PatrolDeviceBinding.id.desc()).limit(limit).offset(offset)
     items = (await db.scalars(stmt)).all()
     total = int(await db.scalar(count_stmt) or 0)
-    latest_device_map: dict[str, models.PatrolDevice] = {}
-    for item in items:
-        device = await db.scalar(
-            select(models.PatrolDevice)
-            .where(models.PatrolDevice.device_public_id == item.device_public_id)
-            .order_by(models.PatrolDevice.id.desc())
-        )
-        if device:
-            latest_device_map[item.device_public_id] = device
+    latest_device_map = await _latest_devices_by_public_id(db, [i.device_public_id for i in items])
     return schemas.PatrolDeviceBindingAdminListResponse(
         items=[_binding_to_admin_item(i, latest_device_map.get(i.device_public_id)) for i in items],
         total=total,
@@ -859,7 +918,7 @@ async def admin_reset_device_binding_password(
     binding = await db.get(models.PatrolDeviceBinding, binding_id)
     if not binding:
         raise HTTPException(status_code=404, detail="裝置綁定不存在")
-    hashed = _pwd_context.hash(body.password.strip())
+    hashed = await password_pool.hash_password(body.password.strip())
     binding.password_hash = hashed
     if not binding.bound_at:
         binding.bound_at = datetime.utcnow()
@@ -897,6 +956,7 @@ async def admin_unbind_device_binding(
         .values(is_active=False, unbound_at=now)
     )
     await db.flush()
+    patrol_cache.invalidate_devices(db)
     return schemas.PatrolUnbindResponse(success=True, message="後台解除綁定成功", unbound_at=now)
 
 
@@ -937,6 +997,7 @@ async def create_point(
         await db.flush()
     except IntegrityError as exc:
         raise HTTPException(status_code=409, detail="巡邏點編號已存在") from exc
+    patrol_cache.invalidate_points(db)
     return _point_to_read(point)
 
 
@@ -966,6 +1027,7 @@ async def update_point(
         await db.flush()
     except IntegrityError as exc:
         raise HTTPException(status_code=409, detail="巡邏點編號已存在") from exc
+    patrol_cache.invalidate_points(db)
     return _point_to_read(point)
 
 
@@ -978,18 +1040,68 @@ async def delete_point(
     if not point:
         raise HTTPException(status_code=404, detail="巡邏點不存在")
     await db.delete(point)
+    await db.flush()
+    patrol_cache.invalidate_points(db)
 
 
-@router.get("/points/{public_id}/qr", response_model=schemas.PatrolPointQrRead, summary="取得巡邏點固定 QR URL")
-async def get_point_qr(
-    public_id: str,
-    db: AsyncSession = Depends(get_db),
-):
+async def _get_point_by_public_id(db: AsyncSession, public_id: str) -> models.PatrolPoint:
     point = await db.scalar(select(models.PatrolPoint).where(models.PatrolPoint.public_id == public_id.strip()))
     if not point and public_id.isdigit():
         point = await db.get(models.PatrolPoint, int(public_id))
     if not point:
         raise HTTPException(status_code=404, detail="巡邏點不存在")
+    return point
+
+
+def _qr_renderer_error(exc: patrol_qr.QrRendererUnavailable) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(exc))
+
+
+@router.get("/points/qr-sheet", summary="案場巡邏點 QR 貼紙 PDF（A4 多頁）")
+async def get_points_qr_sheet(
+    site_id: int = Query(..., description="案場 ID"),
+    include_inactive: bool = Query(False, description="是否包含停用巡邏點"),
+    db: AsyncSession = Depends(get_db),
+):
+    site = await db.get(models.Site, site_id)
+    if not site:
+        raise HTTPException(status_code=404, detail="案場不存在")
+    stmt = select(
+        models.PatrolPoint.public_id, models.PatrolPoint.point_code, models.PatrolPoint.point_name
+    ).where(models.PatrolPoint.site_id == site_id)
+    if not include_inactive:
+        stmt = stmt.where(models.PatrolPoint.is_active.is_(True))
+    rows = (await db.execute(stmt.order_by(models.PatrolPoint.point_code))).all()
+    if not rows:
+        raise HTTPException(status_code=404, detail="此案場沒有巡邏點")
+    try:
+        patrol_qr.ensure_renderer()
+    except patrol_qr.QrRendererUnavailable as exc:
+        raise _qr_renderer_error(exc)
+    entries = [(_build_point_checkin_url(public_id), point_code, point_name) for public_id, point_code, point_name in rows]
+
+    def _build_items() -> list[patrol_qr.SheetItem]:
+        return [
+            patrol_qr.SheetItem(matrix=patrol_qr.qr_matrix(url), title=point_code, subtitle=point_name)
+            for url, point_code, point_name in entries
+        ]
+
+    # QR 編碼為純 Python CPU 工作，整批移到執行緒，避免大案場阻塞 event loop
+    items = await asyncio.to_thread(_build_items)
+    filename = f"patrol_qr_site_{site_id}.pdf"
+    return StreamingResponse(
+        patrol_qr.iter_qr_sheet_pdf(items),
+        media_type="application/pdf",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/points/{public_id}/qr", response_model=schemas.PatrolPointQrRead, summary="取得巡邏點固定 QR URL")
+async def get_point_qr(
+    public_id: str,
+    db: AsyncSession = Depends(get_db),
+):
+    point = await _get_point_by_public_id(db, public_id)
     qr_url = _build_point_checkin_url(point.public_id)
     return schemas.PatrolPointQrRead(
         public_id=point.public_id,
@@ -999,13 +1111,169 @@ async def get_point_qr(
     )
 
 
+@router.get("/points/{public_id}/qr/image", summary="巡邏點 QR 圖檔（PNG / SVG，伺服器端快取）")
+async def get_point_qr_image(
+    public_id: str,
+    format: str = Query("png", pattern="^(png|svg)$", description="png 或 svg"),
+    db: AsyncSession = Depends(get_db),
+):
+    point = await _get_point_by_public_id(db, public_id)
+    try:
+        content, key = await asyncio.to_thread(
+            patrol_qr.render_point_qr, _build_point_checkin_url(point.public_id), format
+        )
+    except patrol_qr.QrRendererUnavailable as exc:
+        raise _qr_renderer_error(exc)
+    return Response(
+        content=content,
+        media_type=patrol_qr.QR_FORMATS[format],
+        headers={
+            "ETag": f'"{key}"',
+            "Cache-Control": "public, max-age=86400",
+            "Content-Disposition": f'inline; filename="patrol_point_{point.public_id}.{format}"',
+        },
+    )
+
+
+BATCH_CHECKIN_MAX_FUTURE_SECONDS = 300  # 容許設備時鐘快於伺服器的秒數
+
+
+def _log_to_checkin_response(log: models.PatrolLog) -> schemas.PatrolCheckinResponse:
+    return schemas.PatrolCheckinResponse(
+        id=log.id,
+        employee_id=log.employee_id,
+        employee_name=log.employee_name,
+        site_name=log.site_name,
+        point_code=log.point_code,
+        point_name=log.point_name,
+        checkin_date=log.checkin_date,
+        checkin_time=log.checkin_time,
+        checkin_ampm=log.checkin_ampm,
+        created_at=log.created_at,
+    )
+
+
+# 須在 /checkin/{public_id} 之前註冊，否則 "batch" 會被當成 public_id
+@router.post("/checkin/batch", response_model=schemas.PatrolBatchCheckinResponse, summary="離線掃碼批次補傳")
+async def checkin_batch(
+    body: schemas.PatrolBatchCheckinRequest,
+    authorization: str | None = Header(None, alias="Authorization"),
+    x_device_token: str | None = Header(None, alias="X-Device-Token"),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    設備離線期間累積的掃碼一次上傳：依設備時間由早到晚逐筆套用重複掃碼規則，
+    巡邏點以單一查詢解析、打卡紀錄以單一 INSERT 寫入；每筆結果依原請求順序回傳。
+    """
+    token = _extract_device_token(authorization, x_device_token)
+    device = await _get_checkin_device(db, token)
+    points = await _resolve_points_from_qr(db, [scan.qr_value for scan in body.scans])
+
+    latest_allowed = datetime.now(timezone.utc) + timedelta(seconds=BATCH_CHECKIN_MAX_FUTURE_SECONDS)
+    results: list[schemas.PatrolBatchCheckinItemResult | None] = [None] * len(body.scans)
+    pending: list[tuple[int, datetime, datetime, patrol_cache.CachedPoint]] = []
+    for index, scan in enumerate(body.scans):
+        point = points[index]
+        when_taipei = scan.timestamp
+        if when_taipei.tzinfo is None:
+            when_taipei = when_taipei.replace(tzinfo=TAIPEI)
+        else:
+            when_taipei = when_taipei.astimezone(TAIPEI)
+        when_utc = when_taipei.astimezone(timezone.utc)
+        error: HTTPException | None = None
+        if isinstance(point, HTTPException):
+            error = point
+        elif not point.is_active:
+            error = HTTPException(status_code=400, detail="此巡邏點已停用")
+        elif when_utc > latest_allowed:
+            error = HTTPException(status_code=422, detail="掃碼時間晚於伺服器時間，請校正設備時間")
+        if error is not None:
+            results[index] = schemas.PatrolBatchCheckinItemResult(
+                index=index, client_ref=scan.client_ref, status="error",
+                status_code=error.status_code, detail=str(error.detail),
+            )
+            continue
+        pending.append((index, when_taipei, when_utc, point))
+
+    # 依掃碼時間排序後逐筆判斷；同批已接受者先以本地紀錄判斷（尚未寫入 DB）
+    pending.sort(key=lambda item: item[2])
+    accepted_at: dict[int, datetime] = {}
+    rows: list[dict] = []
+    row_indexes: list[int] = []
+    for index, when_taipei, when_utc, point in pending:
+        scan = body.scans[index]
+        created_at = when_utc.replace(tzinfo=None)
+        dup = None
+        prev = accepted_at.get(point.id)
+        if prev is not None and (created_at - prev).total_seconds() < COOLDOWN_SECONDS:
+            remaining = int(COOLDOWN_SECONDS - (created_at - prev).total_seconds())
+            dup = {
+                "detail": "重複掃碼：請於 5 分鐘後再掃同一巡邏點",
+                "cooldown_seconds": max(1, remaining),
+                "last_scan_at": prev.replace(tzinfo=timezone.utc).isoformat(),
+            }
+        else:
+            dup = await _check_duplicate_scan(
+                db, device_id=device.id, employee_id=None, employee_name=device.employee_name,
+                point_id=point.id, now_utc=when_utc,
+            )
+        if dup:
+            results[index] = schemas.PatrolBatchCheckinItemResult(
+                index=index, client_ref=scan.client_ref, status="duplicate", status_code=429, **dup,
+            )
+            continue
+        accepted_at[point.id] = created_at
+        ampm = "早上" if when_taipei.hour < 12 else ("下午" if when_taipei.hour < 18 else "晚上")
+        rows.append({
+            "device_id": device.id,
+            "employee_id": None,
+            "point_id": point.id,
+            "site_id": point.site_id,
+            "employee_name": device.employee_name,
+            "site_name": device.site_name,
+            "point_code": point.point_code,
+            "point_name": point.point_name,
+            "checkin_date": when_utc.date(),
+            "checkin_time": when_utc.time().replace(microsecond=0),
+            "checkin_ampm": ampm,
+            "qr_value": scan.qr_value,
+            "device_info": device.device_fingerprint,
+            "created_at": created_at,
+        })
+        row_indexes.append(index)
+
+    if rows:
+        # sort_by_parameter_order：RETURNING 依 rows 順序回傳，可直接逐筆對應
+        ids = (
+            await db.execute(
+                insert(models.PatrolLog).returning(models.PatrolLog.id, sort_by_parameter_order=True),
+                rows,
+            )
+        ).scalars().all()
+        logs = [models.PatrolLog(id=log_id, **row) for log_id, row in zip(ids, rows)]
+        await _after_checkin_insert(db, logs)
+        for index, log in zip(row_indexes, logs):
+            results[index] = schemas.PatrolBatchCheckinItemResult(
+                index=index, client_ref=body.scans[index].client_ref, status="created", status_code=200,
+                log=_log_to_checkin_response(log),
+            )
+
+    done = [r for r in results if r is not None]
+    return schemas.PatrolBatchCheckinResponse(
+        created=sum(1 for r in done if r.status == "created"),
+        duplicates=sum(1 for r in done if r.status == "duplicate"),
+        errors=sum(1 for r in done if r.status == "error"),
+        results=done,
+    )
+
+
 @router.post("/checkin/{public_id}", response_model=schemas.PatrolCheckinResponse, summary="固定 public_id 掃碼打卡")
 async def checkin_by_public_id(
     public_id: str,
     body: schemas.PatrolPublicCheckinRequest,
     db: AsyncSession = Depends(get_db),
 ):
-    point = await db.scalar(select(models.PatrolPoint).where(models.PatrolPoint.public_id == public_id.strip()))
+    point = await patrol_cache.get_point_by_public_id(db, public_id.strip())
     if not point:
         raise HTTPException(status_code=404, detail="巡邏點不存在")
     if not point.is_active:
@@ -1027,6 +1295,8 @@ async def checkin_by_public_id(
     else:
         when_taipei = when_taipei.astimezone(TAIPEI)
     when_utc = when_taipei.astimezone(timezone.utc)
+    if when_utc > datetime.now(timezone.utc) + timedelta(seconds=BATCH_CHECKIN_MAX_FUTURE_SECONDS):
+        raise HTTPException(status_code=422, detail="掃碼時間晚於伺服器時間，請校正設備時間")
     dup = await _check_duplicate_scan(
         db, device_id=None, employee_id=employee_id, employee_name=employee_name,
         point_id=point.id, now_utc=when_utc,
@@ -1053,18 +1323,8 @@ async def checkin_by_public_id(
     )
     db.add(log)
     await db.flush()
-    return schemas.PatrolCheckinResponse(
-        id=log.id,
-        employee_id=log.employee_id,
-        employee_name=log.employee_name,
-        site_name=log.site_name,
-        point_code=log.point_code,
-        point_name=log.point_name,
-        checkin_date=log.checkin_date,
-        checkin_time=log.checkin_time,
-        checkin_ampm=log.checkin_ampm,
-        created_at=log.created_at,
-    )
+    await _after_checkin_insert(db, [log])
+    return _log_to_checkin_response(log)
 
 
 @router.post("/checkin", response_model=schemas.PatrolCheckinResponse, summary="巡邏打點")
@@ -1075,7 +1335,7 @@ async def checkin(
     db: AsyncSession = Depends(get_db),
 ):
     token = _extract_device_token(authorization, x_device_token)
-    device = await _get_device_by_token(db, token)
+    device = await _get_checkin_device(db, token)
     point = await _resolve_point_from_qr(db, body.qr_value)
 
     now_taipei = _now_taipei()
@@ -1105,18 +1365,8 @@ async def checkin(
     )
     db.add(log)
     await db.flush()
-    return schemas.PatrolCheckinResponse(
-        id=log.id,
-        employee_id=log.employee_id,
-        employee_name=log.employee_name,
-        site_name=log.site_name,
-        point_code=log.point_code,
-        point_name=log.point_name,
-        checkin_date=log.checkin_date,
-        checkin_time=log.checkin_time,
-        checkin_ampm=log.checkin_ampm,
-        created_at=log.created_at,
-    )
+    await _after_checkin_insert(db, [log])
+    return _log_to_checkin_response(log)
 
 
 def _apply_log_filters(
@@ -1126,8 +1376,11 @@ def _apply_log_filters(
     employee_name: str | None,
     site_name: str | None,
     point_code: str | None,
+    site_id: int | None = None,
 ) -> Select[tuple[models.PatrolLog]]:
     conds = []
+    if site_id is not None:
+        conds.append(models.PatrolLog.site_id == site_id)
     if date_from:
         conds.append(models.PatrolLog.checkin_date >= date_from)
     if date_to:
@@ -1158,20 +1411,23 @@ def _log_checkin_at_taiwan(log: models.PatrolLog) -> datetime:
     return utc_dt.astimezone(TAIPEI)
 
 
-COOLDOWN_SECONDS = 300  # 5 分鐘內同人同一巡邏點不可重複掃碼
+COOLDOWN_SECONDS = patrol_cooldown.COOLDOWN_SECONDS  # 5 分鐘內同人同一巡邏點不可重複掃碼
 
 
-async def _check_duplicate_scan(
+async def _last_scan_from_db(
     db: AsyncSession,
     *,
     device_id: int | None,
     employee_id: int | None,
     employee_name: str,
     point_id: int,
-    now_utc: datetime,
-) -> dict | None:
-    """若 5 分鐘內有同人同一巡邏點紀錄，回傳錯誤內容 dict；否則回傳 None。"""
-    stmt = select(models.PatrolLog).where(models.PatrolLog.point_id == point_id)
+    before: datetime,
+) -> datetime | None:
+    """同人同一巡邏點在 before（含）之前的最近一次掃碼時間。"""
+    stmt = select(models.PatrolLog.created_at).where(
+        models.PatrolLog.point_id == point_id,
+        models.PatrolLog.created_at <= before,
+    )
     if device_id is not None:
         stmt = stmt.where(models.PatrolLog.device_id == device_id)
     else:
@@ -1184,14 +1440,45 @@ async def _check_duplicate_scan(
                 models.PatrolLog.employee_name == employee_name,
             )
     stmt = stmt.order_by(models.PatrolLog.created_at.desc()).limit(1)
-    last = await db.scalar(stmt)
-    if not last or not last.created_at:
+    return await db.scalar(stmt)
+
+
+async def _check_duplicate_scan(
+    db: AsyncSession,
+    *,
+    device_id: int | None,
+    employee_id: int | None,
+    employee_name: str,
+    point_id: int,
+    now_utc: datetime,
+) -> dict | None:
+    """
+    若掃碼前 5 分鐘內有同人同一巡邏點紀錄，回傳錯誤內容 dict；否則回傳 None。
+    由 patrol_cooldown.tracker 以記憶體判斷；追蹤尚未預熱、或掃碼時間不在追蹤範圍內（離線補傳）時才查 DB。
+    """
+    tracker = patrol_cooldown.tracker
+    key = patrol_cooldown.cooldown_key(
+        device_id=device_id, employee_id=employee_id, employee_name=employee_name, point_id=point_id,
+    )
+    now_naive = now_utc.replace(tzinfo=None)
+    last_at = tracker.last_scan(key, now_naive)
+    # 只計掃碼時間（含）之前的紀錄；追蹤只保留最晚一筆，晚於本次者（離線補傳）需回 DB 查
+    out_of_order = last_at is not None and last_at > now_naive
+    in_window = now_naive >= datetime.utcnow() - tracker.cooldown
+    if out_of_order or (last_at is None and not (tracker.is_warm and in_window)):
+        last_at = await _last_scan_from_db(
+            db, device_id=device_id, employee_id=employee_id, employee_name=employee_name,
+            point_id=point_id, before=now_naive,
+        )
+        if last_at is not None:
+            tracker.record(key, last_at)
+    if last_at is None:
         return None
-    delta = (now_utc.replace(tzinfo=None) - last.created_at).total_seconds()
+    delta = (now_naive - last_at).total_seconds()
     if delta >= COOLDOWN_SECONDS:
         return None
     remaining = int(COOLDOWN_SECONDS - delta)
-    last_utc = last.created_at
+    last_utc = last_at
     if last_utc.tzinfo is None:
         last_utc = last_utc.replace(tzinfo=timezone.utc)
     return {
@@ -1201,6 +1488,45 @@ async def _check_duplicate_scan(
     }
 
 
+def _record_scan(db: AsyncSession, log: models.PatrolLog) -> None:
+    """打卡寫入後更新冷卻追蹤（commit 後才生效）。"""
+    patrol_cooldown.queue_scan(
+        db,
+        patrol_cooldown.cooldown_key(
+            device_id=log.device_id,
+            employee_id=log.employee_id,
+            employee_name=log.employee_name,
+            point_id=log.point_id,
+        ),
+        log.created_at,
+    )
+
+
+def _log_event_payload(log: models.PatrolLog) -> dict:
+    """即時事件內容：與 PatrolLogRead 相同欄位，另含 site_id / point_id 供訂閱端篩選。"""
+    read = schemas.PatrolLogRead(
+        id=log.id,
+        employee_name=log.employee_name,
+        site_name=log.site_name,
+        point_code=log.point_code,
+        point_name=log.point_name,
+        checkin_date=log.checkin_date,
+        checkin_time=log.checkin_time,
+        checkin_ampm=log.checkin_ampm,
+        created_at=log.created_at,
+        checkin_at=_log_checkin_at_taiwan(log),
+    )
+    return {**read.model_dump(mode="json"), "site_id": log.site_id, "point_id": log.point_id}
+
+
+async def _after_checkin_insert(db: AsyncSession, logs: list[models.PatrolLog]) -> None:
+    """打卡寫入後：累加覆蓋彙總、暫存冷卻追蹤與即時事件（皆於 commit 後才生效）。"""
+    await patrol_coverage.record_logs(db, logs)
+    for log in logs:
+        _record_scan(db, log)
+        patrol_events.queue_checkin_event(db, _log_event_payload(log))
+
+
 def _period_and_time_12h(dt: datetime) -> tuple[str, str]:
     """依 Asia/Taipei 回傳 (早上/下午/晚上, 12 小時制 hh:mm:ss)。"""
     if dt.tzinfo is None:
@@ -1221,19 +1547,56 @@ def _period_and_time_12h(dt: datetime) -> tuple[str, str]:
     return period, time_12h
 
 
+LOG_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _encode_log_cursor(log: models.PatrolLog) -> str:
+    """不透明游標：(created_at, id) 的 base64url JSON。"""
+    raw = json.dumps([log.created_at.isoformat(), log.id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_log_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at_raw, log_id = json.loads(raw)
+        return datetime.fromisoformat(created_at_raw), int(log_id)
+    except (ValueError, TypeError) as exc:
+        raise HTTPException(status_code=400, detail="cursor 格式錯誤") from exc
+
+
 @router.get("/logs", response_model=list[schemas.PatrolLogRead], summary="巡邏紀錄列表")
 async def list_logs(
+    response: Response,
     date_from: date | None = Query(None),
     date_to: date | None = Query(None),
     employee_name: str | None = Query(None),
     site_name: str | None = Query(None),
     point_code: str | None = Query(None),
+    site_id: int | None = Query(None),
+    cursor: str | None = Query(None, description="上一頁回應標頭 X-Next-Cursor 的值；未帶為第一頁"),
     limit: int = Query(500, ge=1, le=5000),
     db: AsyncSession = Depends(get_db),
 ):
-    stmt: Select[tuple[models.PatrolLog]] = select(models.PatrolLog).order_by(models.PatrolLog.created_at.desc()).limit(limit)
-    stmt = _apply_log_filters(stmt, date_from, date_to, employee_name, site_name, point_code)
+    """
+    依 (created_at, id) 由新到舊 keyset 分頁：多取一筆判斷是否還有下一頁，
+    有則於標頭 X-Next-Cursor 回傳游標；每頁成本與翻到第幾頁無關（索引 ix_patrol_logs_created_at_id）。
+    """
+    stmt: Select[tuple[models.PatrolLog]] = (
+        select(models.PatrolLog)
+        .order_by(models.PatrolLog.created_at.desc(), models.PatrolLog.id.desc())
+        .limit(limit + 1)
+    )
+    stmt = _apply_log_filters(stmt, date_from, date_to, employee_name, site_name, point_code, site_id)
+    if cursor:
+        after_created_at, after_id = _decode_log_cursor(cursor)
+        stmt = stmt.where(
+            tuple_(models.PatrolLog.created_at, models.PatrolLog.id) < tuple_(after_created_at, after_id)
+        )
     items = (await db.scalars(stmt)).all()
+    if len(items) > limit:
+        items = items[:limit]
+        response.headers[LOG_CURSOR_HEADER] = _encode_log_cursor(items[-1])
     result = []
     for r in items:
         checkin_at = _log_checkin_at_taiwan(r)
@@ -1254,6 +1617,96 @@ async def list_logs(
     return result
 
 
+# SSE 心跳間隔（秒）：保持連線並偵測用戶端離線
+LOG_STREAM_KEEPALIVE_SECONDS = 15
+
+
+def _sse_message(payload: dict) -> str:
+    return f"id: {payload['id']}\nevent: checkin\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@router.get("/logs/stream", summary="巡邏打卡即時事件（SSE）")
+async def stream_logs(
+    request: Request,
+    site_id: int | None = Query(None, description="僅推送此案場的打卡"),
+):
+    """Server-Sent Events：每筆成功寫入（commit 後）的打卡推送一則 checkin 事件，不查詢資料庫。"""
+    subscription = patrol_events.broker.subscribe(site_id=site_id)
+
+    async def events():
+        with subscription:
+            yield "retry: 3000\n\n"
+            while True:
+                payload = await subscription.get(timeout=LOG_STREAM_KEEPALIVE_SECONDS)
+                if await request.is_disconnected():
+                    break
+                yield _sse_message(payload) if payload is not None else ": keepalive\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/coverage", response_model=schemas.PatrolCoverageRead, summary="巡邏覆蓋月報（巡邏點 × 日期 × 時段）")
+async def get_coverage(
+    site_id: int = Query(...),
+    year: int = Query(..., ge=2000, le=2100),
+    month: int = Query(..., ge=1, le=12),
+    db: AsyncSession = Depends(get_db),
+):
+    """由 patrol_coverage_daily 彙總表組出案場當月覆蓋矩陣；不掃描原始 patrol_logs。"""
+    first_day = date(year, month, 1)
+    last_day = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    points = (
+        await db.scalars(
+            select(models.PatrolPoint).where(models.PatrolPoint.site_id == site_id).order_by(models.PatrolPoint.point_code)
+        )
+    ).all()
+    coverage = (
+        await db.scalars(
+            select(models.PatrolCoverageDaily)
+            .where(
+                models.PatrolCoverageDaily.site_id == site_id,
+                models.PatrolCoverageDaily.scan_date >= first_day,
+                models.PatrolCoverageDaily.scan_date <= last_day,
+            )
+            .order_by(models.PatrolCoverageDaily.scan_date)
+        )
+    ).all()
+    period_order = {p: i for i, p in enumerate(patrol_coverage.PERIODS)}
+    cells_by_point: dict[int, list[schemas.PatrolCoverageCell]] = {}
+    for row in sorted(coverage, key=lambda r: (r.scan_date, period_order.get(r.period, len(period_order)))):
+        cells_by_point.setdefault(row.point_id, []).append(
+            schemas.PatrolCoverageCell(
+                scan_date=row.scan_date,
+                period=row.period,
+                scan_count=row.scan_count,
+                first_scan=row.first_scan,
+                last_scan=row.last_scan,
+            )
+        )
+    return schemas.PatrolCoverageRead(
+        site_id=site_id,
+        year=year,
+        month=month,
+        days=[first_day + timedelta(days=i) for i in range((last_day - first_day).days + 1)],
+        periods=list(patrol_coverage.PERIODS),
+        points=[
+            schemas.PatrolCoveragePoint(
+                point_id=p.id,
+                point_code=p.point_code,
+                point_name=p.point_name,
+                is_active=bool(p.is_active),
+                covered_slots=len(cells_by_point.get(p.id, [])),
+                cells=cells_by_point.get(p.id, []),
+            )
+            for p in points
+        ],
+    )
+
+
 @router.get("/logs/export/excel", summary="匯出巡邏紀錄 Excel")
 async def export_logs_excel(
     date_from: date | None = Query(None),
@@ -1265,13 +1718,14 @@ async def export_logs_excel(
 ):
     stmt: Select[tuple[models.PatrolLog]] = select(models.PatrolLog).order_by(models.PatrolLog.created_at.desc()).limit(100000)
     stmt = _apply_log_filters(stmt, date_from, date_to, employee_name, site_name, point_code)
-    items = (await db.scalars(stmt)).all()
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "巡邏紀錄"
-    ws.append(["員工名稱", "日期", "時段", "時間(12小時制)", "案場", "巡邏點編號", "巡邏點名稱"])
-    for r in items:
+    stmt = stmt.execution_options(yield_per=EXPORT_FETCH_SIZE)
+
+    # write-only 工作簿 + 伺服器端游標逐批讀取：記憶體只保留一批紀錄，與匯出列數無關
+    headers = ["員工名稱", "日期", "時段", "時間(12小時制)", "案場", "巡邏點編號", "巡邏點名稱"]
+    wb = new_workbook()
+    ws = create_sheet(wb, "巡邏紀錄", column_count=len(headers), width=18)
+    ws.append(headers)
+    async for r in await db.stream_scalars(stmt):
         checkin_at = _log_checkin_at_taiwan(r)
         period, time_12h = _period_and_time_12h(checkin_at)
         ws.append([
@@ -1283,14 +1737,7 @@ async def export_logs_excel(
             r.point_code,
             r.point_name,
         ])
-    for col in ws.columns:
-        ws.column_dimensions[col[0].column_letter].width = 18
-    buf = BytesIO()
-    wb.save(buf)
-    buf.seek(0)
+        # 已寫出的 ORM 物件不再需要，避免 identity map 隨列數成長
+        db.expunge(r)
     filename = f"patrol_logs_{date.today().isoformat()}.xlsx"
-    return StreamingResponse(
-        buf,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename={filename}"},
-    )
+    return await xlsx_streaming_response(wb, f"attachment; filename={filename}")
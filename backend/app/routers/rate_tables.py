@@ -12,6 +12,7 @@ from app.database import get_db
 from app import crud
 from app.crud import RATE_TABLE_TYPES, get_effective_rate_table
 from app.models import RateTable, RateItem
+from app.services.insurance_rules_cache import mark_rules_dirty
 from app.schemas import RateTableRead, RateItemRead, RateTableImportPayload, RateTableImportTable, RateTableImportItem
 
 router = APIRouter(prefix="/api/rate-tables", tags=["rate-tables"])
@@ -171,6 +172,7 @@ async def import_rate_tables(
             )
         await db.flush()
         created_ids.append(tbl.id)
+    mark_rules_dirty(db)
     await db.commit()
     # 重新載入含 items 的完整資料
     result = []
@@ -1,20 +1,24 @@
 """
 健保分攤/減免規則：依 config/health_reduction_rules.yaml 套用，可擴充。
 回傳每人適用之倍率（0~1）與套用規則說明，不寫死在頁面。
+規則檔解析後編譯為 CompiledRuleSet（城市集合、身障等級→倍率對照）快取於行程內，檔案 mtime 變更才重新載入。
 """
+from dataclasses import dataclass
 from pathlib import Path
 from datetime import date
-from typing import Optional, List, Dict, Any, Tuple
+from types import MappingProxyType
+from typing import Optional, List, Dict, Any, Tuple, FrozenSet, Mapping, Sequence
 from decimal import Decimal
 import yaml
 
+# 從 app/rules 往上一層到 app、再往上一層到 backend，取 config
+RULES_YAML_PATH = Path(__file__).resolve().parents[2] / "config" / "health_reduction_rules.yaml"
+
 
 def _load_rules() -> list:
-    # 從 app/rules 往上一層到 app、再往上一層到 backend，取 config
-    path = Path(__file__).resolve().parents[2] / "config" / "health_reduction_rules.yaml"
-    if not path.exists():
+    if not RULES_YAML_PATH.exists():
         return _default_rules()
-    with open(path, "r", encoding="utf-8") as f:
+    with open(RULES_YAML_PATH, "r", encoding="utf-8") as f:
         data = yaml.safe_load(f) or {}
     return data.get("rules", _default_rules())
 
@@ -49,40 +53,125 @@ def _age_at(birth_date: Optional[date], at: date) -> Optional[int]:
     return age
 
 
-def _rule_applies_to_person(rule: dict, is_employee: bool) -> bool:
-    at = rule.get("applies_to", "both")
-    if at == "both":
-        return True
-    if at == "employee_only":
-        return is_employee
-    if at == "dependent_only":
-        return not is_employee
-    return True
-
-
-def _condition_match(rule: dict, is_employee: bool, birth_date: Optional[date], city: Optional[str], disability_level: Optional[str], at_date: date) -> bool:
-    cond = rule.get("condition") or {}
-    ctype = cond.get("type")
-    if ctype == "senior_in_cities":
-        if is_employee:
+_APPLIES_TO = {"employee_only": (True, False), "dependent_only": (False, True)}
+
+
+@dataclass(frozen=True)
+class CompiledRule:
+    """單條規則預先解析：適用對象、條件型別與參數、倍率。"""
+    name: str
+    for_employee: bool
+    for_dependent: bool
+    condition: Optional[str]
+    min_age: int
+    cities: FrozenSet[str]
+    levels: FrozenSet[str]  # has_disability_level 條件：result_by_level 的等級
+    fixed_multiplier: Optional[Decimal]  # 有 result 時為固定倍率
+    by_level: Mapping[str, Decimal]
+    default_multiplier: Decimal
+
+    @classmethod
+    def compile(cls, rule: dict) -> "CompiledRule":
+        cond = rule.get("condition") or {}
+        by_level = {str(k): Decimal(str(v)) for k, v in (rule.get("result_by_level") or {}).items()}
+        for_employee, for_dependent = _APPLIES_TO.get(rule.get("applies_to", "both"), (True, True))
+        return cls(
+            name=rule.get("name", rule.get("id", "")),
+            for_employee=for_employee,
+            for_dependent=for_dependent,
+            condition=cond.get("type"),
+            min_age=cond.get("min_age", 65),
+            cities=frozenset(cond.get("cities") or []),
+            levels=frozenset(by_level),
+            fixed_multiplier=Decimal(str(rule["result"].get("multiplier", 1))) if "result" in rule else None,
+            by_level=MappingProxyType(by_level),
+            default_multiplier=Decimal(str(rule.get("default_multiplier", 1))),
+        )
+
+    def matches(self, is_employee: bool, birth_date: Optional[date], city: Optional[str], disability_level: Optional[str], at_date: date) -> bool:
+        if not (self.for_employee if is_employee else self.for_dependent):
             return False
-        age = _age_at(birth_date, at_date)
-        if age is None:
-            return False
-        cities = cond.get("cities") or []
-        return age >= cond.get("min_age", 65) and (city or "") in cities
-    if ctype == "has_disability_level":
-        return bool(disability_level and (disability_level in (rule.get("result_by_level") or {})))
-    return False
+        if self.condition == "senior_in_cities":
+            if is_employee:
+                return False
+            age = _age_at(birth_date, at_date)
+            return age is not None and age >= self.min_age and (city or "") in self.cities
+        if self.condition == "has_disability_level":
+            return bool(disability_level) and disability_level in self.levels
+        return False
+
+    def multiplier(self, disability_level: Optional[str]) -> Decimal:
+        if self.fixed_multiplier is not None:
+            return self.fixed_multiplier
+        if disability_level and disability_level in self.by_level:
+            return self.by_level[disability_level]
+        return self.default_multiplier
+
+
+PersonKey = Tuple[bool, Optional[date], Optional[str], Optional[str]]  # (本人, 出生日, 縣市, 身障等級)
+
+
+@dataclass(frozen=True)
+class CompiledRuleSet:
+    rules: Tuple[CompiledRule, ...]
+    raw: Tuple[Dict[str, Any], ...]
+
+    def evaluate(
+        self,
+        is_employee: bool,
+        birth_date: Optional[date],
+        city: Optional[str],
+        disability_level: Optional[str],
+        at_date: date,
+    ) -> Tuple[Decimal, List[str]]:
+        """多條符合時取倍率最低（最優），並記錄所有套用的規則名稱；未套用任何規則回傳 1。"""
+        best = Decimal("1")
+        names: List[str] = []
+        for rule in self.rules:
+            if rule.matches(is_employee, birth_date, city, disability_level, at_date):
+                best = min(best, rule.multiplier(disability_level))
+                names.append(rule.name)
+        if not names:
+            return (Decimal("1"), [])
+        return (best, names)
+
+    def evaluate_many(self, persons: Sequence[PersonKey], at_date: date) -> List[Tuple[Decimal, List[str]]]:
+        """多人一次判斷；相同 (本人, 出生日, 縣市, 身障等級) 只判斷一次。"""
+        seen: Dict[PersonKey, Tuple[Decimal, List[str]]] = {}
+        out = []
+        for person in persons:
+            key = tuple(person)
+            result = seen.get(key)
+            if result is None:
+                result = seen[key] = self.evaluate(*key, at_date)
+            out.append((result[0], list(result[1])))
+        return out
+
+
+def compile_rules(raw_rules: list) -> CompiledRuleSet:
+    return CompiledRuleSet(
+        rules=tuple(CompiledRule.compile(r) for r in raw_rules),
+        raw=tuple(raw_rules),
+    )
+
+
+_compiled: Optional[Tuple[Optional[int], CompiledRuleSet]] = None
+
+
+def _rules_mtime() -> Optional[int]:
+    try:
+        return RULES_YAML_PATH.stat().st_mtime_ns
+    except OSError:
+        return None
 
 
-def _get_multiplier(rule: dict, disability_level: Optional[str]) -> Decimal:
-    if "result" in rule:
-        return Decimal(str(rule["result"].get("multiplier", 1)))
-    by_level = rule.get("result_by_level") or {}
-    if disability_level and disability_level in by_level:
-        return Decimal(str(by_level[disability_level]))
-    return Decimal(str(rule.get("default_multiplier", 1)))
+def get_compiled_rules() -> CompiledRuleSet:
+    """取得編譯後規則；規則檔 mtime（或存在與否）未變更時直接回傳快取。"""
+    global _compiled
+    mtime = _rules_mtime()
+    if _compiled is None or _compiled[0] != mtime:
+        _compiled = (mtime, compile_rules(_load_rules()))
+    return _compiled[1]
 
 
 def apply_health_reduction(
@@ -96,26 +185,20 @@ def apply_health_reduction(
     套用健保減免規則，回傳 (個人負擔倍率 0~1, 套用規則名稱列表)。
     多條符合時取倍率最低（最優），並記錄所有套用的規則名稱。
     """
-    at_date = at_date or date.today()
-    rules = _load_rules()
-    best_multiplier = Decimal("1")
-    applied_names: List[str] = []
-
-    for rule in rules:
-        if not _rule_applies_to_person(rule, is_employee):
-            continue
-        if not _condition_match(rule, is_employee, birth_date, city, disability_level, at_date):
-            continue
-        mult = _get_multiplier(rule, disability_level)
-        best_multiplier = min(best_multiplier, mult)
-        applied_names.append(rule.get("name", rule.get("id", "")))
-
-    # 若未套用任何規則，回傳 1（無減免）
-    if not applied_names:
-        return (Decimal("1"), [])
-    return (best_multiplier, applied_names)
+    return get_compiled_rules().evaluate(is_employee, birth_date, city, disability_level, at_date or date.today())
+
+
+def apply_health_reduction_many(
+    persons: Sequence[PersonKey],
+    at_date: Optional[date] = None,
+) -> List[Tuple[Decimal, List[str]]]:
+    """
+    多人版 apply_health_reduction：persons 每筆為 (is_employee, birth_date, city, disability_level)，
+    回傳順序與輸入相同；規則只取一次，相同條件的人只判斷一次。
+    """
+    return get_compiled_rules().evaluate_many(persons, at_date or date.today())
 
 
 def get_health_reduction_rules() -> List[Dict[str, Any]]:
     """取得目前載入之健保減免規則（供後台檢視/擴充）"""
-    return _load_rules()
+    return list(get_compiled_rules().raw)
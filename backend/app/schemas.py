@@ -1112,6 +1112,39 @@ class PatrolCheckinResponse(BaseModel):
     created_at: datetime
 
 
+PATROL_BATCH_CHECKIN_MAX_ITEMS = 500
+
+
+class PatrolBatchCheckinItem(BaseModel):
+    qr_value: str = Field(..., min_length=1, max_length=1000)
+    """掃碼當下的設備時間；未帶時區視為 Asia/Taipei"""
+    timestamp: datetime
+    client_ref: Optional[str] = Field(None, max_length=100)
+
+
+class PatrolBatchCheckinRequest(BaseModel):
+    scans: List[PatrolBatchCheckinItem] = Field(..., min_length=1, max_length=PATROL_BATCH_CHECKIN_MAX_ITEMS)
+
+
+class PatrolBatchCheckinItemResult(BaseModel):
+    """index 為請求 scans 中的位置；status：created / duplicate / error，status_code 同單筆打卡端點"""
+    index: int
+    client_ref: Optional[str] = None
+    status: str
+    status_code: int
+    detail: Optional[str] = None
+    cooldown_seconds: Optional[int] = None
+    last_scan_at: Optional[str] = None
+    log: Optional[PatrolCheckinResponse] = None
+
+
+class PatrolBatchCheckinResponse(BaseModel):
+    created: int
+    duplicates: int
+    errors: int
+    results: List[PatrolBatchCheckinItemResult]
+
+
 class PatrolLogRead(BaseModel):
     id: int
     employee_name: str
@@ -1125,3 +1158,41 @@ class PatrolLogRead(BaseModel):
     """完整打點時間（Asia/Taipei），前端依此顯示早上/下午/晚上與 12 小時制時間"""
     checkin_at: Optional[datetime] = None
     model_config = ConfigDict(from_attributes=True)
+
+
+class PatrolCoverageCell(BaseModel):
+    scan_date: date
+    period: str
+    scan_count: int
+    first_scan: datetime
+    last_scan: datetime
+
+
+class PatrolCoveragePoint(BaseModel):
+    point_id: int
+    point_code: str
+    point_name: str
+    is_active: bool
+    """有掃碼的 (日期, 時段) 格數；未列於 cells 者即漏巡"""
+    covered_slots: int
+    cells: List[PatrolCoverageCell]
+
+
+class PatrolCoverageRead(BaseModel):
+    site_id: int
+    year: int
+    month: int
+    days: List[date]
+    periods: List[str]
+    points: List[PatrolCoveragePoint]
+
+
+# ---------- 傻瓜會計：單一員工/案場重算 ----------
+class SecurityPayrollRecalculateRequest(BaseModel):
+    """以已保存的時數明細重算指定員工（及指定案場內所有員工）之當月薪資。"""
+    year: int
+    month: int = Field(..., ge=1, le=12)
+    payroll_type: str = "security"
+    employees: List[str] = Field(default_factory=list, description="員工姓名")
+    sites: List[str] = Field(default_factory=list, description="案場名稱；該案場出現過的員工全部重算（含其他案場）")
+    extra_payroll_types: Optional[List[str]] = Field(None, description="跨公司查找員工類型；未提供時沿用該月份最近一次上傳所用設定")
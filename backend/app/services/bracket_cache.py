@@ -0,0 +1,186 @@
+"""
+級距表（insurance_brackets）行程內索引：以 InsuranceBracketImport.id 為 key，每次匯入只建一次
+「投保級距 → 不可變級距資料」對照表，取代逐級距 SELECT。create_bracket_import 時失效。
+另提供 BracketIndex：薪資 → 投保級距，以 bisect 查排序後的級距下限，取代逐級距線性比對。
+"""
+import bisect
+from array import array
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from functools import cached_property
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+# 最新匯入級距表之最高級距上限（與 /api/insurance/brackets 一致）
+TOP_BRACKET_HIGH = 999999
+
+
+class BracketIndex:
+    """
+    薪資 → 投保級距索引（不可變）。lows 為排序後的級距下限（array），highs / levels 依相同順序；
+    薪資低於第一級、落在級距間空隙、高於最後一級時分別回傳 below / gap / above。
+    假設級距區間互不重疊（重疊時取下限最大且涵蓋該薪資者）。
+    """
+    __slots__ = ("lows", "highs", "levels", "below", "gap", "above")
+
+    def __init__(
+        self,
+        ranges: Iterable[Tuple[float, float, Decimal]],
+        below: Optional[Decimal],
+        gap: Optional[Decimal],
+        above: Optional[Decimal],
+    ) -> None:
+        ordered = sorted(ranges, key=lambda r: r[0])
+        self.lows = array("d", (r[0] for r in ordered))
+        self.highs = array("d", (r[1] for r in ordered))
+        self.levels: Tuple[Decimal, ...] = tuple(r[2] for r in ordered)
+        self.below, self.gap, self.above = below, gap, above
+
+    @classmethod
+    def from_rules(cls, brackets: Sequence[Sequence[Any]]) -> "BracketIndex":
+        """rules 的 [ (low, high, level), ... ]：找不到對應區間時一律取最後一筆的級距（同原線性比對）。"""
+        ranges = [(float(low), float(high), Decimal(str(level))) for low, high, level in brackets]
+        fallback = Decimal(str(brackets[-1][2])) if brackets else None
+        return cls(ranges, below=fallback, gap=fallback, above=fallback)
+
+    @classmethod
+    def from_levels(cls, levels: Sequence[int]) -> "BracketIndex":
+        """匯入級距表的級距清單：區間為 (前一級+1) ~ 本級（首筆自 1、末筆至 TOP_BRACKET_HIGH）；過低取首級、過高取末級。"""
+        levels = sorted(levels)
+        ranges = [
+            (1 if i == 0 else levels[i - 1] + 1, level if i < len(levels) - 1 else TOP_BRACKET_HIGH, Decimal(level))
+            for i, level in enumerate(levels)
+        ]
+        first = Decimal(levels[0]) if levels else None
+        last = Decimal(levels[-1]) if levels else None
+        return cls(ranges, below=first, gap=first, above=last)
+
+    def lookup(self, salary: Any) -> Optional[Decimal]:
+        """薪資對應級距；索引為空時回傳 None。"""
+        if not self.levels:
+            return None
+        s = float(salary)
+        i = bisect.bisect_right(self.lows, s) - 1
+        if i < 0:
+            return self.below
+        if s <= self.highs[i]:
+            return self.levels[i]
+        return self.above if i == len(self.levels) - 1 else self.gap
+
+    def lookup_many(self, salaries: Iterable[Any]) -> List[Optional[Decimal]]:
+        return [self.lookup(s) for s in salaries]
+
+    def ranges(self) -> List[Tuple[float, float, Decimal]]:
+        """依下限排序的 [ (low, high, level), ... ]，即 lookup 實際使用的區間。"""
+        return list(zip(self.lows, self.highs, self.levels))
+
+    def __len__(self) -> int:
+        return len(self.levels)
+
+    def __bool__(self) -> bool:
+        return bool(self.levels)
+
+
+@dataclass(frozen=True)
+class BracketRecord:
+    """單一級距之各項金額（與 InsuranceBracket 欄位同名，供既有程式直接取用）。"""
+    insured_salary_level: int
+    labor_employer: Decimal
+    labor_employee: Decimal
+    health_employer: Decimal
+    health_employee: Decimal
+    occupational_accident: Decimal
+    labor_pension: Decimal
+    group_insurance: Decimal
+
+
+@dataclass(frozen=True)
+class BracketLevelIndex:
+    """某次匯入的完整級距表；by_level 為唯讀對照。"""
+    import_id: int
+    file_name: str
+    imported_at: Optional[datetime]
+    by_level: Mapping[int, BracketRecord]
+
+    def get(self, insured_salary_level: int) -> Optional[BracketRecord]:
+        return self.by_level.get(int(insured_salary_level))
+
+    @property
+    def levels(self) -> list[int]:
+        return sorted(self.by_level.keys())
+
+    @cached_property
+    def salary_index(self) -> BracketIndex:
+        """薪資 → 級距索引（每次匯入只建一次）。"""
+        return BracketIndex.from_levels(self.levels)
+
+    def __bool__(self) -> bool:
+        return bool(self.by_level)
+
+
+_indexes: Dict[int, BracketLevelIndex] = {}
+
+
+def build_bracket_index(imp) -> BracketLevelIndex:
+    """由已載入 brackets 的 InsuranceBracketImport 建立索引。"""
+    return _build(imp, imp.brackets or [])
+
+
+def _build(imp, brackets: Iterable) -> BracketLevelIndex:
+    by_level: Dict[int, BracketRecord] = {}
+    for b in brackets:
+        level = int(b.insured_salary_level)
+        by_level.setdefault(
+            level,
+            BracketRecord(
+                insured_salary_level=level,
+                labor_employer=b.labor_employer,
+                labor_employee=b.labor_employee,
+                health_employer=b.health_employer,
+                health_employee=b.health_employee,
+                occupational_accident=b.occupational_accident,
+                labor_pension=b.labor_pension,
+                group_insurance=b.group_insurance,
+            ),
+        )
+    return BracketLevelIndex(
+        import_id=imp.id,
+        file_name=imp.file_name or "",
+        imported_at=imp.imported_at,
+        by_level=MappingProxyType(by_level),
+    )
+
+
+async def get_bracket_index(db: AsyncSession) -> Optional[BracketLevelIndex]:
+    """
+    取得最新一筆匯入的級距索引；無匯入時回傳 None。
+    命中時僅需一次輕量查詢（最新匯入 id、匯入時間）；未命中才載入該次匯入的全部級距。
+    """
+    from app import crud
+
+    latest = await crud.get_latest_bracket_import_ref(db)
+    if latest is None:
+        return None
+    import_id, imported_at = latest
+    cached = _indexes.get(import_id)
+    # 匯入時間一併比對，避免 id 重用（如 SQLite rollback）時取到舊表
+    if cached is not None and cached.imported_at == imported_at:
+        return cached
+    imp = await crud.get_bracket_import(db, import_id)
+    if imp is None:
+        return None
+    index = build_bracket_index(imp)
+    _indexes[import_id] = index
+    return index
+
+
+def invalidate_bracket_index(import_id: Optional[int] = None) -> None:
+    """清除索引；未指定 import_id 時全部清除（級距表重新匯入時呼叫）。"""
+    if import_id is None:
+        _indexes.clear()
+    else:
+        _indexes.pop(import_id, None)
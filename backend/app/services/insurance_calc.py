@@ -3,14 +3,16 @@
 from pathlib import Path
 from datetime import date
 from decimal import Decimal, ROUND_HALF_UP
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Mapping, NamedTuple, Sequence, Tuple
 
 import yaml
 
 from app.schemas import ItemBreakdown, InsuranceEstimateResponse, HealthInsuranceBreakdown, HealthInsuranceDetailRow
-from app.rules.health_reduction import apply_health_reduction
+from app.rules.health_reduction import apply_health_reduction_many
 from app.config import settings
+from app.services.bracket_cache import BracketIndex
 from app.services.billing_days import (
+    PRORATION_DAYS_DENOMINATOR,
     days_in_month,
     get_insured_days_in_month,
     health_insurance_month_ratio,
@@ -20,23 +22,35 @@ from app.services.billing_days import (
 )
 
 
+RULES_YAML_PATH = Path(__file__).resolve().parents[2] / "config" / "insurance_rules.yaml"
+
+
 def _load_rules_from_yaml() -> dict:
     """預設規則：config/insurance_rules.yaml（未在 DB 設定時使用）"""
-    path = Path(__file__).resolve().parents[2] / "config" / "insurance_rules.yaml"
-    with open(path, "r", encoding="utf-8") as f:
+    with open(RULES_YAML_PATH, "r", encoding="utf-8") as f:
         return yaml.safe_load(f) or {}
 
 
-def _find_bracket(salary: Decimal, brackets: list) -> Decimal:
-    """依薪資找級距對應的投保薪資"""
-    s = float(salary)
-    for low, high, level in brackets:
-        if low <= s <= high:
-            return Decimal(str(level))
-    if brackets:
-        last = brackets[-1]
-        return Decimal(str(last[2]))
-    return salary
+def rules_yaml_mtime() -> Optional[int]:
+    """預設規則檔 mtime（ns）；檔案不存在時 None。供規則快取判斷是否需重讀。"""
+    try:
+        return RULES_YAML_PATH.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+def _default_rules():
+    from app.services.insurance_rules_cache import default_rules
+
+    return default_rules()
+
+
+def salary_index_for(rules: Mapping[str, Any]) -> BracketIndex:
+    """rules 的勞保級距索引：ResolvedRules 沿用其快取索引，一般 dict 則即時建立。"""
+    index = getattr(rules, "salary_index", None)
+    if index is not None:
+        return index
+    return BracketIndex.from_rules(rules.get("labor_insurance", {}).get("brackets", []))
 
 
 def _round2(d: Decimal) -> Decimal:
@@ -53,15 +67,15 @@ def _fmt(n: Decimal) -> str:
 
 def get_brackets(rules: Optional[Dict[str, Any]] = None) -> list:
     """取得級距列表 [ (low, high, level), ... ] 供下拉選單或輸入金額對應"""
-    rules = rules if rules is not None else _load_rules_from_yaml()
+    rules = rules if rules is not None else _default_rules()
     lab = rules.get("labor_insurance", {})
     return lab.get("brackets", [])
 
 
 def salary_to_level(salary: Decimal, rules: Optional[Dict[str, Any]] = None) -> Decimal:
-    """輸入金額後自動對應級距"""
-    brackets = get_brackets(rules)
-    return _find_bracket(salary, brackets)
+    """輸入金額後自動對應級距；無級距表時回傳原金額"""
+    level = salary_index_for(rules if rules is not None else _default_rules()).lookup(salary)
+    return level if level is not None else salary
 
 
 def _parse_date(v: Any) -> Optional[date]:
@@ -99,7 +113,7 @@ def estimate_insurance(
     - 勞保/職災/團保/勞退：按當月加保天數比例（含加保日、不含退保日）。
     未傳 year/month/enroll_date 時，視為整月計費。
     """
-    rules = rules if rules is not None else _load_rules_from_yaml()
+    rules = rules if rules is not None else _default_rules()
     lab = rules.get("labor_insurance", {})
     health = rules.get("health_insurance", {})
     occ = rules.get("occupational_accident", {})
@@ -111,11 +125,10 @@ def estimate_insurance(
     cancel_d = cancel_date if isinstance(cancel_date, date) else _parse_date(cancel_date)
     use_proration = year is not None and month is not None and enroll_d is not None
 
-    lab_brackets = lab.get("brackets", [])
     if insured_salary_level is not None and insured_salary_level > 0:
         lab_level = insured_salary_level
     elif salary_input is not None and salary_input > 0:
-        lab_level = _find_bracket(salary_input, lab_brackets)
+        lab_level = salary_to_level(salary_input, rules)
     else:
         lab_level = Decimal("26400")
     health_level = lab_level
@@ -169,14 +182,13 @@ def estimate_insurance(
         detail_rows: List[HealthInsuranceDetailRow] = []
         reduced_total = Decimal("0")
         original_total = Decimal("0")
-        for p in persons_to_use:
+        reductions = apply_health_reduction_many([
+            (bool(p.get("is_employee")), _parse_date(p.get("birth_date")), p.get("city") or "", p.get("disability_level") or "")
+            for p in persons_to_use
+        ])
+        for p, (mult, rule_names) in zip(persons_to_use, reductions):
             name = p.get("name") or "—"
-            is_emp = bool(p.get("is_employee"))
-            role = "本人" if is_emp else "眷屬"
-            bd = _parse_date(p.get("birth_date"))
-            city = p.get("city") or ""
-            d_level = p.get("disability_level") or ""
-            mult, rule_names = apply_health_reduction(is_employee=is_emp, birth_date=bd, city=city, disability_level=d_level)
+            role = "本人" if p.get("is_employee") else "眷屬"
             orig = original_personal_per_person
             reduced = _round2(orig * mult)
             original_total += orig
@@ -312,3 +324,194 @@ def estimate_insurance(
         billing_note=billing_note,
         calculation_steps=calculation_steps,
     )
+
+
+# ---------- 批次試算（全體員工月報表用） ----------
+
+
+class HealthPerson(NamedTuple):
+    """健保減免判斷用之每人資料（同 estimate_insurance persons 的欄位）。"""
+    is_employee: bool
+    birth_date: Optional[date] = None
+    city: Optional[str] = None
+    disability_level: Optional[str] = None
+
+
+class InsuranceInput(NamedTuple):
+    """批次試算之單一員工輸入（欄位語意同 estimate_insurance 參數）。"""
+    insured_salary_level: Optional[Decimal] = None
+    salary_input: Optional[Decimal] = None
+    dependent_count: int = 0
+    persons: Optional[Sequence[HealthPerson]] = None
+    enroll_date: Optional[date] = None
+    cancel_date: Optional[date] = None
+    group_insurance_fee: Optional[Decimal] = None
+
+
+class InsuranceBatchResult(NamedTuple):
+    """批次試算結果（金額同 estimate_insurance 對應欄位；不含明細與計算過程）。"""
+    insured_salary_level: Decimal
+    dependent_count: int
+    labor_employer: Decimal
+    labor_employee: Decimal
+    labor_total: Decimal
+    health_employer: Decimal
+    health_employee: Decimal
+    occupational_accident: Decimal
+    labor_pension: Decimal
+    group_insurance: Decimal
+    total_employer: Decimal
+    total_employee: Decimal
+    total: Decimal
+    insured_days: Optional[int]
+
+
+def estimate_insurance_batch(
+    employees: Sequence[InsuranceInput],
+    rules: Optional[Dict[str, Any]] = None,
+    year: Optional[int] = None,
+    month: Optional[int] = None,
+    at_date: Optional[date] = None,
+) -> List[InsuranceBatchResult]:
+    """
+    多名員工一次試算，結果與逐一呼叫 estimate_insurance 相同（見 test_insurance_batch 對照測試）。
+    費率只解析一次；級距相關月額依級距共用、加退保比例依 (加保日, 退保日) 共用、
+    健保減免以 apply_health_reduction_many 全體一次判斷；不建立 pydantic 物件。
+    """
+    rules = rules if rules is not None else _default_rules()
+    lab = rules.get("labor_insurance", {})
+    health = rules.get("health_insurance", {})
+    occ = rules.get("occupational_accident", {})
+    pension = rules.get("labor_pension", {})
+
+    lab_rate = Decimal(str(lab.get("rate", 0.115)))
+    lab_emp_ratio = Decimal(str(lab.get("employer_ratio", 0.7)))
+    lab_work_ratio = Decimal(str(lab.get("employee_ratio", 0.2)))
+    health_rate = Decimal(str(health.get("rate", 0.0517)))
+    health_emp_ratio = Decimal(str(health.get("employer_ratio", 0.6)))
+    health_work_ratio = Decimal(str(health.get("employee_ratio", 0.3)))
+    max_dep = health.get("max_dependents_count", 3)
+    occ_rate = Decimal(str(occ.get("rate", 0.0022)))
+    pension_ratio = Decimal(str(pension.get("employer_ratio", 0.06)))
+    default_group = Decimal(str(settings.group_insurance_monthly_fee))
+    default_level = Decimal("26400")
+    zero, one = Decimal("0"), Decimal("1")
+    can_prorate = year is not None and month is not None
+    d_in_month = days_in_month(year, month) if can_prorate else 0
+    denominator = Decimal(PRORATION_DAYS_DENOMINATOR)
+
+    # 級距 → (勞保月額, 健保每人月額, 健保每人原本個人負擔, 職災月額, 勞退月額)
+    level_amounts: Dict[Decimal, Tuple[Decimal, Decimal, Decimal, Decimal, Decimal]] = {}
+    # (加保日, 退保日) → (加保天數, 健保當月比例)
+    proration: Dict[Tuple[date, Optional[date]], Tuple[int, Decimal]] = {}
+
+    # 健保計費人數與減免：先選出每人計入的本人 + 眷屬，全體一次判斷減免規則
+    selections: List[Tuple[int, Optional[List[HealthPerson]]]] = []
+    health_persons: List[Tuple[bool, Optional[date], str, str]] = []
+    for emp in employees:
+        if emp.persons:
+            emp_list = [p for p in emp.persons if p.is_employee]
+            dep_list = [p for p in emp.persons if not p.is_employee]
+            dep_count = min(len(dep_list), max_dep)
+            chosen = emp_list[:1] + dep_list[:dep_count]
+            selections.append((dep_count, chosen))
+            health_persons.extend(
+                (bool(p.is_employee), _parse_date(p.birth_date), p.city or "", p.disability_level or "") for p in chosen
+            )
+        else:
+            selections.append((min(emp.dependent_count, max_dep), None))
+    multipliers = iter([mult for mult, _ in apply_health_reduction_many(health_persons, at_date)])
+    # 只有薪資金額者：一次以級距索引對應投保級距
+    salary_inputs = [
+        e.salary_input
+        for e in employees
+        if not (e.insured_salary_level is not None and e.insured_salary_level > 0)
+        and e.salary_input is not None and e.salary_input > 0
+    ]
+    salary_index = salary_index_for(rules)
+    mapped_levels = iter([
+        level if level is not None else salary
+        for salary, level in zip(salary_inputs, salary_index.lookup_many(salary_inputs))
+    ])
+
+    def prorate(total: Decimal, days: int) -> Decimal:
+        if days >= d_in_month:
+            return total
+        return _round2(total / denominator * Decimal(days))
+
+    out: List[InsuranceBatchResult] = []
+    for emp, (dep_count, chosen) in zip(employees, selections):
+        if emp.insured_salary_level is not None and emp.insured_salary_level > 0:
+            level = emp.insured_salary_level
+        elif emp.salary_input is not None and emp.salary_input > 0:
+            level = next(mapped_levels)
+        else:
+            level = default_level
+        amounts = level_amounts.get(level)
+        if amounts is None:
+            base_per_person = _round2(level * health_rate)
+            amounts = (
+                _round2(level * lab_rate),
+                base_per_person,
+                _round2(base_per_person * health_work_ratio),
+                _round2(level * occ_rate),
+                _round2(level * pension_ratio),
+            )
+            level_amounts[level] = amounts
+        lab_total, base_per_person, original_per_person, occ_total, pension_total = amounts
+
+        enroll_d = _parse_date(emp.enroll_date)
+        insured_days: Optional[int] = None
+        health_ratio = one
+        if can_prorate and enroll_d is not None:
+            cancel_d = _parse_date(emp.cancel_date)
+            factors = proration.get((enroll_d, cancel_d))
+            if factors is None:
+                factors = (
+                    get_insured_days_in_month(year, month, enroll_d, cancel_d),
+                    health_insurance_month_ratio(year, month, enroll_d, cancel_d),
+                )
+                proration[(enroll_d, cancel_d)] = factors
+            insured_days, health_ratio = factors
+            lab_month = prorate(lab_total, insured_days)
+            occ_month = prorate(occ_total, insured_days)
+            pension_month = prorate(pension_total, insured_days)
+        else:
+            lab_month, occ_month, pension_month = lab_total, occ_total, pension_total
+
+        labor_employer = _round2(lab_month * lab_emp_ratio)
+        labor_employee = _round2(lab_month * lab_work_ratio)
+
+        health_total = _round2(base_per_person * Decimal(1 + dep_count))
+        if chosen is not None:
+            reduced_total = zero
+            for _ in chosen:
+                reduced_total += _round2(original_per_person * next(multipliers))
+            health_employee = _round2(reduced_total * health_ratio)
+            health_employer = _round2(_round2(health_total * health_emp_ratio) * health_ratio)
+        else:
+            health_employee = _round2(health_total * health_work_ratio * health_ratio)
+            health_employer = _round2(health_total * health_emp_ratio * health_ratio)
+
+        group_monthly = emp.group_insurance_fee if emp.group_insurance_fee is not None else default_group
+        total_employer = labor_employer + health_employer + occ_month + pension_month
+        total_employee = labor_employee + health_employee + group_monthly
+        out.append(
+            InsuranceBatchResult(
+                insured_salary_level=level,
+                dependent_count=dep_count,
+                labor_employer=labor_employer,
+                labor_employee=labor_employee,
+                labor_total=lab_month,
+                health_employer=health_employer,
+                health_employee=health_employee,
+                occupational_accident=occ_month,
+                labor_pension=pension_month,
+                group_insurance=group_monthly,
+                total_employer=_round2(total_employer),
+                total_employee=_round2(total_employee),
+                total=_round2(total_employer + total_employee),
+                insured_days=insured_days,
+            )
+        )
+    return out
@@ -0,0 +1,148 @@
+"""
+試算規則（費率/級距）行程內快取：以 (year, month) 為 key 保存解析完成的不可變 ResolvedRules，
+取代每次報表/試算都重讀 YAML、逐鍵查 insurance_config、逐類型查 rate_tables。
+失效時機：set_insurance_config、級距表（rate_tables）匯入（mark_rules_dirty，該 transaction commit/rollback 後清除）、
+config/insurance_rules.yaml 的 mtime 變更（每次取用時比對）。
+快取依資料庫 engine 分開保存（engine 回收時一併釋放）。
+"""
+from dataclasses import dataclass
+from functools import cached_property
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, Mapping, Optional, Tuple
+from weakref import WeakKeyDictionary
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.services.bracket_cache import BracketIndex
+
+RulesKey = Tuple[Optional[int], Optional[int]]  # (year, month)；皆 None 表示不指定計算月份
+
+# 每個 engine 最多保留的月份數，超過時淘汰最早建立者
+MAX_CACHED_MONTHS = 48
+_DIRTY_KEY = "insurance_rules_dirty"
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, Mapping):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _thaw(value: Any) -> Any:
+    if isinstance(value, Mapping):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+
+@dataclass(frozen=True, eq=False)
+class ResolvedRules(Mapping):
+    """
+    某計算月份解析完成的規則（唯讀）；可直接當 rules 傳給 estimate_insurance / get_brackets。
+    巢狀 dict 為 MappingProxyType、list 為 tuple；需可修改或 JSON 輸出時用 to_dict()。
+    """
+    year: Optional[int]
+    month: Optional[int]
+    data: Mapping[str, Any]
+
+    @classmethod
+    def build(cls, rules: Mapping[str, Any], year: Optional[int] = None, month: Optional[int] = None) -> "ResolvedRules":
+        return cls(year=year, month=month, data=_freeze(rules))
+
+    def __getitem__(self, key: str) -> Any:
+        return self.data[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return _thaw(self.data)
+
+    @cached_property
+    def salary_index(self) -> BracketIndex:
+        """勞保級距（labor_insurance.brackets）之薪資 → 級距索引；每個規則版本只建一次。"""
+        return BracketIndex.from_rules(self.data.get("labor_insurance", {}).get("brackets", ()))
+
+
+_caches: "WeakKeyDictionary[Any, Dict[RulesKey, ResolvedRules]]" = WeakKeyDictionary()
+_yaml_mtime: Optional[int] = None
+_default_rules: Optional[ResolvedRules] = None
+
+
+def _check_yaml() -> None:
+    """YAML 預設規則檔 mtime 變更時清除全部快取。"""
+    global _yaml_mtime, _default_rules
+    from app.services.insurance_calc import rules_yaml_mtime
+
+    mtime = rules_yaml_mtime()
+    if mtime != _yaml_mtime:
+        _caches.clear()
+        _default_rules = None
+        _yaml_mtime = mtime
+
+
+def default_rules() -> ResolvedRules:
+    """僅含 YAML 預設值的規則（未傳 rules 時的 fallback）；檔案未變更時不重讀。"""
+    global _default_rules
+    from app.services.insurance_calc import _load_rules_from_yaml
+
+    _check_yaml()
+    if _default_rules is None:
+        _default_rules = ResolvedRules.build(_load_rules_from_yaml())
+    return _default_rules
+
+
+async def get_resolved_rules(db: AsyncSession, year: Optional[int] = None, month: Optional[int] = None) -> ResolvedRules:
+    """
+    取得計算月份的規則（同 crud.get_all_insurance_rules 的解析順序：YAML → insurance_config → 當月有效 rate_tables）。
+    命中時不查資料庫；本 session 有未提交的規則異動時一律重新解析且不寫入快取。
+    """
+    from app import crud
+
+    _check_yaml()
+    key: RulesKey = (year, month) if year is not None and month is not None else (None, None)
+    dirty = bool(db.sync_session.info.get(_DIRTY_KEY))
+    engine = db.get_bind()
+    cache = _caches.get(engine)
+    if cache is not None and not dirty:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    resolved = ResolvedRules.build(await crud.resolve_insurance_rules(db, *key), *key)
+    if not dirty:
+        cache = _caches.setdefault(engine, {})
+        cache[key] = resolved
+        while len(cache) > MAX_CACHED_MONTHS:
+            cache.pop(next(iter(cache)))
+    return resolved
+
+
+def invalidate_rules_cache() -> None:
+    """清除全部已解析規則。"""
+    _caches.clear()
+
+
+def mark_rules_dirty(db: AsyncSession) -> None:
+    """規則來源（insurance_config / rate_tables）已在此 session 異動：立即清除，並於 commit 或 rollback 後再清除一次。"""
+    db.sync_session.info[_DIRTY_KEY] = True
+    invalidate_rules_cache()
+
+
+@event.listens_for(Session, "after_commit")
+def _clear_after_commit(session: Session) -> None:
+    if session.info.pop(_DIRTY_KEY, None):
+        invalidate_rules_cache()
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _clear_after_rollback(session: Session, previous_transaction) -> None:
+    if session.info.pop(_DIRTY_KEY, None):
+        invalidate_rules_cache()
@@ -0,0 +1,125 @@
+"""
+巡邏登入密碼雜湊執行緒池：
+bcrypt 雜湊/驗證每次約 100～250 ms 且為純 CPU，直接在 async 端點呼叫會阻塞 event loop，
+上班前集中登入時所有請求都會被序列化。改交給有上限的 ThreadPoolExecutor（bcrypt 計算時釋放 GIL），
+同時執行數由 password_hash_workers 決定，超過者在池內排隊；另記錄排隊與執行時間直方圖。
+"""
+import asyncio
+import bisect
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
+from passlib.context import CryptContext
+
+from app.config import settings
+
+T = TypeVar("T")
+
+_pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+# 直方圖區間上界（毫秒），最後一格為 +Inf
+LATENCY_BUCKETS_MS: Tuple[float, ...] = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class LatencyHistogram:
+    """累積式延遲直方圖（執行緒安全）；counts[i] 為落在第 i 格（<= 上界）的次數，最後一格為 +Inf。"""
+
+    def __init__(self, buckets_ms: Tuple[float, ...] = LATENCY_BUCKETS_MS) -> None:
+        self.buckets_ms = buckets_ms
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counts: List[int] = [0] * (len(self.buckets_ms) + 1)
+            self.count = 0
+            self.sum_ms = 0.0
+            self.max_ms = 0.0
+
+    def observe(self, ms: float) -> None:
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets_ms, ms)] += 1
+            self.count += 1
+            self.sum_ms += ms
+            self.max_ms = max(self.max_ms, ms)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            labels = [f"le_{b:g}" for b in self.buckets_ms] + ["le_inf"]
+            return {
+                "count": self.count,
+                "sum_ms": round(self.sum_ms, 3),
+                "avg_ms": round(self.sum_ms / self.count, 3) if self.count else 0.0,
+                "max_ms": round(self.max_ms, 3),
+                "buckets": dict(zip(labels, self.counts)),
+            }
+
+
+# 各操作（hash / verify）的排隊等待與 bcrypt 執行時間
+_histograms: Dict[str, LatencyHistogram] = {
+    "hash_wait": LatencyHistogram(),
+    "hash_run": LatencyHistogram(),
+    "verify_wait": LatencyHistogram(),
+    "verify_run": LatencyHistogram(),
+}
+
+
+def get_password_pool() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(1, settings.password_hash_workers),
+                thread_name_prefix="password-hash",
+            )
+        return _executor
+
+
+def shutdown_password_pool() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+async def _run(op: str, func: Callable[..., T], *args) -> T:
+    submitted = time.perf_counter()
+
+    def timed() -> T:
+        started = time.perf_counter()
+        _histograms[f"{op}_wait"].observe((started - submitted) * 1000)
+        try:
+            return func(*args)
+        finally:
+            _histograms[f"{op}_run"].observe((time.perf_counter() - started) * 1000)
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_password_pool(), timed)
+
+
+async def hash_password(password: str) -> str:
+    return await _run("hash", _pwd_context.hash, password)
+
+
+async def verify_password(password: str, password_hash: Optional[str]) -> bool:
+    """password_hash 為空時直接回 False（不進執行緒池）。"""
+    if not password_hash:
+        return False
+    return await _run("verify", _pwd_context.verify, password, password_hash)
+
+
+def latency_stats() -> Dict:
+    return {
+        "workers": max(1, settings.password_hash_workers),
+        "histograms_ms": {name: h.snapshot() for name, h in _histograms.items()},
+    }
+
+
+def reset_latency_stats() -> None:
+    for h in _histograms.values():
+        h.reset()
@@ -0,0 +1,200 @@
+"""
+巡邏打卡熱路徑快取（行程內、TTL）：
+- 巡邏點：以 public_id / point_code / id 為 key 的唯讀快照；create_point / update_point / delete_point 時清除。
+- 設備：以 device_token 為 key 的有效（is_active）設備快照；綁定 / 解除綁定時清除。
+異動時立即清除，並於該 transaction commit/rollback 後再清除一次（避免 commit 前其他請求以舊資料重新快取）。
+其他行程（見 app.config 部署模型）的異動最多延遲 patrol_cache_ttl_seconds 才反映。
+未命中（含查無資料）一律回 DB 查詢，查無資料不快取。
+"""
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import event, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app import models
+from app.config import settings
+
+# 單一快取最多筆數，超過時整批清空（巡邏點/設備數量遠小於此）
+MAX_ENTRIES = 10000
+_DIRTY_KEY = "patrol_cache_dirty"
+
+
+@dataclass(frozen=True)
+class CachedPoint:
+    """打卡所需的巡邏點欄位快照（與 PatrolPoint 欄位同名）。"""
+    id: int
+    public_id: str
+    point_code: str
+    point_name: str
+    site_id: Optional[int]
+    site_name: Optional[str]
+    is_active: bool
+
+    @classmethod
+    def from_model(cls, point: models.PatrolPoint) -> "CachedPoint":
+        return cls(
+            id=point.id,
+            public_id=point.public_id,
+            point_code=point.point_code,
+            point_name=point.point_name,
+            site_id=point.site_id,
+            site_name=point.site_name,
+            is_active=bool(point.is_active),
+        )
+
+
+@dataclass(frozen=True)
+class CachedDevice:
+    """打卡所需的設備欄位快照（與 PatrolDevice 欄位同名）。"""
+    id: int
+    employee_name: str
+    site_name: str
+    device_fingerprint: Optional[str]
+    is_active: bool
+
+    @classmethod
+    def from_model(cls, device: models.PatrolDevice) -> "CachedDevice":
+        return cls(
+            id=device.id,
+            employee_name=device.employee_name,
+            site_name=device.site_name,
+            device_fingerprint=device.device_fingerprint,
+            is_active=bool(device.is_active),
+        )
+
+
+class TTLCache:
+    """簡單 TTL 快取（time.monotonic），到期於讀取時移除。"""
+
+    def __init__(self) -> None:
+        self._data: Dict[Hashable, Tuple[float, Any]] = {}
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self._data.pop(key, None)
+            return None
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        ttl = settings.patrol_cache_ttl_seconds
+        if ttl <= 0:
+            return
+        if len(self._data) >= MAX_ENTRIES:
+            self._data.clear()
+        self._data[key] = (time.monotonic() + ttl, value)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+_points = TTLCache()
+_devices = TTLCache()
+
+
+def _remember_point(point: models.PatrolPoint) -> CachedPoint:
+    cached = CachedPoint.from_model(point)
+    _points.set(("id", cached.id), cached)
+    _points.set(("public_id", cached.public_id), cached)
+    _points.set(("point_code", cached.point_code), cached)
+    return cached
+
+
+async def get_point_by_public_id(db: AsyncSession, public_id: str) -> Optional[CachedPoint]:
+    cached = _points.get(("public_id", public_id))
+    if cached is not None:
+        return cached
+    point = await db.scalar(select(models.PatrolPoint).where(models.PatrolPoint.public_id == public_id))
+    return _remember_point(point) if point else None
+
+
+PointLookup = Tuple[str, Any]  # ("id" | "public_id" | "point_code", 值)
+
+_LOOKUP_COLUMNS = {
+    "id": models.PatrolPoint.id,
+    "public_id": models.PatrolPoint.public_id,
+    "point_code": models.PatrolPoint.point_code,
+}
+
+
+async def get_points_bulk(
+    db: AsyncSession, candidates: Sequence[Sequence[PointLookup]]
+) -> List[Optional[CachedPoint]]:
+    """
+    多筆查詢巡邏點：每筆依序嘗試多個條件，取第一個命中者；查無為 None。
+    先查快取，只有排在第一個快取命中之前的條件需查 DB，並以單一查詢（各欄 IN 以 OR 合併）取回。
+    """
+    found: Dict[PointLookup, CachedPoint] = {}
+    missing: Dict[str, Set[Any]] = {}
+    for lookups in candidates:
+        for lookup in lookups:
+            cached = _points.get(lookup)
+            if cached is not None:
+                found[lookup] = cached
+                break
+            missing.setdefault(lookup[0], set()).add(lookup[1])
+    if missing:
+        clauses = [_LOOKUP_COLUMNS[field].in_(values) for field, values in missing.items()]
+        points = (await db.scalars(select(models.PatrolPoint).where(or_(*clauses)))).all()
+        for point in points:
+            cached = _remember_point(point)
+            for field, values in missing.items():
+                value = getattr(cached, field)
+                if value in values:
+                    found[(field, value)] = cached
+    return [next((found[lk] for lk in lookups if lk in found), None) for lookups in candidates]
+
+
+def invalidate_points(db: Optional[AsyncSession] = None) -> None:
+    """清除巡邏點快取；傳入 db 時於該 session commit/rollback 後再清除一次。"""
+    _points.clear()
+    if db is not None:
+        db.sync_session.info.setdefault(_DIRTY_KEY, set()).add("points")
+
+
+async def get_device_by_token(db: AsyncSession, token: str) -> Optional[CachedDevice]:
+    """依 token 取得設備快照；只快取有效設備，停用或查無者每次回 DB 確認。"""
+    cached = _devices.get(token)
+    if cached is not None:
+        return cached
+    device = await db.scalar(select(models.PatrolDevice).where(models.PatrolDevice.device_token == token))
+    if not device:
+        return None
+    snapshot = CachedDevice.from_model(device)
+    if snapshot.is_active:
+        _devices.set(token, snapshot)
+    return snapshot
+
+
+def invalidate_devices(db: Optional[AsyncSession] = None) -> None:
+    """清除設備快取；傳入 db 時於該 session commit/rollback 後再清除一次。"""
+    _devices.clear()
+    if db is not None:
+        db.sync_session.info.setdefault(_DIRTY_KEY, set()).add("devices")
+
+
+_CACHES = {"points": _points, "devices": _devices}
+
+
+def _clear_dirty(session: Session) -> None:
+    for name in session.info.pop(_DIRTY_KEY, None) or ():
+        _CACHES[name].clear()
+
+
+@event.listens_for(Session, "after_commit")
+def _clear_after_commit(session: Session) -> None:
+    _clear_dirty(session)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _clear_after_rollback(session: Session, previous_transaction) -> None:
+    _clear_dirty(session)
@@ -0,0 +1,176 @@
+"""
+巡邏重複掃碼冷卻追蹤（行程內）：
+(設備 / 員工, 巡邏點) → 最近一次掃碼時間（naive UTC，與 patrol_logs.created_at 相同），
+以時間輪（每格 WHEEL_SLOT_SECONDS 秒）淘汰超過冷卻時間者，查詢與寫入皆為 O(1)。
+啟動時由最近 COOLDOWN_SECONDS 的 patrol_logs 預熱；預熱完成前（或預熱失敗）未命中才回 DB 查詢。
+打卡寫入以 queue_scan 暫存於 session，transaction commit 後才記錄（rollback 則丟棄）。
+行程內狀態，部署模型見 app.config。
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app import models
+
+logger = logging.getLogger(__name__)
+
+COOLDOWN_SECONDS = 300  # 5 分鐘內同人同一巡邏點不可重複掃碼
+WHEEL_SLOT_SECONDS = 30
+
+CooldownKey = Tuple[Hashable, ...]
+
+
+def cooldown_key(
+    *,
+    device_id: Optional[int],
+    employee_id: Optional[int],
+    employee_name: str,
+    point_id: int,
+) -> CooldownKey:
+    """與原 DB 判斷條件一致：有設備以設備為準；否則依 employee_id，再否則依姓名。"""
+    if device_id is not None:
+        return ("device", device_id, point_id)
+    if employee_id is not None:
+        return ("employee", employee_id, point_id)
+    return ("name", employee_name, point_id)
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _slot(at: datetime) -> int:
+    return int((at - _EPOCH).total_seconds()) // WHEEL_SLOT_SECONDS
+
+
+class CooldownTracker:
+    """淘汰一律依伺服器時鐘（clock），不採用呼叫端傳入的掃碼時間，避免未來時間一次清空追蹤或長時間逐格淘汰。"""
+
+    def __init__(
+        self, cooldown_seconds: int = COOLDOWN_SECONDS, clock: Callable[[], datetime] = datetime.utcnow
+    ) -> None:
+        self.cooldown = timedelta(seconds=cooldown_seconds)
+        self._clock = clock
+        self.is_warm = False
+        self._last: Dict[CooldownKey, datetime] = {}
+        self._wheel: Dict[int, Set[CooldownKey]] = defaultdict(set)
+        self._oldest_slot: Optional[int] = None
+
+    def _expire(self) -> None:
+        if self._oldest_slot is None:
+            return
+        cutoff = self._clock() - self.cooldown
+        last_expired_slot = _slot(cutoff) - 1
+        while self._oldest_slot <= last_expired_slot:
+            for key in self._wheel.pop(self._oldest_slot, ()):
+                at = self._last.get(key)
+                if at is not None and at <= cutoff:
+                    del self._last[key]
+            self._oldest_slot += 1
+        if not self._last:
+            self._wheel.clear()
+            self._oldest_slot = None
+
+    def last_scan(self, key: CooldownKey, now: datetime) -> Optional[datetime]:
+        """掃碼時間 now 之冷卻時間內的最近一次掃碼時間；無則 None。"""
+        self._expire()
+        at = self._last.get(key)
+        if at is None or now - at >= self.cooldown:
+            return None
+        return at
+
+    def record(self, key: CooldownKey, at: datetime, now: Optional[datetime] = None) -> None:
+        """
+        記錄一次掃碼；只保留最晚者（與 ORDER BY created_at DESC 相同）。
+        已超出冷卻時間者（離線補傳、DB 查回的舊紀錄）不記錄，避免時間輪從很久以前開始逐格淘汰。
+        """
+        if at <= (now or self._clock()) - self.cooldown:
+            return
+        prev = self._last.get(key)
+        if prev is not None and prev >= at:
+            return
+        self._last[key] = at
+        slot = _slot(at)
+        self._wheel[slot].add(key)
+        if self._oldest_slot is None or slot < self._oldest_slot:
+            self._oldest_slot = slot
+
+    def warm(self, entries: Iterable[Tuple[CooldownKey, datetime]], now: Optional[datetime] = None) -> None:
+        now = now or self._clock()
+        for key, at in entries:
+            self.record(key, at, now)
+        self.is_warm = True
+
+    def clear(self) -> None:
+        self._last.clear()
+        self._wheel.clear()
+        self._oldest_slot = None
+        self.is_warm = False
+
+    def __len__(self) -> int:
+        return len(self._last)
+
+
+tracker = CooldownTracker()
+_PENDING_KEY = "patrol_pending_scans"
+
+
+def queue_scan(db: AsyncSession, key: CooldownKey, at: datetime) -> None:
+    """暫存掃碼，待此 session commit 後才寫入冷卻追蹤。"""
+    db.sync_session.info.setdefault(_PENDING_KEY, []).append((key, at))
+
+
+@event.listens_for(Session, "after_commit")
+def _record_pending(session: Session) -> None:
+    pending: List[Tuple[CooldownKey, datetime]] = session.info.pop(_PENDING_KEY, None) or []
+    for key, at in pending:
+        tracker.record(key, at)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_pending(session: Session, previous_transaction) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+async def warm_from_db(db: AsyncSession, now: Optional[datetime] = None) -> int:
+    """以最近 COOLDOWN_SECONDS 的打卡紀錄預熱；回傳載入筆數。"""
+    now = now or datetime.utcnow()
+    since = now - tracker.cooldown
+    rows = (
+        await db.execute(
+            select(
+                models.PatrolLog.device_id,
+                models.PatrolLog.employee_id,
+                models.PatrolLog.employee_name,
+                models.PatrolLog.point_id,
+                models.PatrolLog.created_at,
+            ).where(
+                models.PatrolLog.created_at >= since,
+                models.PatrolLog.point_id.is_not(None),
+            )
+        )
+    ).all()
+    tracker.warm(
+        (
+            (cooldown_key(device_id=d, employee_id=e, employee_name=n, point_id=p), created_at)
+            for d, e, n, p, created_at in rows
+        ),
+        now,
+    )
+    return len(rows)
+
+
+async def warm_tracker() -> None:
+    """啟動時呼叫；失敗時維持未預熱（未命中即回 DB 查詢）。"""
+    from app.database import AsyncSessionLocal
+
+    try:
+        async with AsyncSessionLocal() as db:
+            count = await warm_from_db(db)
+        logger.info("巡邏冷卻追蹤已預熱 %s 筆", count)
+    except Exception:
+        logger.warning("巡邏冷卻追蹤預熱失敗，改以資料庫判斷重複掃碼", exc_info=True)
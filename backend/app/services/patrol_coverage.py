@@ -0,0 +1,152 @@
+"""
+巡邏覆蓋彙總（patrol_coverage_daily）：
+每巡邏點 × 日期（Asia/Taipei）× 時段（早上/下午/晚上）一列，記錄掃碼次數與首末次掃碼時間。
+- 打卡寫入時於同一 transaction 以 INSERT ... ON CONFLICT 增量累加（record_logs）。
+- 每日排程重建近幾日（rebuild_range），校正刪除紀錄等增量無法反映的異動。
+覆蓋報表（GET /api/patrol/coverage）只讀彙總表，不掃描原始 patrol_logs。
+"""
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+
+logger = logging.getLogger(__name__)
+
+PERIODS = ("早上", "下午", "晚上")
+# Asia/Taipei 固定 UTC+8（無日光節約），與打卡端點 checkin_ampm 規則一致
+TAIPEI_OFFSET = timedelta(hours=8)
+# 每日排程重建的天數（含今天）
+REBUILD_DAYS = 3
+UPSERT_CHUNK_SIZE = 1000
+
+CoverageKey = Tuple[int, date, str]  # (point_id, scan_date, period)
+
+
+def period_for_hour(hour: int) -> str:
+    return "早上" if hour < 12 else ("下午" if hour < 18 else "晚上")
+
+
+def local_slot(created_at_utc: datetime) -> Tuple[date, str]:
+    """naive UTC 掃碼時間 → (台北日期, 時段)。"""
+    local = created_at_utc + TAIPEI_OFFSET
+    return local.date(), period_for_hour(local.hour)
+
+
+def utc_bounds(date_from: date, date_to: date) -> Tuple[datetime, datetime]:
+    """台北日期區間（含頭尾）對應的 naive UTC [start, end)。"""
+    start = datetime.combine(date_from, datetime.min.time()) - TAIPEI_OFFSET
+    end = datetime.combine(date_to + timedelta(days=1), datetime.min.time()) - TAIPEI_OFFSET
+    return start, end
+
+
+@dataclass
+class _Slot:
+    site_id: Optional[int]
+    scan_count: int
+    first_scan: datetime
+    last_scan: datetime
+
+    def add(self, created_at: datetime) -> None:
+        self.scan_count += 1
+        self.first_scan = min(self.first_scan, created_at)
+        self.last_scan = max(self.last_scan, created_at)
+
+
+def aggregate(scans: Iterable[Tuple[int, Optional[int], datetime]]) -> Dict[CoverageKey, _Slot]:
+    """(point_id, site_id, created_at) → 依 (point_id, 台北日期, 時段) 彙總。"""
+    out: Dict[CoverageKey, _Slot] = {}
+    for point_id, site_id, created_at in scans:
+        if point_id is None:
+            continue
+        scan_date, period = local_slot(created_at)
+        key = (point_id, scan_date, period)
+        slot = out.get(key)
+        if slot is None:
+            out[key] = _Slot(site_id=site_id, scan_count=1, first_scan=created_at, last_scan=created_at)
+        else:
+            slot.add(created_at)
+    return out
+
+
+def _values(slots: Dict[CoverageKey, _Slot]) -> List[dict]:
+    return [
+        {
+            "site_id": slot.site_id,
+            "point_id": point_id,
+            "scan_date": scan_date,
+            "period": period,
+            "scan_count": slot.scan_count,
+            "first_scan": slot.first_scan,
+            "last_scan": slot.last_scan,
+        }
+        for (point_id, scan_date, period), slot in slots.items()
+    ]
+
+
+async def record_logs(db: AsyncSession, logs: Iterable[models.PatrolLog]) -> int:
+    """打卡寫入後累加彙總（與打卡同一 transaction）；回傳更新的彙總列數。"""
+    values = _values(aggregate((log.point_id, log.site_id, log.created_at) for log in logs))
+    if not values:
+        return 0
+    conn = await db.connection()
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        earliest, latest = func.least, func.greatest
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        earliest, latest = func.min, func.max  # SQLite 多參數 min/max 為純量函式
+    table = models.PatrolCoverageDaily.__table__
+    for i in range(0, len(values), UPSERT_CHUNK_SIZE):
+        stmt = dialect_insert(models.PatrolCoverageDaily).values(values[i:i + UPSERT_CHUNK_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["point_id", "scan_date", "period"],
+            set_={
+                "site_id": stmt.excluded.site_id,
+                "scan_count": table.c.scan_count + stmt.excluded.scan_count,
+                "first_scan": earliest(table.c.first_scan, stmt.excluded.first_scan),
+                "last_scan": latest(table.c.last_scan, stmt.excluded.last_scan),
+            },
+        )
+        await db.execute(stmt)
+    return len(values)
+
+
+async def rebuild_range(db: AsyncSession, date_from: date, date_to: date) -> int:
+    """由原始 patrol_logs 重建台北日期區間（含頭尾）的彙總；回傳寫入列數。"""
+    start, end = utc_bounds(date_from, date_to)
+    await db.execute(
+        delete(models.PatrolCoverageDaily).where(
+            models.PatrolCoverageDaily.scan_date >= date_from,
+            models.PatrolCoverageDaily.scan_date <= date_to,
+        )
+    )
+    rows = (
+        await db.execute(
+            select(models.PatrolLog.point_id, models.PatrolLog.site_id, models.PatrolLog.created_at).where(
+                models.PatrolLog.created_at >= start,
+                models.PatrolLog.created_at < end,
+                models.PatrolLog.point_id.is_not(None),
+            )
+        )
+    ).all()
+    values = _values(aggregate(rows))
+    for i in range(0, len(values), UPSERT_CHUNK_SIZE):
+        await db.execute(models.PatrolCoverageDaily.__table__.insert(), values[i:i + UPSERT_CHUNK_SIZE])
+    return len(values)
+
+
+async def run_scheduled_rebuild(today: Optional[date] = None) -> None:
+    """每日排程：重建最近 REBUILD_DAYS 天（含今天）的彙總。"""
+    from app.database import AsyncSessionLocal
+
+    today = today or (datetime.utcnow() + TAIPEI_OFFSET).date()
+    date_from = today - timedelta(days=REBUILD_DAYS - 1)
+    async with AsyncSessionLocal() as db:
+        count = await rebuild_range(db, date_from, today)
+        await db.commit()
+    logger.info("巡邏覆蓋彙總已重建 %s～%s，共 %s 列", date_from, today, count)
@@ -0,0 +1,94 @@
+"""
+巡邏打卡即時事件（行程內 pub/sub）：
+打卡端點寫入後以 queue_checkin_event 暫存於 session，待 transaction commit 後才廣播給訂閱者
+（rollback 則丟棄），供 GET /api/patrol/logs/stream（SSE）推送給後台，不必輪詢資料庫。
+每個訂閱者一個有上限的 asyncio.Queue；消費太慢而滿載時丟棄最舊事件，不阻塞打卡。
+只推送本行程處理的打卡（部署模型見 app.config）。
+"""
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 100
+_PENDING_KEY = "patrol_pending_events"
+
+
+class Subscription:
+    def __init__(self, broker: "PatrolEventBroker", site_id: Optional[int], maxsize: int) -> None:
+        self._broker = broker
+        self.site_id = site_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def offer(self, payload: Dict[str, Any]) -> None:
+        if self.site_id is not None and payload.get("site_id") != self.site_id:
+            return
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(payload)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """取下一個事件；逾時回傳 None。"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self) -> None:
+        self._broker.unsubscribe(self)
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class PatrolEventBroker:
+    def __init__(self) -> None:
+        self._subscribers: Set[Subscription] = set()
+
+    def subscribe(self, site_id: Optional[int] = None, maxsize: int = SUBSCRIBER_QUEUE_SIZE) -> Subscription:
+        sub = Subscription(self, site_id, maxsize)
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        self._subscribers.discard(sub)
+
+    def publish(self, payload: Dict[str, Any]) -> None:
+        for sub in list(self._subscribers):
+            sub.offer(payload)
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+
+broker = PatrolEventBroker()
+
+
+def queue_checkin_event(db: AsyncSession, payload: Dict[str, Any]) -> None:
+    """暫存事件，待此 session commit 後廣播。"""
+    db.sync_session.info.setdefault(_PENDING_KEY, []).append(payload)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending(session: Session) -> None:
+    pending: List[Dict[str, Any]] = session.info.pop(_PENDING_KEY, None) or []
+    for payload in pending:
+        try:
+            broker.publish(payload)
+        except Exception:
+            logger.exception("巡邏即時事件廣播失敗")
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_pending(session: Session, previous_transaction) -> None:
+    session.info.pop(_PENDING_KEY, None)
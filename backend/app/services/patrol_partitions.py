@@ -0,0 +1,319 @@
+"""
+巡邏紀錄月分區維護（僅 PostgreSQL；migration 035 將 patrol_logs 改為依 checkin_date 月份 RANGE 分區）：
+- ensure_partitions：預先建立本月與下個月分區（冪等）；DEFAULT 分區若已收容該月資料，先搬回再建立。
+- archive_old_partitions：早於保留月數的分區匯出為壓縮檔（csv.gz / parquet）後卸除並刪除。
+SQLite（或尚未分區的 PostgreSQL）一律不做任何事。
+排程與啟動檢查在每個 worker 行程都會執行：建立分區於 transaction 開頭取 pg_try_advisory_xact_lock，
+歸檔全程持有同 key 的 session advisory lock；未取得（其他行程正在維護）即略過本次，
+避免同時建立分區或寫同一個歸檔暫存檔。歸檔逐分區匯出後才以短 transaction 卸除，不在匯出期間鎖住父表。
+歸檔後 patrol_coverage_daily 彙總仍保留，覆蓋報表不受影響。
+"""
+import asyncio
+import csv
+import gzip
+import logging
+import os
+import re
+from datetime import date, datetime, time
+from pathlib import Path
+from typing import Any, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.config import BASE_DIR, settings
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "patrol_logs"
+DEFAULT_PARTITION = "patrol_logs_default"
+PARTITION_NAME_PATTERN = re.compile(r"^patrol_logs_y(\d{4})m(\d{2})$")
+ARCHIVE_FETCH_SIZE = 5000
+# 預先建立的月份數（本月之後）
+MONTHS_AHEAD = 1
+# 分區維護 advisory lock key（任意固定值，各行程相同）
+MAINTENANCE_LOCK_KEY = 0x7061_7472_6F6C  # "patrol"
+
+
+def month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def add_months(d: date, months: int) -> date:
+    index = d.year * 12 + (d.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"patrol_logs_y{month.year:04d}m{month.month:02d}"
+
+
+def parse_partition_name(name: str) -> Optional[date]:
+    m = PARTITION_NAME_PATTERN.match(name)
+    if not m:
+        return None
+    return date(int(m.group(1)), int(m.group(2)), 1)
+
+
+def archive_dir() -> Path:
+    path = settings.patrol_archive_dir
+    if not path.is_absolute():
+        path = BASE_DIR / path
+    return path
+
+
+async def is_partitioned(conn: AsyncConnection) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    return bool(
+        await conn.scalar(
+            text(
+                "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt "
+                "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = :t)"
+            ),
+            {"t": PARENT_TABLE},
+        )
+    )
+
+
+async def try_maintenance_lock(conn: AsyncConnection) -> bool:
+    """取得本 transaction 的分區維護鎖（transaction 結束自動釋放）；其他行程持有中回傳 False。"""
+    return bool(await conn.scalar(text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": MAINTENANCE_LOCK_KEY}))
+
+
+async def list_partitions(conn: AsyncConnection) -> List[str]:
+    rows = await conn.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :t ORDER BY c.relname"
+        ),
+        {"t": PARENT_TABLE},
+    )
+    return [r[0] for r in rows]
+
+
+async def _create_month_partition(conn: AsyncConnection, month: date, existing: Sequence[str]) -> bool:
+    name = partition_name(month)
+    if name in existing:
+        return False
+    lower, upper = month.isoformat(), add_months(month, 1).isoformat()
+    has_default = DEFAULT_PARTITION in existing
+    moved = 0
+    if has_default:
+        moved = await conn.scalar(
+            text(f"SELECT COUNT(*) FROM {DEFAULT_PARTITION} WHERE checkin_date >= :lo AND checkin_date < :hi"),
+            {"lo": month, "hi": add_months(month, 1)},
+        )
+    if moved:
+        # DEFAULT 分區已有該月資料時無法直接建立分區：暫時卸除 DEFAULT，建立後把資料搬回父表
+        await conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {DEFAULT_PARTITION}"))
+        await conn.execute(
+            text(f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} FOR VALUES FROM ('{lower}') TO ('{upper}')")
+        )
+        await conn.execute(
+            text(
+                f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+                f"WHERE checkin_date >= :lo AND checkin_date < :hi RETURNING *) "
+                f"INSERT INTO {PARENT_TABLE} SELECT * FROM moved"
+            ),
+            {"lo": month, "hi": add_months(month, 1)},
+        )
+        await conn.execute(text(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+        logger.warning("巡邏紀錄分區 %s 建立時由 DEFAULT 分區搬回 %s 筆", name, moved)
+    else:
+        await conn.execute(
+            text(f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} FOR VALUES FROM ('{lower}') TO ('{upper}')")
+        )
+    return True
+
+
+async def ensure_partitions(conn: AsyncConnection, today: Optional[date] = None) -> List[str]:
+    """建立本月至 MONTHS_AHEAD 個月後的分區；回傳新建的分區名稱。未分區（含 SQLite）或未取得維護鎖時回傳空串列。"""
+    if not await is_partitioned(conn):
+        return []
+    if not await try_maintenance_lock(conn):
+        logger.info("其他行程正在維護巡邏紀錄分區，略過本次建立")
+        return []
+    current = month_start(today or date.today())
+    existing = await list_partitions(conn)
+    created = []
+    for offset in range(MONTHS_AHEAD + 1):
+        month = add_months(current, offset)
+        if await _create_month_partition(conn, month, existing):
+            created.append(partition_name(month))
+    return created
+
+
+def _format_value(value: Any) -> Any:
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    return value
+
+
+class CsvArchiveWriter:
+    """gzip 壓縮 CSV（含表頭），逐批寫入。"""
+    suffix = ".csv.gz"
+
+    def __init__(self, path: Path, columns: Sequence[str]) -> None:
+        self._file = gzip.open(path, "wt", encoding="utf-8", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+
+    def write(self, rows: Sequence[Tuple]) -> None:
+        self._writer.writerows([_format_value(v) for v in row] for row in rows)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetArchiveWriter:
+    """Parquet（zstd 壓縮），逐批寫入 row group；需 pyarrow。"""
+    suffix = ".parquet"
+
+    def __init__(self, path: Path, columns: Sequence[str]) -> None:
+        self._path = path
+        self._columns = list(columns)
+        self._writer = None
+
+    def write(self, rows: Sequence[Tuple]) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pylist([dict(zip(self._columns, row)) for row in rows])
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self._path, table.schema, compression="zstd")
+        self._writer.write_table(table)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+
+def archive_writer_class(fmt: str):
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+
+            return ParquetArchiveWriter
+        except ImportError:
+            logger.warning("未安裝 pyarrow，巡邏紀錄歸檔改用 csv.gz")
+    return CsvArchiveWriter
+
+
+def _fsync_and_replace(tmp: Path, path: Path) -> None:
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    tmp.replace(path)
+
+
+async def _archive_partition(conn: AsyncConnection, name: str, target_dir: Path, fmt: str) -> Tuple[Path, int]:
+    """以 server-side cursor 分批讀出分區並寫入暫存檔，fsync 後改名為正式檔；回傳 (檔案, 筆數)。"""
+    writer_class = archive_writer_class(fmt)
+    path = target_dir / f"{name}{writer_class.suffix}"
+    tmp = path.with_name(path.name + ".tmp")
+    result = await conn.stream(text(f"SELECT * FROM {name} ORDER BY id"))
+    writer = writer_class(tmp, list(result.keys()))
+    count = 0
+    try:
+        async for rows in result.partitions(ARCHIVE_FETCH_SIZE):
+            await asyncio.to_thread(writer.write, [tuple(r) for r in rows])
+            count += len(rows)
+    finally:
+        await asyncio.to_thread(writer.close)
+    await asyncio.to_thread(_fsync_and_replace, tmp, path)
+    logger.info("巡邏紀錄分區 %s 已歸檔 %s 筆至 %s", name, count, path)
+    return path, count
+
+
+async def list_detached_partitions(conn: AsyncConnection) -> List[str]:
+    """已卸除但尚未刪除的月分區（上次歸檔於卸除後中斷）。"""
+    rows = await conn.execute(
+        text(
+            "SELECT c.relname FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE c.relkind = 'r' AND n.nspname = current_schema() AND c.relname LIKE 'patrol\\_logs\\_y%' "
+            "AND NOT EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = c.oid) ORDER BY c.relname"
+        )
+    )
+    return [r[0] for r in rows if PARTITION_NAME_PATTERN.match(r[0])]
+
+
+async def _archive_and_drop(engine: AsyncEngine, name: str, attached: bool, target_dir: Path, fmt: str) -> Path:
+    """
+    單一分區歸檔：匯出在獨立的唯讀 transaction（只對該分區取 ACCESS SHARE，不鎖父表）；
+    卸除以短 transaction 執行（父表 ACCESS EXCLUSIVE 只持有到 DETACH 完成）；
+    卸除後分區已不再接收新資料，筆數與匯出時不同（期間有補傳寫入）則重新匯出後再刪除。
+    """
+    async with engine.connect() as conn:
+        async with conn.begin():
+            path, exported = await _archive_partition(conn, name, target_dir, fmt)
+    if attached:
+        async with engine.begin() as conn:
+            await conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+    async with engine.begin() as conn:
+        if await conn.scalar(text(f"SELECT COUNT(*) FROM {name}")) != exported:
+            path, _ = await _archive_partition(conn, name, target_dir, fmt)
+        await conn.execute(text(f"DROP TABLE {name}"))
+    return path
+
+
+async def archive_old_partitions(
+    engine: AsyncEngine,
+    retention_months: Optional[int] = None,
+    today: Optional[date] = None,
+    target_dir: Optional[Path] = None,
+    fmt: Optional[str] = None,
+) -> List[Path]:
+    """
+    早於保留月數的月分區：逐一匯出檔案後卸除並刪除；回傳歸檔檔案路徑。
+    整個歸檔期間以 session 層級 advisory lock（與 ensure_partitions 同 key）排除其他行程；
+    匯出不在持有父表鎖的 transaction 內進行，打卡與查詢只在各分區 DETACH 的瞬間等待。
+    retention_months <= 0、未分區、SQLite 或未取得維護鎖時不做任何事。
+    """
+    retention = settings.patrol_log_retention_months if retention_months is None else retention_months
+    if retention <= 0 or engine.dialect.name != "postgresql":
+        return []
+    fmt = (fmt or settings.patrol_archive_format).lower()
+    cutoff = add_months(month_start(today or date.today()), -retention)
+    archived: List[Path] = []
+    async with engine.connect() as lock_conn:
+        if not await is_partitioned(lock_conn):
+            return []
+        locked = bool(
+            await lock_conn.scalar(text("SELECT pg_try_advisory_lock(:k)"), {"k": MAINTENANCE_LOCK_KEY})
+        )
+        await lock_conn.commit()
+        if not locked:
+            logger.info("其他行程正在維護巡邏紀錄分區，略過本次歸檔")
+            return []
+        try:
+            candidates = [(name, False) for name in await list_detached_partitions(lock_conn)]
+            candidates += [(name, True) for name in await list_partitions(lock_conn)]
+            await lock_conn.commit()
+            expired = [
+                (name, attached) for name, attached in candidates
+                if parse_partition_name(name) is not None and parse_partition_name(name) < cutoff
+            ]
+            if expired:
+                target_dir = target_dir or archive_dir()
+                target_dir.mkdir(parents=True, exist_ok=True)
+            for name, attached in expired:
+                archived.append(await _archive_and_drop(engine, name, attached, target_dir, fmt))
+        finally:
+            await lock_conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": MAINTENANCE_LOCK_KEY})
+            await lock_conn.commit()
+    return archived
+
+
+async def run_scheduled_maintenance(archive: bool = True) -> None:
+    """每日排程：建立下個月分區，並（archive=True 時）歸檔過期分區；SQLite 不做任何事。"""
+    from app.database import engine
+
+    if engine.dialect.name != "postgresql":
+        return
+    async with engine.begin() as conn:
+        created = await ensure_partitions(conn)
+    if created:
+        logger.info("已建立巡邏紀錄分區：%s", ", ".join(created))
+    if archive:
+        await archive_old_partitions(engine)
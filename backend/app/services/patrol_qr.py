@@ -0,0 +1,280 @@
+"""
+巡邏點 QR 伺服器端產圖與列印用 QR 貼紙 PDF：
+- render_point_qr：PNG / SVG 圖檔以內容定址（QR 網址 + 格式 + 尺寸的 SHA-256）存於 upload_dir/qr_cache，
+  重複請求直接讀檔；public_base_url 變更時 QR 網址隨之改變，舊檔於下次存取時整批清除。
+- iter_qr_sheet_pdf：A4 多頁 PDF（每頁 SHEET_COLUMNS × SHEET_ROWS 張），QR 以向量矩形繪製、逐頁產生後串流輸出。
+QR 編碼需 segno（純 Python，無其他相依）；未安裝時 ensure_renderer 拋 QrRendererUnavailable。
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import zlib
+from dataclasses import dataclass
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+QR_FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+QR_ERROR_LEVEL = "m"
+QR_SCALE = 10  # 每模組像素（PNG）/ 單位（SVG）
+QR_BORDER = 2  # 靜區模組數
+_FORMAT_VERSION = 1
+_BASE_MARKER = ".public_base_url"
+
+# A4 直式（pt），每頁 3 × 4 張
+PAGE_WIDTH, PAGE_HEIGHT = 595.28, 841.89
+PAGE_MARGIN = 28.0
+SHEET_COLUMNS, SHEET_ROWS = 3, 4
+SHEET_QR_SIZE = 130.0
+SHEET_FONT_SIZE = 10.0
+
+QrMatrix = Tuple[Tuple[bool, ...], ...]
+
+
+class QrRendererUnavailable(RuntimeError):
+    """未安裝 segno，無法於伺服器端產生 QR。"""
+
+
+def ensure_renderer() -> None:
+    try:
+        import segno  # noqa: F401
+    except ImportError as exc:
+        raise QrRendererUnavailable("未安裝 segno，無法於伺服器端產生 QR") from exc
+
+
+def _make_qr(qr_url: str):
+    ensure_renderer()
+    import segno
+
+    return segno.make(qr_url, error=QR_ERROR_LEVEL, micro=False)
+
+
+@lru_cache(maxsize=2048)
+def qr_matrix(qr_url: str) -> QrMatrix:
+    """QR 模組矩陣（True 為深色，不含靜區）；依網址快取於記憶體。"""
+    return tuple(tuple(bool(v & 0x1) for v in row) for row in _make_qr(qr_url).matrix)
+
+
+# ---- 圖檔快取（磁碟） ----
+
+
+def _cache_dir() -> Path:
+    return Path(settings.upload_dir) / "qr_cache"
+
+
+def cache_key(qr_url: str, fmt: str) -> str:
+    raw = f"{_FORMAT_VERSION}|{fmt}|{QR_ERROR_LEVEL}|{QR_SCALE}|{QR_BORDER}|{qr_url}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _cache_path(key: str, fmt: str) -> Path:
+    return _cache_dir() / key[:2] / f"{key}.{fmt}"
+
+
+_checked_base: Optional[str] = None
+
+
+def _sync_public_base(cache_dir: Path) -> None:
+    """public_base_url 與快取目錄記錄不同時清空快取（舊網址的 QR 不會再被取用）。"""
+    global _checked_base
+    base = settings.public_base_url.rstrip("/")
+    if _checked_base == base:
+        return
+    marker = cache_dir / _BASE_MARKER
+    try:
+        previous = marker.read_text(encoding="utf-8")
+    except OSError:
+        previous = None
+    if previous != base:
+        removed = clear()
+        if previous is not None:
+            logger.info("公開網址已變更（%s → %s），清除 QR 快取 %s 檔", previous, base, removed)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        marker.write_text(base, encoding="utf-8")
+    _checked_base = base
+
+
+def _render_bytes(qr_url: str, fmt: str) -> bytes:
+    out = BytesIO()
+    _make_qr(qr_url).save(out, kind=fmt, scale=QR_SCALE, border=QR_BORDER)
+    return out.getvalue()
+
+
+def render_point_qr(qr_url: str, fmt: str) -> Tuple[bytes, str]:
+    """回傳 (圖檔內容, 快取 key)；命中磁碟快取時不重新編碼。寫入失敗僅記錄警告。"""
+    if fmt not in QR_FORMATS:
+        raise ValueError(f"不支援的 QR 格式：{fmt}")
+    cache_dir = _cache_dir()
+    try:
+        _sync_public_base(cache_dir)
+    except OSError:
+        logger.warning("QR 快取目錄無法使用：%s", cache_dir)
+    key = cache_key(qr_url, fmt)
+    path = _cache_path(key, fmt)
+    try:
+        return path.read_bytes(), key
+    except OSError:
+        pass
+    blob = _render_bytes(qr_url, fmt)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=str(path.parent), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(blob)
+        os.replace(tmp_path, path)
+    except OSError:
+        logger.warning("QR 快取寫入失敗：%s", path.name)
+    return blob, key
+
+
+def clear() -> int:
+    """清空 QR 圖檔快取，回傳刪除檔數。"""
+    global _checked_base
+    _checked_base = None
+    count = 0
+    for fmt in QR_FORMATS:
+        for p in _cache_dir().glob(f"*/*.{fmt}"):
+            try:
+                p.unlink()
+                count += 1
+            except OSError:
+                continue
+    return count
+
+
+# ---- QR 貼紙 PDF ----
+
+
+@dataclass(frozen=True)
+class SheetItem:
+    matrix: QrMatrix
+    title: str  # 巡邏點編號
+    subtitle: str  # 巡邏點名稱
+
+
+def _pdf_text(text: str) -> str:
+    """UniCNS-UCS2-H 編碼的十六進位字串（BMP 以外字元以「?」取代）。"""
+    return "<" + "".join(f"{ord(ch) if ord(ch) <= 0xFFFF else 0x3F:04X}" for ch in text) + ">"
+
+
+def _fit(text: str, max_chars: int) -> str:
+    return text if len(text) <= max_chars else text[: max_chars - 1] + "…"
+
+
+def _qr_ops(matrix: QrMatrix, x: float, y_top: float, size: float) -> List[str]:
+    """以 cm 換算至模組座標，同列連續深色模組合併為一個矩形。"""
+    n = len(matrix)
+    if not n:
+        return []
+    m = size / n
+    ops = [f"q {m:.4f} 0 0 {-m:.4f} {x:.2f} {y_top:.2f} cm"]
+    for r, row in enumerate(matrix):
+        c = 0
+        while c < n:
+            if not row[c]:
+                c += 1
+                continue
+            start = c
+            while c < n and row[c]:
+                c += 1
+            ops.append(f"{start} {r} {c - start} 1 re")
+    ops.append("f Q")
+    return ops
+
+
+def _page_content(items: Sequence[SheetItem]) -> bytes:
+    cell_w = (PAGE_WIDTH - 2 * PAGE_MARGIN) / SHEET_COLUMNS
+    cell_h = (PAGE_HEIGHT - 2 * PAGE_MARGIN) / SHEET_ROWS
+    max_chars = int((cell_w - 12) // SHEET_FONT_SIZE)
+    ops: List[str] = ["0 g 0.6 G 0.5 w"]
+    for i, item in enumerate(items):
+        col, row = i % SHEET_COLUMNS, i // SHEET_COLUMNS
+        left = PAGE_MARGIN + col * cell_w
+        top = PAGE_HEIGHT - PAGE_MARGIN - row * cell_h
+        # 裁切框
+        ops.append(f"{left:.2f} {top - cell_h:.2f} {cell_w:.2f} {cell_h:.2f} re S")
+        qr_top = top - 18
+        ops.extend(_qr_ops(item.matrix, left + (cell_w - SHEET_QR_SIZE) / 2, qr_top, SHEET_QR_SIZE))
+        for line, text in enumerate((item.title, item.subtitle)):
+            if not text:
+                continue
+            text = _fit(text, max_chars)
+            baseline = qr_top - SHEET_QR_SIZE - 16 - line * (SHEET_FONT_SIZE + 4)
+            # 全形字寬約 1em，半形約 0.5em；置中估算即可
+            width = sum(SHEET_FONT_SIZE if ord(ch) > 0xFF else SHEET_FONT_SIZE / 2 for ch in text)
+            tx = left + max(6.0, (cell_w - width) / 2)
+            ops.append(f"BT /F1 {SHEET_FONT_SIZE:g} Tf {tx:.2f} {baseline:.2f} Td {_pdf_text(text)} Tj ET")
+    return zlib.compress("\n".join(ops).encode("ascii"))
+
+
+class _PdfWriter:
+    """僅追加的最小 PDF 寫出器：記錄各物件位移以產生 xref。"""
+
+    def __init__(self) -> None:
+        self.offset = 0
+        self.offsets: Dict[int, int] = {}
+
+    def raw(self, data: bytes) -> bytes:
+        self.offset += len(data)
+        return data
+
+    def obj(self, num: int, body: bytes, stream: Optional[bytes] = None) -> bytes:
+        self.offsets[num] = self.offset
+        parts = [f"{num} 0 obj\n".encode("ascii"), body]
+        if stream is not None:
+            parts += [b"\nstream\n", stream, b"\nendstream"]
+        parts.append(b"\nendobj\n")
+        return self.raw(b"".join(parts))
+
+    def trailer(self, root: int) -> bytes:
+        size = max(self.offsets) + 1
+        lines = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+        for num in range(1, size):
+            lines.append(f"{self.offsets[num]:010d} 00000 n \n" if num in self.offsets else "0000000000 65535 f \n")
+        lines.append(f"trailer\n<< /Size {size} /Root {root} 0 R >>\nstartxref\n{self.offset}\n%%EOF\n")
+        return "".join(lines).encode("ascii")
+
+
+_CATALOG, _PAGES, _FONT, _CID_FONT, _FIRST_PAGE_OBJ = 1, 2, 3, 4, 5
+
+
+def iter_qr_sheet_pdf(items: Sequence[SheetItem]) -> Iterator[bytes]:
+    """逐頁產生 PDF 位元組；中文使用 PDF 內建 CJK 字型 MSung-Light（不內嵌字型檔）。"""
+    w = _PdfWriter()
+    yield w.raw(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    yield w.obj(_CATALOG, f"<< /Type /Catalog /Pages {_PAGES} 0 R >>".encode("ascii"))
+    yield w.obj(
+        _FONT,
+        f"<< /Type /Font /Subtype /Type0 /BaseFont /MSung-Light /Encoding /UniCNS-UCS2-H "
+        f"/DescendantFonts [{_CID_FONT} 0 R] >>".encode("ascii"),
+    )
+    yield w.obj(
+        _CID_FONT,
+        b"<< /Type /Font /Subtype /CIDFontType0 /BaseFont /MSung-Light "
+        b"/CIDSystemInfo << /Registry (Adobe) /Ordering (CNS1) /Supplement 0 >> "
+        b"/FontDescriptor << /Type /FontDescriptor /FontName /MSung-Light /Flags 6 "
+        b"/FontBBox [-160 -249 1015 888] /ItalicAngle 0 /Ascent 880 /Descent -120 "
+        b"/CapHeight 880 /StemV 93 >> /DW 1000 >>",
+    )
+    per_page = SHEET_COLUMNS * SHEET_ROWS
+    page_ids: List[int] = []
+    num = _FIRST_PAGE_OBJ
+    for start in range(0, max(len(items), 1), per_page):
+        content = _page_content(items[start:start + per_page])
+        yield w.obj(num, f"<< /Length {len(content)} /Filter /FlateDecode >>".encode("ascii"), content)
+        yield w.obj(
+            num + 1,
+            f"<< /Type /Page /Parent {_PAGES} 0 R /MediaBox [0 0 {PAGE_WIDTH:g} {PAGE_HEIGHT:g}] "
+            f"/Resources << /Font << /F1 {_FONT} 0 R >> >> /Contents {num} 0 R >>".encode("ascii"),
+        )
+        page_ids.append(num + 1)
+        num += 2
+    kids = " ".join(f"{p} 0 R" for p in page_ids)
+    yield w.obj(_PAGES, f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode("ascii"))
+    yield w.trailer(_CATALOG)
@@ -0,0 +1,88 @@
+"""
+Excel 串流匯出工具：openpyxl write-only 工作簿（逐列寫出，不在記憶體保留整張表），
+存檔時寫入 SpooledTemporaryFile（小檔在記憶體、超過上限自動落地暫存檔），再以固定大小區塊串流給前端。
+匯出記憶體用量與列數無關。
+"""
+import asyncio
+import tempfile
+from typing import Any, AsyncIterator, Iterable, List, Optional
+
+from fastapi.responses import StreamingResponse
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+from openpyxl.utils import get_column_letter
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+# 超過此大小即由記憶體轉存暫存檔
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_THIN = Side(style="thin")
+_HEADER_FONT = Font(bold=True)
+_HEADER_ALIGNMENT = Alignment(horizontal="center", vertical="center", wrap_text=True)
+_HEADER_BORDER = Border(top=_THIN, bottom=_THIN, left=_THIN, right=_THIN)
+
+
+def new_workbook() -> Workbook:
+    """write-only 工作簿；工作表需以 create_sheet 建立（無 wb.active）。"""
+    return Workbook(write_only=True)
+
+
+def create_sheet(wb: Workbook, title: str, column_count: int = 0, width: Optional[float] = None):
+    """建立工作表；write-only 欄寬須在寫入任何列之前設定。"""
+    ws = wb.create_sheet(title=title[:31])  # Excel 表單名稱長度限制
+    if width is not None:
+        for col in range(1, column_count + 1):
+            ws.column_dimensions[get_column_letter(col)].width = width
+    return ws
+
+
+def header_row(ws, headers: Iterable[Any]) -> List[WriteOnlyCell]:
+    """粗體置中加框線之表頭列（write-only 需以 WriteOnlyCell 帶樣式）。"""
+    cells = []
+    for h in headers:
+        cell = WriteOnlyCell(ws, value=h)
+        cell.font = _HEADER_FONT
+        cell.alignment = _HEADER_ALIGNMENT
+        cell.border = _HEADER_BORDER
+        cells.append(cell)
+    return cells
+
+
+def save_to_spooled(wb: Workbook):
+    """存成 xlsx 並回傳已 seek(0) 的 SpooledTemporaryFile（呼叫端負責 close）。"""
+    f = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    try:
+        wb.save(f)
+    except Exception:
+        f.close()
+        raise
+    f.seek(0)
+    return f
+
+
+def workbook_to_bytes(wb: Workbook) -> bytes:
+    with save_to_spooled(wb) as f:
+        return f.read()
+
+
+async def _iter_file(f) -> AsyncIterator[bytes]:
+    try:
+        while True:
+            chunk = await asyncio.to_thread(f.read, STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        f.close()
+
+
+async def xlsx_streaming_response(wb: Workbook, content_disposition: str) -> StreamingResponse:
+    """壓縮存檔移到執行緒（不阻塞 event loop），再以區塊串流回傳。"""
+    f = await asyncio.to_thread(save_to_spooled, wb)
+    return StreamingResponse(
+        _iter_file(f),
+        media_type=XLSX_MEDIA_TYPE,
+        headers={"Content-Disposition": content_disposition},
+    )
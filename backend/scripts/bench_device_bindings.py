@@ -0,0 +1,101 @@
+"""效能基準：後台裝置綁定列表（GET /api/patrol/device-bindings）在 1,000 筆綁定時的單頁延遲。
+比較「每列各查一次最新設備」（N+1，舊作法）與目前的單一視窗查詢。使用記憶體 SQLite，不需啟動後端。
+執行：cd backend && python scripts/bench_device_bindings.py [綁定數=1000] [次數=5]"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+from app import models  # noqa: E402
+from app.database import Base  # noqa: E402
+from app.routers import patrol as patrol_router  # noqa: E402
+
+
+async def seed_bindings(session_factory, count: int, devices_per_binding: int = 2) -> None:
+    """每個綁定各建立 devices_per_binding 台設備紀錄（最後一台為最新）。"""
+    base = datetime(2026, 1, 1, 8, 0, 0)
+    async with session_factory() as db:
+        db.add_all([
+            models.PatrolDeviceBinding(
+                device_public_id=f"pub-{i:05d}",
+                employee_name=f"員工{i}",
+                site_name="案場A",
+                is_bound=True,
+                is_active=True,
+                bound_at=base + timedelta(seconds=i),
+            )
+            for i in range(count)
+        ])
+        db.add_all([
+            models.PatrolDevice(
+                device_public_id=f"pub-{i:05d}",
+                device_token=f"tok-{i}-{n}",
+                employee_name=f"員工{i}",
+                site_name="案場A",
+                ip_address=f"10.0.{n}.{i % 250}",
+                is_active=n == devices_per_binding - 1,
+            )
+            for n in range(devices_per_binding)
+            for i in range(count)
+        ])
+        await db.commit()
+
+
+async def _n_plus_one(db, public_ids):
+    """舊作法：每個綁定各查一次最新設備。"""
+    out = {}
+    for pid in public_ids:
+        device = await db.scalar(
+            select(models.PatrolDevice)
+            .where(models.PatrolDevice.device_public_id == pid)
+            .order_by(models.PatrolDevice.id.desc())
+        )
+        if device:
+            out[pid] = device
+    return out
+
+
+async def _time(session_factory, runs):
+    samples = []
+    for _ in range(runs):
+        async with session_factory() as db:
+            started = time.perf_counter()
+            resp = await patrol_router.list_device_bindings(
+                query=None, employee_name=None, site_name=None, status="active", limit=1000, offset=0, db=db
+            )
+            samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), len(resp.items)
+
+
+async def main(count: int, runs: int):
+    engine = create_async_engine("sqlite+aiosqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    await seed_bindings(session_factory, count)
+
+    current = patrol_router._latest_devices_by_public_id
+    windowed_ms, items = await _time(session_factory, runs)
+    patrol_router._latest_devices_by_public_id = _n_plus_one
+    try:
+        n_plus_one_ms, _ = await _time(session_factory, runs)
+    finally:
+        patrol_router._latest_devices_by_public_id = current
+    await engine.dispose()
+
+    print(f"綁定數 {count}，單頁 {items} 筆，{runs} 次取中位數")
+    print(f"  N+1（每列一次查詢）：{n_plus_one_ms:8.1f} ms")
+    print(f"  單一視窗查詢      ：{windowed_ms:8.1f} ms")
+    print(f"  加速              ：{n_plus_one_ms / windowed_ms:8.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000, int(sys.argv[2]) if len(sys.argv) > 2 else 5))
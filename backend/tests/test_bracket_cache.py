@@ -0,0 +1,132 @@
+import random
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app import crud
+from app.database import Base
+from app.services import bracket_cache
+from app.services.bracket_cache import BracketIndex
+from app.services.insurance_calc import get_brackets, salary_to_level
+from app.services.insurance_rules_cache import default_rules
+
+
+@pytest.fixture
+async def async_session():
+    engine = create_async_engine(
+        "sqlite+aiosqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    bracket_cache.invalidate_bracket_index()
+    try:
+        yield session_factory
+    finally:
+        bracket_cache.invalidate_bracket_index()
+        await engine.dispose()
+
+
+def _rows(labor_employee: str):
+    return [
+        {"insured_salary_level": level, "labor_employee": Decimal(labor_employee), "health_employee": Decimal("400")}
+        for level in (28590, 30300, 31800)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_bracket_index_built_once_per_import(async_session, monkeypatch):
+    async with async_session() as db:
+        await crud.create_bracket_import(db, "a.xlsx", None, 3, brackets=_rows("700"))
+        await db.commit()
+
+        index = await bracket_cache.get_bracket_index(db)
+        assert index.levels == [28590, 30300, 31800]
+        assert index.get(30300).labor_employee == Decimal("700")
+        assert index.get(99999) is None
+        with pytest.raises(Exception):
+            index.get(30300).labor_employee = Decimal("0")
+
+        async def _no_reload(*args, **kwargs):
+            raise AssertionError("index should be served from cache")
+
+        with monkeypatch.context() as m:
+            m.setattr(crud, "get_bracket_import", _no_reload)
+            assert await bracket_cache.get_bracket_index(db) is index
+
+
+@pytest.mark.asyncio
+async def test_bracket_index_invalidated_by_new_import(async_session):
+    async with async_session() as db:
+        assert await bracket_cache.get_bracket_index(db) is None
+        await crud.create_bracket_import(db, "a.xlsx", None, 3, brackets=_rows("700"))
+        await db.commit()
+        first = await bracket_cache.get_bracket_index(db)
+
+        await crud.create_bracket_import(db, "b.xlsx", None, 3, brackets=_rows("750"))
+        await db.commit()
+        second = await bracket_cache.get_bracket_index(db)
+        assert second.import_id != first.import_id
+        assert second.file_name == "b.xlsx"
+        assert second.get(28590).labor_employee == Decimal("750")
+
+
+def _linear_rules_lookup(salary, brackets):
+    """原 _find_bracket 線性比對（對照用）"""
+    s = float(salary)
+    for low, high, level in brackets:
+        if low <= s <= high:
+            return Decimal(str(level))
+    return Decimal(str(brackets[-1][2]))
+
+
+def _linear_levels_lookup(salary, levels):
+    """原 /salary-to-level 依匯入級距逐筆比對（對照用）"""
+    items = [(1 if i == 0 else levels[i - 1] + 1, lev if i < len(levels) - 1 else 999999, lev) for i, lev in enumerate(levels)]
+    for low, high, lev in items:
+        if low <= salary <= high:
+            return Decimal(lev)
+    return Decimal(items[-1][2] if salary > items[-1][1] else items[0][2])
+
+
+def test_salary_index_matches_linear_scan():
+    rng = random.Random(7)
+    brackets = get_brackets(default_rules())
+    salaries = [0, 0.5, 1, 1500, 1500.5, 1501, 45800, 45801, 10 ** 7] + [rng.uniform(0, 200000) for _ in range(2000)]
+    index = BracketIndex.from_rules(brackets)
+    assert index.lookup_many(salaries) == [_linear_rules_lookup(s, brackets) for s in salaries]
+    assert [salary_to_level(Decimal(str(s))) for s in salaries[:50]] == [_linear_rules_lookup(s, brackets) for s in salaries[:50]]
+    assert default_rules().salary_index is default_rules().salary_index
+
+    levels = [28590, 30300, 31800, 45800]
+    int_salaries = [-5, 0, 1, 28590, 28591, 31801, 45800, 999999, 1000000] + [rng.randint(0, 60000) for _ in range(500)]
+    by_levels = BracketIndex.from_levels(levels)
+    assert by_levels.lookup_many(int_salaries) == [_linear_levels_lookup(s, levels) for s in int_salaries]
+
+
+def test_salary_index_on_empty_brackets():
+    assert BracketIndex.from_rules([]).lookup(30000) is None
+    assert salary_to_level(Decimal("30000"), {"labor_insurance": {}}) == Decimal("30000")
+
+
+@pytest.mark.asyncio
+async def test_brackets_endpoint_matches_salary_to_level(async_session):
+    from app.routers import insurance as insurance_router
+
+    async with async_session() as db:
+        await crud.create_bracket_import(db, "a.xlsx", None, 3, brackets=_rows("700"))
+        await db.commit()
+        items = await insurance_router.list_brackets(db=db)
+        assert [(i.low, i.high, i.level) for i in items] == [
+            (1, 28590, Decimal(28590)),
+            (28591, 30300, Decimal(30300)),
+            (30301, bracket_cache.TOP_BRACKET_HIGH, Decimal(31800)),
+        ]
+        for item in items:
+            for salary in (item.low, item.high):
+                resp = await insurance_router.map_salary_to_level(salary=salary, db=db)
+                assert resp["insured_salary_level"] == float(item.level)
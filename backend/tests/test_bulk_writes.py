@@ -0,0 +1,97 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app import crud
+from app.database import Base
+from app.models import AccountingPayrollResult, Employee, InsuranceMonthlyResult
+
+
+@pytest.fixture
+async def async_session():
+    engine = create_async_engine(
+        "sqlite+aiosqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    try:
+        yield session_factory
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_save_payroll_results_bulk_insert(async_session):
+    results = [
+        {
+            "site": f"案場{i % 3}",
+            "employee": f"員工{i}",
+            "pay_type": "hourly",
+            "total_hours": 12 + i,
+            "gross_salary": 2400 + i,
+            "labor_insurance_employee": None,
+            "net_salary": 2000 + i,
+            "status": "時薪制",
+        }
+        for i in range(1200)
+    ]
+    async with async_session() as db:
+        await crud.save_payroll_results(db, 2026, 1, "security", results)
+        await crud.save_payroll_results(db, 2026, 1, "security", [])
+        await db.commit()
+        rows = (await db.execute(select(AccountingPayrollResult).order_by(AccountingPayrollResult.id))).scalars().all()
+        assert len(rows) == 1200
+        assert rows[5].employee == "員工5"
+        assert rows[5].total_hours == 17.0
+        assert rows[5].total_salary == 2005.0
+        assert rows[5].labor_insurance_employee is None
+        assert rows[5].created_at is not None
+        fetched = await crud.get_payroll_results_for_period(db, 2026, 1, "security")
+        assert len(fetched) == 1200
+
+
+@pytest.mark.asyncio
+async def test_bulk_upsert_insurance_monthly_results_updates_on_conflict(async_session):
+    async with async_session() as db:
+        employees = [
+            Employee(
+                name=f"員工{i}",
+                birth_date=date(1990, 1, 1),
+                national_id=f"A12345678{i}",
+                reg_address="台北",
+                live_address="台北",
+            )
+            for i in range(3)
+        ]
+        db.add_all(employees)
+        await db.flush()
+
+        def _rows(amount):
+            return [
+                {
+                    "employee_id": e.id,
+                    "year_month": 202601,
+                    "item_type": item_type,
+                    "employee_amount": Decimal(amount),
+                    "employer_amount": Decimal("10"),
+                }
+                for e in employees
+                for item_type in crud.INSURANCE_ITEM_TYPES
+            ]
+
+        assert await crud.bulk_upsert_insurance_monthly_results(db, _rows("100")) == 15
+        assert await crud.bulk_upsert_insurance_monthly_results(db, _rows("250")) == 15
+        await db.commit()
+
+        rows = await crud.list_insurance_monthly_results(db, 202601)
+        assert len(rows) == 15
+        assert {r.employee_amount for r in rows} == {Decimal("250")}
+        count = len((await db.execute(select(InsuranceMonthlyResult.id))).all())
+        assert count == 15
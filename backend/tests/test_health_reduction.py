@@ -2,11 +2,14 @@
 健保減免規則單元測試。
 測試：身障減免（輕/中/重/極重度）、65 歲以上眷屬（桃園市/台北市）減免。
 """
+import os
+import shutil
 from datetime import date
 from decimal import Decimal
 import pytest
 
-from app.rules.health_reduction import apply_health_reduction
+from app.rules import health_reduction
+from app.rules.health_reduction import apply_health_reduction, apply_health_reduction_many, get_compiled_rules
 
 
 def test_no_reduction_without_condition():
@@ -121,3 +124,35 @@ def test_senior_65_other_city_no_reduction():
         at_date=date(2025, 1, 1),
     )
     assert mult == Decimal("1")
+
+
+def test_many_matches_single_and_preserves_order():
+    """多人版與逐人呼叫結果相同、順序不變（重複者只判斷一次）"""
+    at = date(2025, 1, 1)
+    persons = [
+        (True, date(1990, 1, 1), None, "中度"),
+        (False, date(1950, 3, 1), "台北市", None),
+        (False, date(1950, 3, 1), "台北市", "輕度"),
+        (False, None, "桃園市", "不明"),
+        (True, date(1990, 1, 1), None, "中度"),
+    ]
+    assert apply_health_reduction_many(persons, at_date=at) == [
+        apply_health_reduction(is_employee=e, birth_date=b, city=c, disability_level=d, at_date=at)
+        for e, b, c, d in persons
+    ]
+
+
+def test_compiled_rules_reload_on_file_change(tmp_path, monkeypatch):
+    """規則檔未變更時沿用編譯結果；mtime 變更後重新載入"""
+    path = tmp_path / "health_reduction_rules.yaml"
+    shutil.copy(health_reduction.RULES_YAML_PATH, path)
+    monkeypatch.setattr(health_reduction, "RULES_YAML_PATH", path)
+    compiled = get_compiled_rules()
+    assert get_compiled_rules() is compiled
+
+    path.write_text(path.read_text(encoding="utf-8").replace("輕度: 0.75", "輕度: 0.6"), encoding="utf-8")
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    mult, _ = apply_health_reduction(is_employee=True, disability_level="輕度")
+    assert mult == Decimal("0.6")
+    assert get_compiled_rules() is not compiled
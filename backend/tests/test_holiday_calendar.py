@@ -0,0 +1,42 @@
+import json
+import os
+from calendar import monthrange
+from datetime import date
+
+from app.accounting import holiday_calendar
+from app.accounting.holiday_calendar import get_holiday_dates, get_month_calendar
+
+
+def _reference_holidays(year: int, month: int) -> set:
+    """逐次讀檔的原算法（對照用）"""
+    holiday_map = json.loads(holiday_calendar._HOLIDAY_FILE.read_text(encoding="utf-8"))
+    out = {date.fromisoformat(raw) for raw in holiday_map.get(str(year), []) if date.fromisoformat(raw).month == month}
+    out.update(date(year, month, d) for d in range(1, monthrange(year, month)[1] + 1) if date(year, month, d).weekday() >= 5)
+    return out
+
+
+def test_month_calendar_matches_reference():
+    for year in (2024, 2025, 2026, 2027):
+        for month in range(1, 13):
+            cal = get_month_calendar(year, month)
+            expected = _reference_holidays(year, month)
+            assert cal.holidays == expected
+            assert cal.required_workdays == monthrange(year, month)[1] - len(expected)
+            days = [date(year, month, d) for d in range(1, cal.days_in_month + 1)]
+            assert set(cal.iso_weeks) == {(d.isocalendar().year, d.isocalendar().week) for d in days}
+            assert all(cal.iso_week(d) == (d.isocalendar().year, d.isocalendar().week) for d in days)
+    assert get_month_calendar(2026, 2) is get_month_calendar(2026, 2)
+
+
+def test_month_calendar_reloads_when_holiday_file_changes(tmp_path, monkeypatch):
+    path = tmp_path / "holidays.json"
+    path.write_text(json.dumps({"2026": ["2026-03-02"]}), encoding="utf-8")
+    monkeypatch.setattr(holiday_calendar, "_HOLIDAY_FILE", path)
+    assert date(2026, 3, 2) in get_holiday_dates(2026, 3)
+    assert date(2026, 3, 3) not in get_holiday_dates(2026, 3)
+
+    path.write_text(json.dumps({"2026": ["2026-03-03"]}), encoding="utf-8")
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    holidays = get_holiday_dates(2026, 3)
+    assert date(2026, 3, 3) in holidays and date(2026, 3, 2) not in holidays
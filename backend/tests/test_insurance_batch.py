@@ -0,0 +1,95 @@
+"""estimate_insurance_batch 與逐一呼叫 estimate_insurance 的結果對照。"""
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+
+from app.services.insurance_calc import (
+    HealthPerson,
+    InsuranceInput,
+    estimate_insurance,
+    estimate_insurance_batch,
+    get_brackets,
+)
+
+LEVELS = [Decimal(v) for v in (0, 26400, 27600, 30300, 36300, 45800, 72800)]
+CITIES = [None, "台北市", "桃園市", "高雄市"]
+DISABILITY = [None, None, None, "輕度", "中度", "重度", "不明"]
+
+
+def _random_employee(rng: random.Random, year: int, month: int) -> InsuranceInput:
+    first = date(year, month, 1)
+    enroll = rng.choice([None, first - timedelta(days=400), first, first + timedelta(days=rng.randint(1, 27)),
+                         date(year, month, 28) + timedelta(days=3)])
+    cancel = rng.choice([None, None, first + timedelta(days=rng.randint(0, 35)), first - timedelta(days=3)])
+    persons = None
+    if rng.random() < 0.8:
+        persons = [HealthPerson(is_employee=True, birth_date=date(rng.randint(1950, 2000), 5, 17))]
+        for _ in range(rng.randint(0, 5)):
+            persons.append(HealthPerson(
+                is_employee=False,
+                birth_date=rng.choice([None, date(rng.randint(1940, 2020), rng.randint(1, 12), 1)]),
+                city=rng.choice(CITIES),
+                disability_level=rng.choice(DISABILITY),
+            ))
+    return InsuranceInput(
+        insured_salary_level=rng.choice(LEVELS),
+        salary_input=rng.choice([None, Decimal(rng.randint(1, 60000))]),
+        dependent_count=rng.randint(0, 5),
+        persons=persons,
+        enroll_date=enroll,
+        cancel_date=cancel,
+        group_insurance_fee=rng.choice([None, Decimal("500")]),
+    )
+
+
+def _scalar(emp: InsuranceInput, year, month):
+    return estimate_insurance(
+        dependent_count=emp.dependent_count,
+        insured_salary_level=emp.insured_salary_level,
+        salary_input=emp.salary_input,
+        group_insurance_fee=emp.group_insurance_fee,
+        persons=None if emp.persons is None else [p._asdict() for p in emp.persons],
+        year=year,
+        month=month,
+        enroll_date=emp.enroll_date,
+        cancel_date=emp.cancel_date,
+    )
+
+
+@pytest.mark.parametrize("year,month", [(2026, 2), (2026, 7), (None, None)])
+def test_batch_matches_scalar_estimate(year, month):
+    rng = random.Random(f"{year}-{month}")
+    employees = [_random_employee(rng, year or 2026, month or 1) for _ in range(400)]
+
+    results = estimate_insurance_batch(employees, year=year, month=month)
+
+    assert len(results) == len(employees)
+    for emp, got in zip(employees, results):
+        want = _scalar(emp, year, month)
+        assert got.insured_salary_level == want.insured_salary_level
+        assert got.dependent_count == want.dependent_count
+        assert (got.labor_employer, got.labor_employee, got.labor_total) == (
+            want.labor_insurance.employer, want.labor_insurance.employee, want.labor_insurance.total
+        )
+        assert (got.health_employer, got.health_employee) == (
+            want.health_insurance.employer, want.health_insurance.employee
+        )
+        assert got.occupational_accident == want.occupational_accident.total
+        assert got.labor_pension == want.labor_pension.total
+        assert got.group_insurance == want.group_insurance.employee
+        assert (got.total_employer, got.total_employee, got.total) == (
+            want.total_employer, want.total_employee, want.total
+        )
+        assert got.insured_days == want.insured_days
+
+
+def test_batch_uses_given_rules_for_salary_brackets():
+    rules = {"labor_insurance": {"rate": 0.1, "brackets": [[1, 30000, 30000], [30001, 40000, 40000]]}}
+    results = estimate_insurance_batch(
+        [InsuranceInput(salary_input=Decimal("35000")), InsuranceInput(salary_input=Decimal("99999"))], rules
+    )
+    assert [r.insured_salary_level for r in results] == [Decimal("40000"), Decimal("40000")]
+    assert results[0].labor_total == Decimal("4000.00")
+    assert get_brackets(rules)[-1][2] == 40000
@@ -0,0 +1,124 @@
+import os
+import shutil
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app import crud
+from app.database import Base
+from app.models import RateItem, RateTable
+from app.services import insurance_calc, insurance_rules_cache
+from app.services.insurance_rules_cache import ResolvedRules, get_resolved_rules, mark_rules_dirty
+
+
+@pytest.fixture
+async def engine():
+    engine = create_async_engine(
+        "sqlite+aiosqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    insurance_rules_cache.invalidate_rules_cache()
+    try:
+        yield engine
+    finally:
+        insurance_rules_cache.invalidate_rules_cache()
+        await engine.dispose()
+
+
+def _count_statements(engine) -> list:
+    statements = []
+    event.listen(engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return statements
+
+
+@pytest.mark.asyncio
+async def test_rules_resolved_once_per_month(engine):
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_factory() as db:
+        db.add(RateTable(
+            type="health_insurance",
+            version="2026-01",
+            effective_from=date(2026, 1, 1),
+            total_rate=Decimal("0.06"),
+            items=[RateItem(salary_min=1, salary_max=999999, employee_rate=Decimal("0.3"), employer_rate=Decimal("0.6"))],
+        ))
+        await db.commit()
+
+    statements = _count_statements(engine)
+    async with session_factory() as db:
+        first = await get_resolved_rules(db, 2026, 3)
+        issued = len(statements)
+        assert issued > 0
+        assert await get_resolved_rules(db, 2026, 3) is first
+        assert len(statements) == issued
+        other = await get_resolved_rules(db, 2025, 12)
+
+    assert isinstance(first, ResolvedRules)
+    assert first["health_insurance"]["rate"] == 0.06
+    assert other["health_insurance"]["rate"] != 0.06
+    with pytest.raises(TypeError):
+        first["health_insurance"]["rate"] = 1
+    # dict 副本可修改且不影響快取
+    copied = first.to_dict()
+    copied["health_insurance"]["rate"] = 1
+    assert first["health_insurance"]["rate"] == 0.06
+
+
+@pytest.mark.asyncio
+async def test_set_insurance_config_invalidates_after_commit_only(engine):
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_factory() as db:
+        before = await get_resolved_rules(db)
+
+    async with session_factory() as db:
+        await crud.set_insurance_config(db, "labor_insurance", '{"rate": 0.2, "brackets": []}')
+        # 同 transaction 內看得到未提交異動，但不寫入快取
+        assert (await crud.get_all_insurance_rules(db))["labor_insurance"]["rate"] == 0.2
+        await db.rollback()
+
+    async with session_factory() as db:
+        assert (await get_resolved_rules(db))["labor_insurance"] == before["labor_insurance"]
+        await crud.set_insurance_config(db, "labor_insurance", '{"rate": 0.2, "brackets": []}')
+        await db.commit()
+
+    async with session_factory() as db:
+        assert (await get_resolved_rules(db))["labor_insurance"]["rate"] == 0.2
+
+
+@pytest.mark.asyncio
+async def test_rate_table_import_marks_rules_dirty(engine):
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_factory() as db:
+        assert (await get_resolved_rules(db, 2026, 1))["occupational_accident"]["rate"] != 0.005
+        db.add(RateTable(type="occupational_accident", version="2026", effective_from=date(2026, 1, 1), total_rate=Decimal("0.005")))
+        mark_rules_dirty(db)
+        await db.commit()
+    async with session_factory() as db:
+        assert (await get_resolved_rules(db, 2026, 1))["occupational_accident"]["rate"] == 0.005
+
+
+@pytest.mark.asyncio
+async def test_yaml_mtime_change_reloads_defaults(engine, tmp_path, monkeypatch):
+    path = tmp_path / "insurance_rules.yaml"
+    shutil.copy(insurance_calc.RULES_YAML_PATH, path)
+    monkeypatch.setattr(insurance_calc, "RULES_YAML_PATH", path)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_factory() as db:
+        first = await get_resolved_rules(db)
+        assert await get_resolved_rules(db) is first
+
+        path.write_text(path.read_text(encoding="utf-8").replace("rate: 0.115", "rate: 0.125", 1), encoding="utf-8")
+        st = path.stat()
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+        reloaded = await get_resolved_rules(db)
+        assert reloaded is not first
+        assert reloaded["labor_insurance"]["rate"] == 0.125
+        assert insurance_rules_cache.default_rules()["labor_insurance"]["rate"] == 0.125
@@ -0,0 +1,61 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services import password_pool
+
+
+@pytest.fixture(autouse=True)
+def _reset_pool():
+    password_pool.reset_latency_stats()
+    yield
+    password_pool.shutdown_password_pool()
+    password_pool.reset_latency_stats()
+
+
+@pytest.mark.asyncio
+async def test_hash_and_verify_round_trip_records_latency():
+    hashed = await password_pool.hash_password("secret-1")
+    assert await password_pool.verify_password("secret-1", hashed)
+    assert not await password_pool.verify_password("wrong", hashed)
+    assert not await password_pool.verify_password("secret-1", None)
+
+    stats = password_pool.latency_stats()["histograms_ms"]
+    assert stats["hash_run"]["count"] == 1
+    assert stats["verify_run"]["count"] == 2  # 空雜湊不進執行緒池
+    assert sum(stats["verify_run"]["buckets"].values()) == 2
+
+
+def test_histogram_buckets():
+    h = password_pool.LatencyHistogram(buckets_ms=(10, 100))
+    for ms in (1, 10, 50, 1000):
+        h.observe(ms)
+    snap = h.snapshot()
+    assert snap["buckets"] == {"le_10": 2, "le_100": 1, "le_inf": 1}
+    assert snap["count"] == 4 and snap["max_ms"] == 1000
+
+
+@pytest.mark.asyncio
+async def test_event_loop_stays_responsive_during_login_burst():
+    hashed = await password_pool.hash_password("secret-1")
+    gaps = []
+
+    async def ticker(stop):
+        last = time.perf_counter()
+        while not stop.is_set():
+            await asyncio.sleep(0.005)
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+
+    stop = asyncio.Event()
+    task = asyncio.create_task(ticker(stop))
+    started = time.perf_counter()
+    results = await asyncio.gather(*(password_pool.verify_password("secret-1", hashed) for _ in range(8)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await task
+    assert all(results)
+    # 驗證在執行緒池執行：event loop 期間持續運轉，最長停頓遠小於整批耗時
+    assert max(gaps) < elapsed / 2
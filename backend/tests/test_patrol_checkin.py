@@ -0,0 +1,437 @@
+import asyncio
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException, Response
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app import schemas
+from app.database import Base
+from app.models import PatrolDevice, PatrolLog, PatrolPoint, Site
+from app.routers import patrol as patrol_router
+from app.services import patrol_cache, patrol_cooldown, patrol_coverage, patrol_events
+
+
+@pytest.fixture
+async def engine():
+    engine = create_async_engine(
+        "sqlite+aiosqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    patrol_cache.invalidate_points()
+    patrol_cache.invalidate_devices()
+    patrol_cooldown.tracker.clear()
+    try:
+        yield engine
+    finally:
+        patrol_cache.invalidate_points()
+        patrol_cache.invalidate_devices()
+        patrol_cooldown.tracker.clear()
+        await engine.dispose()
+
+
+@pytest.fixture
+def async_session(engine):
+    return async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+
+@pytest.fixture
+def statements(engine):
+    """紀錄實際送出的 SQL（只計 SELECT / INSERT）。"""
+    seen: list[str] = []
+
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        head = statement.lstrip().split(None, 1)[0].upper()
+        if head in ("SELECT", "INSERT"):
+            seen.append(head)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", _before)
+    yield seen
+    event.remove(engine.sync_engine, "before_cursor_execute", _before)
+
+
+async def _seed(async_session):
+    async with async_session() as db:
+        site = Site(
+            name="巡邏案場",
+            client_name="客戶P",
+            address="地址P",
+            contract_start=date(2025, 1, 1),
+            monthly_amount=Decimal("100000"),
+            payment_method="transfer",
+            receivable_day=10,
+            is_84_1=False,
+        )
+        db.add(site)
+        await db.flush()
+        point = await patrol_router.create_point(
+            schemas.PatrolPointCreate(point_code="P-001", point_name="大門", site_id=site.id, site_name="巡邏案場"),
+            db=db,
+        )
+        db.add(PatrolDevice(device_token="tok-1", employee_name="巡邏員", site_name="巡邏案場", is_active=True))
+        await db.commit()
+        return point
+
+
+@pytest.mark.asyncio
+async def test_public_checkin_served_from_point_cache(async_session, statements):
+    point = await _seed(async_session)
+
+    async with async_session() as db:
+        await patrol_router.checkin_by_public_id(
+            point.public_id, schemas.PatrolPublicCheckinRequest(employee_name="甲"), db=db
+        )
+        await db.commit()
+
+    statements.clear()
+    async with async_session() as db:
+        resp = await patrol_router.checkin_by_public_id(
+            point.public_id, schemas.PatrolPublicCheckinRequest(employee_name="乙"), db=db
+        )
+        await db.commit()
+    assert resp.point_name == "大門"
+    # 巡邏點走快取：只剩重複掃碼檢查、打卡寫入與覆蓋彙總累加
+    assert statements == ["SELECT", "INSERT", "INSERT"]
+
+    async with async_session() as db:
+        await patrol_router.update_point(point.id, schemas.PatrolPointUpdate(point_name="後門"), db=db)
+        await db.commit()
+    async with async_session() as db:
+        resp = await patrol_router.checkin_by_public_id(
+            point.public_id, schemas.PatrolPublicCheckinRequest(employee_name="丙"), db=db
+        )
+        await db.commit()
+    assert resp.point_name == "後門"
+
+
+@pytest.mark.asyncio
+async def test_device_checkin_cache_and_unbind(async_session, statements):
+    await _seed(async_session)
+
+    async with async_session() as db:
+        await patrol_router.checkin(schemas.PatrolCheckinRequest(qr_value="P-001"), x_device_token="tok-1", authorization=None, db=db)
+        await db.commit()
+
+    statements.clear()
+    async with async_session() as db:
+        resp = await patrol_router.checkin(
+            schemas.PatrolCheckinRequest(qr_value="P-001"), x_device_token="tok-1", authorization=None, db=db
+        )
+    # 設備、巡邏點與冷卻追蹤皆在記憶體；重複掃碼於 5 分鐘內被擋下且不查 DB
+    assert resp.status_code == 429
+    assert statements == []
+
+    async with async_session() as db:
+        await db.execute(PatrolDevice.__table__.update().values(is_active=False))
+        await db.commit()
+    # 解除綁定端點會呼叫 invalidate_devices()；此處直接改表後手動清除
+    patrol_cache.invalidate_devices()
+    async with async_session() as db:
+        with pytest.raises(HTTPException) as exc:
+            await patrol_router.checkin(
+                schemas.PatrolCheckinRequest(qr_value="P-001"), x_device_token="tok-1", authorization=None, db=db
+            )
+    assert exc.value.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_point_update_clears_cache_again_after_commit(async_session):
+    point = await _seed(async_session)
+
+    async with async_session() as db:
+        old_row = await db.get(PatrolPoint, point.id)
+    async with async_session() as db:
+        await patrol_router.update_point(point.id, schemas.PatrolPointUpdate(point_name="後門"), db=db)
+        # commit 前另一請求以舊資料重新快取
+        patrol_cache._remember_point(old_row)
+        assert (await patrol_cache.get_point_by_public_id(db, point.public_id)).point_name == "大門"
+        await db.commit()
+
+    async with async_session() as db:
+        fresh = await patrol_cache.get_point_by_public_id(db, point.public_id)
+    assert fresh.point_name == "後門"
+
+
+def test_cooldown_tracker_expires_and_keeps_latest():
+    t0 = datetime(2026, 3, 1, 8, 0, 0)
+    clock = [t0 + timedelta(seconds=100)]
+    tracker = patrol_cooldown.CooldownTracker(cooldown_seconds=300, clock=lambda: clock[0])
+    key = patrol_cooldown.cooldown_key(device_id=1, employee_id=None, employee_name="甲", point_id=7)
+    tracker.record(key, t0 + timedelta(seconds=100))
+    tracker.record(key, t0)  # 較早者不覆蓋
+    assert tracker.last_scan(key, t0 + timedelta(seconds=200)) == t0 + timedelta(seconds=100)
+    assert tracker.last_scan(key, t0 + timedelta(seconds=399)) is not None
+    assert tracker.last_scan(key, t0 + timedelta(seconds=400)) is None
+    # 依伺服器時鐘淘汰：掃碼時間較晚不影響追蹤內容
+    assert len(tracker) == 1
+    clock[0] = t0 + timedelta(seconds=500)
+    tracker.last_scan(key, t0 + timedelta(seconds=500))
+    assert len(tracker) == 0
+    other = patrol_cooldown.cooldown_key(device_id=None, employee_id=None, employee_name="甲", point_id=7)
+    assert other != key
+
+
+@pytest.mark.asyncio
+async def test_public_checkin_rejects_far_future_timestamp(async_session):
+    point = await _seed(async_session)
+    async with async_session() as db:
+        await patrol_router.checkin_by_public_id(
+            point.public_id, schemas.PatrolPublicCheckinRequest(employee_name="甲"), db=db
+        )
+        await db.commit()
+    patrol_cooldown.tracker.is_warm = True
+
+    far = datetime(9999, 1, 1, tzinfo=patrol_router.TAIPEI)
+    async with async_session() as db:
+        with pytest.raises(HTTPException) as exc:
+            await patrol_router.checkin_by_public_id(
+                point.public_id, schemas.PatrolPublicCheckinRequest(employee_name="乙", timestamp=far), db=db
+            )
+    assert exc.value.status_code == 422
+    # 未來時間的查詢也不會清空追蹤：真正的重複掃碼仍被擋下
+    patrol_cooldown.tracker.last_scan(("name", "甲", point.id), far.astimezone(timezone.utc).replace(tzinfo=None))
+    async with async_session() as db:
+        dup = await patrol_router.checkin_by_public_id(
+            point.public_id, schemas.PatrolPublicCheckinRequest(employee_name="甲"), db=db
+        )
+    assert dup.status_code == 429
+
+
+def test_cooldown_tracker_ignores_scans_outside_window():
+    tracker = patrol_cooldown.CooldownTracker(cooldown_seconds=300)
+    key = patrol_cooldown.cooldown_key(device_id=1, employee_id=None, employee_name="甲", point_id=7)
+    now = datetime(2026, 3, 1, 8, 0, 0)
+    tracker.record(key, now - timedelta(days=3), now=now)  # 離線補傳的舊掃碼不進時間輪
+    assert len(tracker) == 0
+    assert tracker.last_scan(key, now) is None
+
+
+@pytest.mark.asyncio
+async def test_cooldown_recorded_only_after_commit(async_session):
+    key = patrol_cooldown.cooldown_key(device_id=None, employee_id=None, employee_name="甲", point_id=1)
+    now = datetime.utcnow()
+    async with async_session() as db:
+        patrol_cooldown.queue_scan(db, key, now)
+        await db.rollback()
+    assert patrol_cooldown.tracker.last_scan(key, now) is None
+
+    async with async_session() as db:
+        patrol_cooldown.queue_scan(db, key, now)
+        assert patrol_cooldown.tracker.last_scan(key, now) is None
+        await db.commit()
+    assert patrol_cooldown.tracker.last_scan(key, now) == now
+
+
+@pytest.mark.asyncio
+async def test_cooldown_warmed_from_recent_logs(async_session, statements):
+    point = await _seed(async_session)
+    now = datetime.utcnow()
+    async with async_session() as db:
+        db.add_all([
+            PatrolLog(
+                point_id=point.id, point_code=point.point_code, point_name=point.point_name,
+                employee_name="甲", site_name="巡邏案場", checkin_date=now.date(),
+                checkin_time=now.time(), checkin_ampm="上午", created_at=now - timedelta(seconds=60),
+            ),
+            PatrolLog(
+                point_id=point.id, point_code=point.point_code, point_name=point.point_name,
+                employee_name="乙", site_name="巡邏案場", checkin_date=now.date(),
+                checkin_time=now.time(), checkin_ampm="上午", created_at=now - timedelta(seconds=600),
+            ),
+        ])
+        await db.commit()
+        assert await patrol_cooldown.warm_from_db(db, now=now) == 1
+    assert patrol_cooldown.tracker.is_warm
+
+    # 預熱巡邏點快取後計算查詢數
+    async with async_session() as db:
+        await patrol_cache.get_point_by_public_id(db, point.public_id)
+    statements.clear()
+    async with async_session() as db:
+        dup = await patrol_router.checkin_by_public_id(
+            point.public_id, schemas.PatrolPublicCheckinRequest(employee_name="甲"), db=db
+        )
+    assert dup.status_code == 429
+    assert statements == []
+
+    # 已預熱：冷卻外（10 分鐘前）未命中不再回 DB 查詢，直接寫入
+    async with async_session() as db:
+        resp = await patrol_router.checkin_by_public_id(
+            point.public_id, schemas.PatrolPublicCheckinRequest(employee_name="乙"), db=db
+        )
+        await db.commit()
+    assert resp.point_name == "大門"
+    assert statements == ["INSERT", "INSERT"]
+
+
+@pytest.mark.asyncio
+async def test_batch_checkin_orders_by_timestamp_and_inserts_once(async_session, statements):
+    point = await _seed(async_session)
+    async with async_session() as db:
+        await patrol_router.create_point(
+            schemas.PatrolPointCreate(point_code="P-002", point_name="後門", site_id=point.site_id, site_name="巡邏案場"),
+            db=db,
+        )
+        await db.commit()
+
+    base = datetime.now(patrol_router.TAIPEI).replace(microsecond=0) - timedelta(minutes=30)
+    scans = [
+        {"qr_value": "P-001", "timestamp": base + timedelta(minutes=10), "client_ref": "a"},
+        {"qr_value": "P-001", "timestamp": base, "client_ref": "b"},
+        {"qr_value": "P-001", "timestamp": base + timedelta(minutes=2), "client_ref": "c"},
+        {"qr_value": "NOPE", "timestamp": base, "client_ref": "d"},
+        {"qr_value": "P-002", "timestamp": base + timedelta(minutes=1), "client_ref": "e"},
+    ]
+    statements.clear()
+    async with async_session() as db:
+        resp = await patrol_router.checkin_batch(
+            schemas.PatrolBatchCheckinRequest(scans=scans), authorization=None, x_device_token="tok-1", db=db
+        )
+        await db.commit()
+
+    assert [r.client_ref for r in resp.results] == ["a", "b", "c", "d", "e"]
+    assert [r.status for r in resp.results] == ["created", "created", "duplicate", "error", "created"]
+    assert resp.results[2].status_code == 429 and resp.results[2].cooldown_seconds == 180
+    assert resp.results[3].status_code == 404
+    assert (resp.created, resp.duplicates, resp.errors) == (3, 1, 1)
+    # 打卡紀錄依參數順序 RETURNING（PostgreSQL 為單一 INSERT；SQLite 無法保證多列 RETURNING 順序，逐列寫入）、
+    # 覆蓋彙總一次累加
+    assert statements.count("INSERT") == resp.created + 1
+    assert resp.results[1].log.created_at == base.astimezone(timezone.utc).replace(tzinfo=None)
+    async with async_session() as db:
+        saved = {log.id: (log.point_code, log.created_at) for log in (await db.execute(select(PatrolLog))).scalars()}
+    for r in resp.results:
+        if r.status == "created":
+            assert saved[r.log.id] == (r.log.point_code, r.log.created_at)
+
+    # 已寫入者納入冷卻判斷：同一時間再補傳一次即為重複
+    async with async_session() as db:
+        again = await patrol_router.checkin_batch(
+            schemas.PatrolBatchCheckinRequest(scans=[scans[0]]), authorization=None, x_device_token="tok-1", db=db
+        )
+    assert again.results[0].status == "duplicate"
+
+
+@pytest.mark.asyncio
+async def test_list_logs_keyset_pages_cover_all_rows(async_session):
+    base = datetime(2026, 1, 1, 1, 0, 0)
+    async with async_session() as db:
+        db.add_all([
+            PatrolLog(
+                employee_name=f"員工{i}", site_name="案場A", point_code="P1", point_name="大門",
+                checkin_date=date(2026, 1, 1), checkin_time=time(9, 0), checkin_ampm="上午",
+                # 每兩筆同一 created_at：游標須以 id 區分
+                created_at=base + timedelta(seconds=i // 2),
+            )
+            for i in range(25)
+        ])
+        await db.commit()
+
+    async def page(cursor):
+        response = Response()
+        async with async_session() as db:
+            rows = await patrol_router.list_logs(
+                response, date_from=None, date_to=None, employee_name=None, site_name=None,
+                point_code=None, site_id=None, cursor=cursor, limit=10, db=db,
+            )
+        return rows, response.headers.get(patrol_router.LOG_CURSOR_HEADER)
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        rows, cursor = await page(cursor)
+        seen.extend(rows)
+        pages += 1
+        if cursor is None:
+            break
+    assert pages == 3
+    assert len(seen) == 25 and len({r.id for r in seen}) == 25
+    keys = [(r.created_at, r.id) for r in seen]
+    assert keys == sorted(keys, reverse=True)
+
+    with pytest.raises(HTTPException) as exc:
+        await page("not-a-cursor")
+    assert exc.value.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_coverage_rollup_matches_rebuild(async_session):
+    point = await _seed(async_session)
+    base = datetime.now(patrol_router.TAIPEI).replace(hour=21, minute=0, second=0, microsecond=0) - timedelta(days=1)
+    scans = [
+        {"qr_value": "P-001", "timestamp": base},
+        {"qr_value": "P-001", "timestamp": base + timedelta(minutes=30)},
+        {"qr_value": "P-001", "timestamp": base - timedelta(hours=12)},
+    ]
+    async with async_session() as db:
+        await patrol_router.checkin_batch(
+            schemas.PatrolBatchCheckinRequest(scans=scans), authorization=None, x_device_token="tok-1", db=db
+        )
+        await db.commit()
+
+    async def coverage():
+        async with async_session() as db:
+            return await patrol_router.get_coverage(site_id=point.site_id, year=base.year, month=base.month, db=db)
+
+    incremental = await coverage()
+    assert incremental.periods == ["早上", "下午", "晚上"]
+    cells = {(c.scan_date, c.period): c.scan_count for c in incremental.points[0].cells}
+    night = (base.date(), "晚上")
+    assert cells[night] == 2
+    assert cells[(base.date(), "早上")] == 1
+    assert incremental.points[0].covered_slots == 2
+
+    async with async_session() as db:
+        await patrol_coverage.rebuild_range(db, base.date() - timedelta(days=1), base.date() + timedelta(days=1))
+        await db.commit()
+    rebuilt = await coverage()
+    assert [c.model_dump() for c in rebuilt.points[0].cells] == [c.model_dump() for c in incremental.points[0].cells]
+
+
+@pytest.mark.asyncio
+async def test_checkin_events_published_after_commit_only(async_session):
+    point = await _seed(async_session)
+    with patrol_events.broker.subscribe(site_id=point.site_id) as sub, \
+            patrol_events.broker.subscribe(site_id=point.site_id + 1) as other_site:
+        async with async_session() as db:
+            await patrol_router.checkin_by_public_id(
+                point.public_id, schemas.PatrolPublicCheckinRequest(employee_name="甲"), db=db
+            )
+            assert sub.queue.empty()  # 尚未 commit
+            await db.rollback()
+        assert sub.queue.empty()
+
+        async with async_session() as db:
+            resp = await patrol_router.checkin_by_public_id(
+                point.public_id, schemas.PatrolPublicCheckinRequest(employee_name="乙"), db=db
+            )
+            await db.commit()
+        event_payload = await sub.get(timeout=1)
+        assert event_payload["id"] == resp.id
+        assert event_payload["employee_name"] == "乙" and event_payload["site_id"] == point.site_id
+        assert other_site.queue.empty()
+    assert len(patrol_events.broker) == 0
+
+
+@pytest.mark.asyncio
+async def test_log_stream_emits_sse_messages():
+    class _Request:
+        async def is_disconnected(self):
+            return False
+
+    resp = await patrol_router.stream_logs(_Request(), site_id=None)
+    body = resp.body_iterator
+    assert await body.__anext__() == "retry: 3000\n\n"
+    pending = asyncio.ensure_future(body.__anext__())
+    await asyncio.sleep(0)
+    patrol_events.broker.publish({"id": 7, "site_id": None, "employee_name": "甲"})
+    message = await asyncio.wait_for(pending, 1)
+    assert message.startswith("id: 7\nevent: checkin\ndata: ")
+    assert '"employee_name": "甲"' in message
+    await body.aclose()
+    assert len(patrol_events.broker) == 0
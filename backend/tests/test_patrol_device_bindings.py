@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.models import PatrolDevice, PatrolDeviceBinding
+from app.routers import patrol as patrol_router
+
+
+@pytest.fixture
+async def engine():
+    engine = create_async_engine(
+        "sqlite+aiosqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        yield engine
+    finally:
+        await engine.dispose()
+
+
+async def seed_bindings(session_factory, count: int, devices_per_binding: int = 2) -> None:
+    """每個綁定各建立 devices_per_binding 台設備紀錄（ip 依序遞增，最後一台為最新）。"""
+    base = datetime(2026, 1, 1, 8, 0, 0)
+    async with session_factory() as db:
+        db.add_all([
+            PatrolDeviceBinding(
+                device_public_id=f"pub-{i:05d}",
+                employee_name=f"員工{i}",
+                site_name="案場A",
+                is_bound=True,
+                is_active=True,
+                bound_at=base + timedelta(seconds=i),
+            )
+            for i in range(count)
+        ])
+        db.add_all([
+            PatrolDevice(
+                device_public_id=f"pub-{i:05d}",
+                device_token=f"tok-{i}-{n}",
+                employee_name=f"員工{i}",
+                site_name="案場A",
+                ip_address=f"10.0.{n}.{i % 250}",
+                is_active=n == devices_per_binding - 1,
+            )
+            for n in range(devices_per_binding)
+            for i in range(count)
+        ])
+        await db.commit()
+
+
+@pytest.mark.asyncio
+async def test_list_device_bindings_loads_latest_devices_in_one_query(engine):
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    await seed_bindings(session_factory, 300)
+    selects: list[str] = []
+
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            selects.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", _before)
+    try:
+        async with session_factory() as db:
+            resp = await patrol_router.list_device_bindings(
+                query=None, employee_name=None, site_name=None, status="active", limit=1000, offset=0, db=db
+            )
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", _before)
+
+    assert resp.total == 300 and len(resp.items) == 300
+    # 綁定列表、總數、最新設備各一次
+    assert len(selects) == 3
+    assert all(item.ip_address and item.ip_address.startswith("10.0.1.") for item in resp.items)
@@ -0,0 +1,45 @@
+import csv
+import gzip
+from datetime import date, datetime, time
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.services import patrol_partitions
+
+
+def test_month_helpers():
+    assert patrol_partitions.add_months(date(2026, 11, 1), 2) == date(2027, 1, 1)
+    assert patrol_partitions.add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+    name = patrol_partitions.partition_name(date(2026, 3, 1))
+    assert name == "patrol_logs_y2026m03"
+    assert patrol_partitions.parse_partition_name(name) == date(2026, 3, 1)
+    assert patrol_partitions.parse_partition_name(patrol_partitions.DEFAULT_PARTITION) is None
+
+
+def test_csv_archive_writer_round_trip(tmp_path):
+    path = tmp_path / "p.csv.gz"
+    writer = patrol_partitions.CsvArchiveWriter(path, ["id", "checkin_date", "checkin_time", "created_at", "qr_value"])
+    writer.write([(1, date(2026, 1, 2), time(9, 0), datetime(2026, 1, 2, 1, 0), None)])
+    writer.write([(2, date(2026, 1, 3), time(10, 30), datetime(2026, 1, 3, 2, 30), "P-001")])
+    writer.close()
+    with gzip.open(path, "rt", encoding="utf-8", newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["id", "checkin_date", "checkin_time", "created_at", "qr_value"]
+    assert rows[1] == ["1", "2026-01-02", "09:00:00", "2026-01-02T01:00:00", ""]
+    assert rows[2][4] == "P-001"
+
+
+@pytest.mark.asyncio
+async def test_sqlite_is_noop(tmp_path):
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            assert await patrol_partitions.ensure_partitions(conn) == []
+        assert await patrol_partitions.archive_old_partitions(engine, retention_months=1, target_dir=tmp_path) == []
+    finally:
+        await engine.dispose()
+    assert list(tmp_path.iterdir()) == []
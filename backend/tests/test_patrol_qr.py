@@ -0,0 +1,61 @@
+import re
+import zlib
+
+import pytest
+
+from app.config import settings
+from app.services import patrol_qr
+
+
+def _matrix(n: int):
+    return tuple(tuple((r + c) % 3 == 0 for c in range(n)) for r in range(n))
+
+
+def _items(count: int):
+    return [
+        patrol_qr.SheetItem(matrix=_matrix(25), title=f"P{i:03d}", subtitle=f"巡邏點{i}")
+        for i in range(count)
+    ]
+
+
+def test_qr_sheet_pdf_pages_and_xref_offsets():
+    per_page = patrol_qr.SHEET_COLUMNS * patrol_qr.SHEET_ROWS
+    pdf = b"".join(patrol_qr.iter_qr_sheet_pdf(_items(per_page * 2 + 1)))
+
+    assert pdf.startswith(b"%PDF-1.4")
+    assert pdf.rstrip().endswith(b"%%EOF")
+    assert b"/Count 3" in pdf
+
+    startxref = int(re.search(rb"startxref\n(\d+)\n", pdf).group(1))
+    assert pdf[startxref:].startswith(b"xref\n")
+    entries = re.findall(rb"(\d{10}) 00000 n ", pdf[startxref:])
+    for num, offset in enumerate(entries, start=1):
+        assert pdf[int(offset):].startswith(f"{num} 0 obj".encode())
+
+
+def test_qr_sheet_pdf_merges_dark_runs_and_encodes_cjk_labels():
+    item = patrol_qr.SheetItem(matrix=((True, True, False, True),) * 4, title="A1", subtitle="大門")
+    content = zlib.decompress(patrol_qr._page_content([item])).decode("ascii")
+
+    # 每列兩段深色：0~1 合併為一個矩形，3 單獨一個
+    assert content.count(" 1 re") == 8
+    assert "0 0 2 1 re" in content and "3 0 1 1 re" in content
+    assert "<59279580> Tj" in content  # 「大門」UCS-2
+
+
+def test_render_point_qr_caches_on_disk_and_resets_on_base_url_change(tmp_path, monkeypatch):
+    pytest.importorskip("segno")
+    monkeypatch.setattr(settings, "upload_dir", tmp_path)
+    monkeypatch.setattr(settings, "public_base_url", "https://a.example")
+    monkeypatch.setattr(patrol_qr, "_checked_base", None)
+
+    png, key = patrol_qr.render_point_qr("https://a.example/patrol/checkin/x", "png")
+    assert png.startswith(b"\x89PNG")
+    cached = patrol_qr._cache_path(key, "png")
+    assert cached.read_bytes() == png
+    assert patrol_qr.render_point_qr("https://a.example/patrol/checkin/x", "png") == (png, key)
+
+    monkeypatch.setattr(settings, "public_base_url", "https://b.example")
+    svg, _ = patrol_qr.render_point_qr("https://b.example/patrol/checkin/x", "svg")
+    assert b"<svg" in svg
+    assert not cached.exists()
@@ -5,13 +5,18 @@ from io import BytesIO
 import pytest
 from openpyxl import load_workbook
 from starlette.datastructures import UploadFile
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.pool import StaticPool
 
+from app.accounting import payroll_jobs
 from app.accounting.holiday_calendar import get_holiday_dates
+from app.accounting.payroll_directory import PayrollDirectory
 from app.accounting.security_payroll_service import SecurityPayrollCalculator, get_holiday_count
+from app.config import settings
 from app.database import Base
-from app.models import AccountingPayrollResult, Employee, Site
+from app.models import AccountingJob, AccountingPayrollResult, Employee, Site
+from app.schemas import SecurityPayrollRecalculateRequest
 from app.routers import accounting as accounting_router
 
 
@@ -25,6 +30,13 @@ def _error_messages(errors):
     return msgs
 
 
+@pytest.fixture(autouse=True, params=["python", "vectorized"])
+def payroll_engine(request, monkeypatch):
+    """每個案例皆以逐列與向量化兩種引擎各跑一次，確保結果一致。"""
+    monkeypatch.setattr(settings, "payroll_engine", request.param)
+    return request.param
+
+
 @pytest.fixture
 async def async_session():
     engine = create_async_engine(
@@ -556,6 +568,29 @@ async def test_property_cross_type_lookup_without_extra_should_error(async_sessi
         assert "員工【跨公司員工B】未建立" in _error_messages(errors)
 
 
+async def _run_upload_job(async_session, monkeypatch, fake_parse, extra_payroll_types: str):
+    """經上傳端點建立背景工作，等 worker 跑完後以查詢端點取回工作內容。"""
+    queue = payroll_jobs.JobQueue(session_factory=async_session)
+    monkeypatch.setattr(payroll_jobs, "job_queue", queue)
+    monkeypatch.setattr(payroll_jobs, "parse_security_hours_file_async", fake_parse)
+    async with async_session() as db:
+        upload = UploadFile(filename="hours.xlsx", file=BytesIO(b"dummy"))
+        resp = await accounting_router.security_payroll_upload(
+            file=upload,
+            year=2026,
+            month=1,
+            type="property",
+            payroll_type="property",
+            extra_payroll_types=extra_payroll_types,
+            db=db,
+        )
+        assert resp["status"] == "queued"
+    await queue.join()
+    await queue.shutdown()
+    async with async_session() as db:
+        return await accounting_router.get_accounting_job(resp["job_id"], include_result=True, db=db)
+
+
 @pytest.mark.asyncio
 async def test_upload_endpoint_cross_type_lookup_case_a(async_session, monkeypatch):
     async with async_session() as db:
@@ -587,7 +622,7 @@ async def test_upload_endpoint_cross_type_lookup_case_a(async_session, monkeypat
         )
         await db.commit()
 
-        def _fake_parse(_: bytes, __: str, year: int | None = None, month: int | None = None):
+        async def _fake_parse(_: bytes, __: str, year: int | None = None, month: int | None = None):
             return [
                 {
                     "site": "上傳跨公司案場",
@@ -597,17 +632,10 @@ async def test_upload_endpoint_cross_type_lookup_case_a(async_session, monkeypat
                 }
             ], []
 
-        monkeypatch.setattr(accounting_router, "parse_security_hours_file", _fake_parse)
-        upload = UploadFile(filename="hours.xlsx", file=BytesIO(b"dummy"))
-        resp = await accounting_router.security_payroll_upload(
-            file=upload,
-            year=2026,
-            month=1,
-            type="property",
-            payroll_type="property",
-            extra_payroll_types='["smith"]',
-            db=db,
-        )
+        job = await _run_upload_job(async_session, monkeypatch, _fake_parse, '["smith"]')
+        assert job["status"] == "succeeded"
+        assert job["progress"] == {"rows_parsed": 1, "employees_resolved": 1, "rows_written": 1}
+        resp = job["result"]
         assert len(resp["results"]) == 1
         assert all("未建立" not in e for e in _error_messages(resp["errors"]))
 
@@ -643,7 +671,7 @@ async def test_upload_endpoint_cross_type_lookup_case_b(async_session, monkeypat
         )
         await db.commit()
 
-        def _fake_parse(_: bytes, __: str, year: int | None = None, month: int | None = None):
+        async def _fake_parse(_: bytes, __: str, year: int | None = None, month: int | None = None):
             return [
                 {
                     "site": "上傳跨公司案場B",
@@ -653,21 +681,99 @@ async def test_upload_endpoint_cross_type_lookup_case_b(async_session, monkeypat
                 }
             ], []
 
-        monkeypatch.setattr(accounting_router, "parse_security_hours_file", _fake_parse)
-        upload = UploadFile(filename="hours.xlsx", file=BytesIO(b"dummy"))
-        resp = await accounting_router.security_payroll_upload(
-            file=upload,
-            year=2026,
-            month=1,
-            type="property",
-            payroll_type="property",
-            extra_payroll_types="[]",
-            db=db,
-        )
+        job = await _run_upload_job(async_session, monkeypatch, _fake_parse, "[]")
+        assert job["status"] == "succeeded"
+        resp = job["result"]
         assert resp["results"] == []
         assert "員工【上傳跨公司員工B】未建立" in _error_messages(resp["errors"])
 
 
+@pytest.mark.asyncio
+async def test_upload_job_parse_error_marks_failed(async_session, monkeypatch):
+    async def _bad_parse(_: bytes, __: str, year: int | None = None, month: int | None = None):
+        raise ValueError("檔案沒有任何可解析的 sheet")
+
+    job = await _run_upload_job(async_session, monkeypatch, _bad_parse, "[]")
+    assert job["status"] == "failed"
+    assert job["phase"] == "parsing"
+    assert job["error"] == "檔案沒有任何可解析的 sheet"
+    assert job["result"] is None
+    assert job["finished_at"] is not None
+
+
+@pytest.mark.asyncio
+async def test_recalculate_only_affected_employees(async_session, monkeypatch):
+    def _site(name):
+        return Site(
+            name=name,
+            client_name="客戶R",
+            address="地址R",
+            contract_start=date(2025, 1, 1),
+            monthly_amount=Decimal("100000"),
+            payment_method="transfer",
+            receivable_day=10,
+            is_84_1=False,
+        )
+
+    def _employee(name, national_id):
+        return Employee(
+            name=name,
+            birth_date=date(1990, 1, 1),
+            national_id=national_id,
+            reg_address="台北",
+            live_address="台北",
+            live_same_as_reg=True,
+            registration_type="property",
+            property_pay_mode="WEEKLY_2H",
+            property_salary=Decimal("50000"),
+            weekly_amount=Decimal("10000"),
+        )
+
+    async with async_session() as db:
+        db.add_all([_site("重算A"), _site("重算B"), _employee("重算甲", "R123456789"), _employee("重算乙", "R223456789")])
+        await db.commit()
+
+    hours = [
+        {"site": "重算A", "employee": "重算甲", "date": datetime(2026, 1, 5), "hours": 2},
+        {"site": "重算B", "employee": "重算甲", "date": datetime(2026, 1, 12), "hours": 2},
+        {"site": "重算B", "employee": "重算乙", "date": datetime(2026, 1, 5), "hours": 2},
+        {"site": "重算B", "employee": "重算乙", "date": datetime(2026, 1, 12), "hours": 2},
+    ]
+
+    async def _fake_parse(_: bytes, __: str, year: int | None = None, month: int | None = None):
+        return hours, []
+
+    job = await _run_upload_job(async_session, monkeypatch, _fake_parse, "[]")
+    assert job["status"] == "succeeded"
+
+    async with async_session() as db:
+        before = {
+            (r.employee, r.site): (r.id, r.gross_salary)
+            for r in (await db.execute(select(AccountingPayrollResult))).scalars().all()
+        }
+        emp = (await db.execute(select(Employee).where(Employee.name == "重算甲"))).scalar_one()
+        emp.weekly_amount = Decimal("15000")
+        await db.commit()
+
+    async with async_session() as db:
+        resp = await accounting_router.security_payroll_recalculate(
+            SecurityPayrollRecalculateRequest(year=2026, month=1, payroll_type="property", sites=["重算A"]),
+            db=db,
+        )
+        await db.commit()
+        assert resp["employees"] == ["重算甲"]
+        assert resp["deleted_before_insert"] == 2
+        assert {r["site"] for r in resp["results"]} == {"重算A", "重算B"}
+
+        after = {
+            (r.employee, r.site): (r.id, r.gross_salary)
+            for r in (await db.execute(select(AccountingPayrollResult))).scalars().all()
+        }
+    assert after[("重算乙", "重算B")] == before[("重算乙", "重算B")]
+    assert sum(before[("重算甲", s)][1] for s in ("重算A", "重算B")) == 20000
+    assert sum(after[("重算甲", s)][1] for s in ("重算A", "重算B")) == 30000
+
+
 @pytest.mark.asyncio
 async def test_cross_company_property_monthly_mode_should_calculate(async_session):
     async with async_session() as db:
@@ -713,3 +819,210 @@ async def test_cross_company_property_monthly_mode_should_calculate(async_sessio
         assert results[0]["employee"] == "林憶慧"
         assert results[0]["gross_salary"] > 0
         assert all("未設定物業計薪模式" not in m for m in _error_messages(errors))
+
+
+@pytest.mark.asyncio
+async def test_payroll_directory_registration_priority(async_session):
+    async with async_session() as db:
+        for national_id, registration_type in (("P123456789", "smith"), ("P223456789", "property")):
+            db.add(
+                Employee(
+                    name="同名員工",
+                    birth_date=date(1990, 1, 1),
+                    national_id=national_id,
+                    reg_address="台北",
+                    live_address="台北",
+                    live_same_as_reg=True,
+                    registration_type=registration_type,
+                )
+            )
+        db.add(
+            Site(
+                name="名錄案場",
+                client_name="客戶D",
+                address="地址D",
+                contract_start=date(2025, 1, 1),
+                monthly_amount=Decimal("100000"),
+                payment_method="transfer",
+                receivable_day=10,
+                is_84_1=False,
+            )
+        )
+        await db.commit()
+
+    async with async_session() as db:
+        directory = await PayrollDirectory.load(
+            db,
+            employee_names={"同名員工", "不存在"},
+            site_names={"名錄案場", "不存在案場"},
+            current_registration_type="property",
+            extra_registration_types=["smith"],
+        )
+        assert directory.get_employee("同名員工").registration_type == "property"
+        assert directory.get_employee(" 同名員工 ").registration_type == "property"
+        assert directory.get_employee("不存在") is None
+        assert directory.get_site("名錄案場") is not None
+        assert directory.get_site("不存在案場") is None
+
+        smith_first = await PayrollDirectory.load(
+            db,
+            employee_names={"同名員工"},
+            site_names=set(),
+            current_registration_type="security",
+            extra_registration_types=["smith", "property"],
+        )
+        assert smith_first.get_employee("同名員工").registration_type == "smith"
+
+
+@pytest.mark.asyncio
+async def test_vectorized_engine_parity_mixed_pay_types(async_session):
+    async with async_session() as db:
+        db.add(
+            Site(
+                name="引擎案場",
+                client_name="客戶E",
+                address="地址E",
+                contract_start=date(2025, 1, 1),
+                monthly_amount=Decimal("100000"),
+                payment_method="transfer",
+                receivable_day=10,
+                is_84_1=False,
+            )
+        )
+        employees = [
+            ("月薪甲", "monthly", Decimal("36000")),
+            ("日薪乙", "daily", Decimal("1875")),
+            ("時薪丙", "hourly", Decimal("183")),
+            ("游念棠", "daily", Decimal("10875")),
+        ]
+        for idx, (name, mode, value) in enumerate(employees):
+            db.add(
+                Employee(
+                    name=name,
+                    birth_date=date(1990, 1, 1),
+                    national_id=f"E{idx}23456789",
+                    reg_address="台北",
+                    live_address="台北",
+                    live_same_as_reg=True,
+                    registration_type="security",
+                    security_pay_mode=mode,
+                    salary_value=value,
+                    enroll_date=date(2025, 1, 1),
+                )
+            )
+        await db.commit()
+
+    rows = []
+    hours_cycle = [12, 11.5, 8, 0.5, 24, 7.25, 12.5, 0, 3.75]
+    for day in range(1, 32):
+        for idx, (name, _, _) in enumerate(employees):
+            site = "未建檔案場" if (day + idx) % 7 == 0 else "引擎案場"
+            rows.append(
+                {
+                    "site": site,
+                    "employee": name,
+                    "date": datetime(2026, 1, day),
+                    "hours": hours_cycle[(day + idx) % len(hours_cycle)],
+                }
+            )
+    rows.append({"site": "引擎案場", "employee": "不存在員工", "date": datetime(2026, 1, 3), "hours": 8})
+
+    async with async_session() as db:
+        outputs = {}
+        for engine in ("python", "vectorized"):
+            calculator = SecurityPayrollCalculator(db, engine=engine)
+            outputs[engine] = await calculator.validate_and_calculate(
+                rows, year=2026, month=1, payroll_type="security"
+            )
+    assert repr(outputs["python"]) == repr(outputs["vectorized"])
+    results, _, debug = outputs["vectorized"]
+    assert len(results) == 8
+    assert debug is not None and debug["employee"] == "游念棠"
+
+
+@pytest.mark.asyncio
+async def test_recalculate_defaults_to_upload_extra_types_and_keeps_failed_rows(async_session, monkeypatch):
+    async with async_session() as db:
+        db.add(
+            Site(
+                name="重算跨公司案場",
+                client_name="客戶X",
+                address="地址X",
+                contract_start=date(2025, 1, 1),
+                monthly_amount=Decimal("100000"),
+                payment_method="transfer",
+                receivable_day=10,
+                is_84_1=False,
+            )
+        )
+        db.add(
+            Employee(
+                name="重算跨公司員工",
+                birth_date=date(1990, 1, 1),
+                national_id="X123456789",
+                reg_address="台北",
+                live_address="台北",
+                live_same_as_reg=True,
+                registration_type="smith",
+                property_pay_mode="WEEKLY_2H",
+                property_salary=Decimal("50000"),
+                weekly_amount=Decimal("10000"),
+            )
+        )
+        await db.commit()
+
+    async def _fake_parse(_: bytes, __: str, year: int | None = None, month: int | None = None):
+        return [{"site": "重算跨公司案場", "employee": "重算跨公司員工", "date": datetime(2026, 1, 5), "hours": 2}], []
+
+    job = await _run_upload_job(async_session, monkeypatch, _fake_parse, '["smith"]')
+    assert job["status"] == "succeeded"
+    assert job["result"]["inserted"] == 1
+
+    async with async_session() as db:
+        # 未帶 extra_payroll_types：沿用上傳時的 ["smith"]
+        resp = await accounting_router.security_payroll_recalculate(
+            SecurityPayrollRecalculateRequest(year=2026, month=1, payroll_type="property", employees=["重算跨公司員工"]),
+            db=db,
+        )
+        await db.commit()
+        assert resp["recalculated_employees"] == ["重算跨公司員工"]
+        assert resp["deleted_before_insert"] == 1 and resp["inserted"] == 1
+
+    async with async_session() as db:
+        # 明確不帶跨公司類型：員工對應失敗，已存結果不刪除
+        resp = await accounting_router.security_payroll_recalculate(
+            SecurityPayrollRecalculateRequest(
+                year=2026, month=1, payroll_type="property", employees=["重算跨公司員工"], extra_payroll_types=[]
+            ),
+            db=db,
+        )
+        await db.commit()
+        assert resp["results"] == [] and resp["deleted_before_insert"] == 0
+        assert "員工【重算跨公司員工】未建立" in _error_messages(resp["errors"])
+        saved = (await db.execute(
+            select(AccountingPayrollResult).where(AccountingPayrollResult.employee == "重算跨公司員工")
+        )).scalars().all()
+    assert len(saved) == 1
+
+
+@pytest.mark.asyncio
+async def test_interrupted_job_cleanup_skips_jobs_with_live_heartbeat(async_session):
+    from app import crud
+
+    async with async_session() as db:
+        live = await crud.create_accounting_job(db, payroll_jobs.SECURITY_PAYROLL_UPLOAD, worker_id="other-worker")
+        stale = await crud.create_accounting_job(db, payroll_jobs.SECURITY_PAYROLL_UPLOAD, worker_id="gone-worker")
+        own = await crud.create_accounting_job(db, payroll_jobs.SECURITY_PAYROLL_UPLOAD, worker_id=payroll_jobs.WORKER_ID)
+        stale.heartbeat_at = own.heartbeat_at = datetime.utcnow() - timedelta(hours=1)
+        await db.commit()
+
+        assert await crud.touch_accounting_jobs(db, payroll_jobs.WORKER_ID) == 1
+        failed = await crud.fail_unfinished_accounting_jobs(
+            db, payroll_jobs.INTERRUPTED_REASON, payroll_jobs._stale_before()
+        )
+        await db.commit()
+        assert failed == 1
+
+    async with async_session() as db:
+        statuses = {j.id: j.status for j in (await db.execute(select(AccountingJob))).scalars().all()}
+    assert statuses == {live.id: "queued", stale.id: "failed", own.id: "queued"}
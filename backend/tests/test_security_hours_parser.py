@@ -0,0 +1,180 @@
+from datetime import datetime
+from io import BytesIO
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from app.accounting import parse_cache, parse_pool
+from app.accounting.security_payroll_service import (
+    _parse_calendar_matrix_one_sheet,
+    _site_from_sheet_name,
+    iter_calendar_matrix_records,
+    parse_security_hours_file,
+)
+from app.config import settings
+
+
+def _calendar_sheet(ws, site_label=None, employees=(), days=31):
+    if site_label:
+        ws.append(["01", site_label])
+    else:
+        ws.append(["保全時數表"])
+    ws.append(["類別", "姓名", "日期", *range(1, days + 1)])
+    ws.append([None, None, None, *(["一"] * days)])
+    for idx, name in enumerate(employees):
+        ws.append(["保全", name, "日", *[(d + idx) % 13 for d in range(1, days + 1)]])
+        # 夜班列姓名留白，沿用上一列（ffill）
+        ws.append([None, None, "夜", *[0.5 if d % 3 == 0 else None for d in range(1, days + 1)]])
+        ws.append([None, None, "備註"])
+
+
+def _workbook_bytes() -> bytes:
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "01_西雅圖"
+    _calendar_sheet(ws, employees=("王小明", "李大華"))
+    _calendar_sheet(wb.create_sheet("表內案場"), site_label="信義大樓", employees=("陳一",))
+    wb.create_sheet("空白")
+    bad = wb.create_sheet("02_無表頭")
+    bad.append(["姓名", "工時"])
+    bad.append(["王小明", 8])
+    bad.append(["李大華", 8])
+    buf = BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def isolated_upload_dir(tmp_path, monkeypatch):
+    """解析快取/暫存檔寫到各測試自己的目錄，避免案例間互相命中快取。"""
+    monkeypatch.setattr(settings, "upload_dir", tmp_path)
+    return tmp_path
+
+
+def _pandas_reference(content: bytes, year: int, month: int):
+    records, errors = [], []
+    all_sheets = pd.read_excel(BytesIO(content), engine="openpyxl", sheet_name=None, header=None)
+    for sh_name, df_raw in all_sheets.items():
+        if df_raw is None or df_raw.empty:
+            continue
+        recs, errs = _parse_calendar_matrix_one_sheet(
+            df_raw, year, month, sheet_name=sh_name, site_override=_site_from_sheet_name(sh_name)
+        )
+        records.extend(recs)
+        errors.extend(errs)
+    return records, errors
+
+
+def test_streaming_calendar_parser_matches_dataframe_parser():
+    content = _workbook_bytes()
+    errors = []
+    records = list(iter_calendar_matrix_records(content, 2026, 1, errors))
+    expected_records, expected_errors = _pandas_reference(content, 2026, 1)
+    assert records == expected_records
+    assert errors == expected_errors
+    assert errors == ["sheet【02_無表頭】找不到表頭：類別/姓名/日期/1..31"]
+    assert {r["site"] for r in records} == {"西雅圖", "信義大樓"}
+
+
+def test_streaming_calendar_parser_sums_shift_rows():
+    records = list(iter_calendar_matrix_records(_workbook_bytes(), 2026, 2))
+    day3 = [r for r in records if r["employee"] == "王小明" and r["date"] == datetime(2026, 2, 3)]
+    assert day3 == [{"site": "西雅圖", "employee": "王小明", "date": datetime(2026, 2, 3), "hours": 3.5}]
+    # 二月只產出 1~28 日
+    assert max(r["date"] for r in records) == datetime(2026, 2, 28)
+
+
+def test_parse_security_hours_file_xlsx_uses_streaming_parser():
+    records, errors = parse_security_hours_file(_workbook_bytes(), "hours.xlsx", year=2026, month=1)
+    assert len(records) == 3 * 31
+    assert len(errors) == 1
+
+
+def test_parse_security_hours_file_xlsx_without_header_raises():
+    wb = Workbook()
+    wb.active.append(["無關資料"])
+    buf = BytesIO()
+    wb.save(buf)
+    with pytest.raises(ValueError):
+        parse_security_hours_file(buf.getvalue(), "hours.xlsx", year=2026, month=1)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("workers", [0, 2])
+async def test_parse_pool_merges_sheets_in_order(monkeypatch, workers):
+    monkeypatch.setattr(settings, "parse_pool_max_workers", workers)
+    content = _workbook_bytes()
+    try:
+        records, errors = await parse_pool.parse_security_hours_file_async(content, "hours.xlsx", year=2026, month=1)
+    finally:
+        parse_pool.shutdown_parse_pool()
+    assert (records, errors) == parse_security_hours_file(content, "hours.xlsx", year=2026, month=1)
+    assert errors == ["sheet【02_無表頭】找不到表頭：類別/姓名/日期/1..31"]
+
+
+@pytest.mark.asyncio
+async def test_parse_pool_invalid_xlsx_raises(monkeypatch):
+    monkeypatch.setattr(settings, "parse_pool_max_workers", 0)
+    with pytest.raises(ValueError):
+        await parse_pool.parse_security_hours_file_async(b"not a workbook", "hours.xlsx", year=2026, month=1)
+
+
+@pytest.mark.asyncio
+async def test_parse_pool_sheet_failure_raises_value_error(monkeypatch):
+    monkeypatch.setattr(settings, "parse_pool_max_workers", 0)
+    real = parse_pool.parse_calendar_matrix_sheet
+
+    def _flaky(path, idx, year, month):
+        if idx == 1:
+            raise KeyError("broken sheet")
+        return real(path, idx, year, month)
+
+    monkeypatch.setattr(parse_pool, "parse_calendar_matrix_sheet", _flaky)
+    with pytest.raises(ValueError, match="檔案沒有任何可解析的 sheet"):
+        await parse_pool.parse_security_hours_file_async(_workbook_bytes(), "hours.xlsx", year=2026, month=1)
+
+
+@pytest.mark.asyncio
+async def test_parse_cache_skips_reparse_on_reupload(monkeypatch):
+    monkeypatch.setattr(settings, "parse_pool_max_workers", 0)
+    content = _workbook_bytes()
+    first = await parse_pool.parse_security_hours_file_async(content, "hours.xlsx", year=2026, month=1)
+
+    async def _fail(*args):
+        raise AssertionError("should be served from parse cache")
+
+    monkeypatch.setattr(parse_pool, "_parse_uncached", _fail)
+    second = await parse_pool.parse_security_hours_file_async(content, "again.xlsx", year=2026, month=1)
+    assert second == first
+    # 不同年月為不同 key
+    with pytest.raises(AssertionError):
+        await parse_pool.parse_security_hours_file_async(content, "hours.xlsx", year=2026, month=2)
+
+
+def test_parse_cache_key_changes_with_parser_version(monkeypatch):
+    key = parse_cache.cache_key(b"content", "hours.xlsx", 2026, 1)
+    monkeypatch.setattr(parse_cache, "HOURS_PARSER_VERSION", parse_cache.HOURS_PARSER_VERSION + 1)
+    assert parse_cache.cache_key(b"content", "hours.xlsx", 2026, 1) != key
+
+
+def test_parse_cache_evicts_least_recently_used(monkeypatch, isolated_upload_dir):
+    import os
+
+    monkeypatch.setattr(settings, "parse_cache_max_mb", 1)
+    # 隨機姓名避免壓縮後過小
+    records = [
+        {"site": f"案場{i % 40}", "employee": os.urandom(16).hex(), "date": datetime(2026, 1, 1 + i % 31), "hours": float(i % 13)}
+        for i in range(30000)
+    ]
+    parse_cache.store("a", records, [])
+    parse_cache.store("b", records[:10], [])
+    cache_dir = isolated_upload_dir / "parse_cache"
+    # 讓 a 比 b 新（剛使用過），再寫入 c 觸發淘汰
+    os.utime(cache_dir / "b.parse.bin", (1, 1))
+    assert parse_cache.load("a") == (records, [])
+    parse_cache.store("c", [dict(r, employee=os.urandom(16).hex()) for r in records], ["err"])
+    remaining = {p.name for p in cache_dir.glob("*.parse.bin")}
+    assert "b.parse.bin" not in remaining
+    assert "c.parse.bin" in remaining
+    assert sum(p.stat().st_size for p in cache_dir.glob("*.parse.bin")) <= 1024 * 1024
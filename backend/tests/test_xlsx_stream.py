@@ -0,0 +1,86 @@
+from datetime import date, datetime, time, timedelta
+from io import BytesIO
+
+import pytest
+from openpyxl import load_workbook
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app.accounting.payroll_export import build_payroll_excel
+from app.database import Base
+from app.models import PatrolLog
+from app.routers import patrol as patrol_router
+from app.utils import xlsx_stream
+
+
+@pytest.fixture
+async def async_session():
+    engine = create_async_engine(
+        "sqlite+aiosqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    try:
+        yield session_factory
+    finally:
+        await engine.dispose()
+
+
+async def _read_body(resp) -> bytes:
+    chunks = []
+    async for chunk in resp.body_iterator:
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+@pytest.mark.asyncio
+async def test_export_logs_excel_streams_all_rows(async_session, monkeypatch):
+    # 小區塊與小 spool 上限：確保走落地暫存檔與多區塊串流
+    monkeypatch.setattr(xlsx_stream, "SPOOL_MAX_MEMORY", 1024)
+    monkeypatch.setattr(xlsx_stream, "STREAM_CHUNK_SIZE", 4096)
+    monkeypatch.setattr(patrol_router, "EXPORT_FETCH_SIZE", 100)
+    base = datetime(2026, 1, 1, 1, 0, 0)
+    async with async_session() as db:
+        db.add_all([
+            PatrolLog(
+                employee_name=f"員工{i}",
+                site_name="案場A",
+                point_code=f"P{i % 7}",
+                point_name="大門",
+                checkin_date=date(2026, 1, 1),
+                checkin_time=time(9, 0),
+                checkin_ampm="上午",
+                created_at=base + timedelta(seconds=i),
+            )
+            for i in range(1500)
+        ])
+        await db.commit()
+
+    async with async_session() as db:
+        resp = await patrol_router.export_logs_excel(
+            date_from=None, date_to=None, employee_name=None, site_name=None, point_code=None, db=db,
+        )
+        body = await _read_body(resp)
+
+    assert resp.media_type == xlsx_stream.XLSX_MEDIA_TYPE
+    wb = load_workbook(BytesIO(body), read_only=True)
+    ws = wb["巡邏紀錄"]
+    rows = list(ws.iter_rows(values_only=True))
+    assert rows[0][0] == "員工名稱"
+    assert len(rows) == 1501
+    # 依 created_at 由新到舊
+    assert rows[1][0] == "員工1499"
+    assert rows[-1][0] == "員工0"
+
+
+def test_build_payroll_excel_write_only_header_style():
+    content = build_payroll_excel([{"site": "案場", "employee": "甲", "pay_type": "monthly", "total_hours": 288}], sheet_name="x" * 40)
+    wb = load_workbook(BytesIO(content))
+    ws = wb.active
+    assert ws.title == "x" * 31
+    assert ws["A1"].font.bold is True
+    assert ws["C2"].value == "月薪"
+    assert ws.column_dimensions["P"].width == 14
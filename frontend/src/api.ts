@@ -60,7 +60,7 @@ export function clearPatrolDeviceToken(): void {
   localStorage.removeItem(PATROL_DEVICE_TOKEN_KEY)
 }
 
-async function request<T>(path: string, options?: RequestInit): Promise<T> {
+async function request<T>(path: string, options?: RequestInit, onResponse?: (res: Response) => void): Promise<T> {
   const token = localStorage.getItem('access_token')
   const headers: Record<string, string> = {
     'Content-Type': 'application/json',
@@ -77,6 +77,7 @@ async function request<T>(path: string, options?: RequestInit): Promise<T> {
   } catch (e) {
     throw new ApiError(translateError(e instanceof Error ? e.message : '無法連線伺服器'), 0)
   }
+  onResponse?.(res)
   if (res.status === 204) return undefined as T
   const text = await res.text()
   if (!res.ok) {
@@ -618,6 +619,11 @@ export const patrolApi = {
     }),
   deletePoint: (id: number) => request<void>(`/patrol/points/${id}`, { method: 'DELETE' }),
   getPointQr: (publicId: string) => request<import('./types').PatrolPointQr>(`/patrol/points/${publicId}/qr`),
+  /** 伺服器端產生並快取的 QR 圖檔 */
+  pointQrImageUrl: (publicId: string, format: 'png' | 'svg' = 'png') =>
+    `${BASE}/patrol/points/${encodeURIComponent(publicId)}/qr/image?format=${format}`,
+  /** 案場全部巡邏點 QR 貼紙（A4 多頁 PDF） */
+  pointsQrSheetUrl: (siteId: number) => `${BASE}/patrol/points/qr-sheet?site_id=${siteId}`,
   checkinByPublicId: async (publicId: string, payload: { employee_id?: number; employee_name?: string; device_info?: string }) => {
     const res = await fetch(`${BASE}/patrol/checkin/${encodeURIComponent(publicId)}`, {
       method: 'POST',
@@ -663,6 +669,24 @@ export const patrolApi = {
     }
     return (text ? JSON.parse(text) : undefined) as import('./types').PatrolCheckinResponse
   },
+  checkinBatch: async (scans: import('./types').PatrolBatchCheckinScan[]) => {
+    const token = getPatrolDeviceToken()
+    const headers: Record<string, string> = { 'Content-Type': 'application/json' }
+    if (token) headers['X-Device-Token'] = token
+    const res = await fetch(`${BASE}/patrol/checkin/batch`, {
+      method: 'POST',
+      headers,
+      body: JSON.stringify({ scans }),
+    })
+    const text = await res.text()
+    if (!res.ok) {
+      let data: Record<string, unknown> = {}
+      try { if (text) data = JSON.parse(text) as Record<string, unknown> } catch { data = { detail: text } }
+      const detail = typeof data.detail === 'string' ? data.detail : String(data.detail ?? (text || res.statusText))
+      throw new Error(translateError(detail))
+    }
+    return (text ? JSON.parse(text) : undefined) as import('./types').PatrolBatchCheckinResponse
+  },
   listLogs: (params?: { date_from?: string; date_to?: string; employee_name?: string; site_name?: string; point_code?: string; limit?: number }) => {
     const q = new URLSearchParams()
     if (params?.date_from) q.set('date_from', params.date_from)
@@ -673,6 +697,30 @@ export const patrolApi = {
     if (params?.limit != null) q.set('limit', String(params.limit))
     return request<import('./types').PatrolLog[]>(`/patrol/logs${q.toString() ? `?${q.toString()}` : ''}`)
   },
+  /** 游標分頁：cursor 為上一頁回傳的 nextCursor；nextCursor 為 null 表示已無下一頁 */
+  listLogsPage: async (params: { date_from?: string; date_to?: string; employee_name?: string; site_name?: string; point_code?: string; limit?: number; cursor?: string | null }) => {
+    const q = new URLSearchParams()
+    if (params.date_from) q.set('date_from', params.date_from)
+    if (params.date_to) q.set('date_to', params.date_to)
+    if (params.employee_name?.trim()) q.set('employee_name', params.employee_name.trim())
+    if (params.site_name?.trim()) q.set('site_name', params.site_name.trim())
+    if (params.point_code?.trim()) q.set('point_code', params.point_code.trim())
+    if (params.limit != null) q.set('limit', String(params.limit))
+    if (params.cursor) q.set('cursor', params.cursor)
+    let nextCursor: string | null = null
+    const items = await request<import('./types').PatrolLog[]>(
+      `/patrol/logs${q.toString() ? `?${q.toString()}` : ''}`,
+      undefined,
+      (res) => { nextCursor = res.headers.get('X-Next-Cursor') },
+    )
+    return { items, nextCursor: nextCursor as string | null }
+  },
+  coverage: (params: { site_id: number; year: number; month: number }) =>
+    request<import('./types').PatrolCoverage>(
+      `/patrol/coverage?site_id=${params.site_id}&year=${params.year}&month=${params.month}`
+    ),
+  /** SSE 即時打卡事件（event: checkin，data 為 PatrolLog 加 site_id / point_id） */
+  logStreamUrl: (siteId?: number) => `${BASE}/patrol/logs/stream${siteId != null ? `?site_id=${siteId}` : ''}`,
   exportLogsUrl: (params?: { date_from?: string; date_to?: string; employee_name?: string; site_name?: string; point_code?: string }) => {
     const q = new URLSearchParams()
     if (params?.date_from) q.set('date_from', params.date_from)
@@ -749,6 +797,22 @@ export interface SecurityPayrollResponse {
   inserted?: number
 }
 
+export type AccountingJobStatus = 'queued' | 'running' | 'succeeded' | 'failed'
+
+export interface AccountingJob<T = unknown> {
+  id: number
+  kind: string
+  status: AccountingJobStatus
+  phase: string
+  params: Record<string, unknown>
+  progress: { rows_parsed: number; employees_resolved: number; rows_written: number }
+  error: string | null
+  created_at: string
+  started_at: string | null
+  finished_at: string | null
+  result?: T | null
+}
+
 export interface SecurityPayrollHistorySummary {
   total_gross: number
   total_net: number
@@ -817,9 +881,19 @@ export const accountingApi = {
       }
       throw new Error(translateError(String(err)))
     }
-    return JSON.parse(text || '{"results":[],"errors":[]}')
+    // 上傳後改為背景工作：輪詢工作狀態直到完成
+    const { job_id } = JSON.parse(text) as { job_id: number }
+    for (;;) {
+      const job = await accountingApi.job<SecurityPayrollResponse>(job_id)
+      if (job.status === 'succeeded') return job.result ?? { results: [], errors: [] }
+      if (job.status === 'failed') throw new Error(translateError(job.error || '計算失敗'))
+      await new Promise((resolve) => setTimeout(resolve, 1000))
+    }
   },
 
+  /** 查詢背景工作狀態（階段、進度與完成結果） */
+  job: <T = unknown>(jobId: number) => request<AccountingJob<T>>(`/accounting/jobs/${jobId}`),
+
   /** 依年/月查詢已存檔薪資結果 */
   history: (year: number, month: number, payrollType: PayrollType = 'security') =>
     request<SecurityPayrollHistoryResponse>(
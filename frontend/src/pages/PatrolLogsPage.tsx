@@ -1,9 +1,17 @@
-import { useEffect, useState } from 'react'
+import { useEffect, useRef, useState } from 'react'
 import { downloadReportExcel, patrolApi } from '../api'
 import type { PatrolLog } from '../types'
 
 const TZ = 'Asia/Taipei'
 
+type LogFilters = {
+  date_from?: string
+  date_to?: string
+  employee_name?: string
+  site_name?: string
+  point_code?: string
+}
+
 /** 依 Asia/Taipei 將 checkin_at 格式為：時段（早上/下午/晚上）+ 12 小時制 hh:mm:ss */
 function formatCheckinAt(checkinAt: string | undefined): { period: string; time12: string } {
   const fallback = { period: '-', time12: '-' }
@@ -38,20 +46,30 @@ export default function PatrolLogsPage() {
   const [pointCode, setPointCode] = useState('')
   const [loading, setLoading] = useState(false)
   const [error, setError] = useState('')
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
+  // 第一頁查詢時套用的篩選條件；「載入更多」沿用同一組條件，游標才對得上
+  const appliedRef = useRef<LogFilters>({})
+  // 未設篩選條件時，即時打卡事件直接插入列表最上方
+  const liveRef = useRef(true)
 
-  async function query() {
+  async function query(cursor: string | null = null) {
+    if (!cursor) {
+      appliedRef.current = {
+        date_from: dateFrom || undefined,
+        date_to: dateTo || undefined,
+        employee_name: employeeName.trim() || undefined,
+        site_name: siteName.trim() || undefined,
+        point_code: pointCode.trim() || undefined,
+      }
+    }
+    const filters = appliedRef.current
     setLoading(true)
     setError('')
     try {
-      const list = await patrolApi.listLogs({
-        date_from: dateFrom || undefined,
-        date_to: dateTo || undefined,
-        employee_name: employeeName || undefined,
-        site_name: siteName || undefined,
-        point_code: pointCode || undefined,
-        limit: 1000,
-      })
-      setRows(list)
+      const page = await patrolApi.listLogsPage({ ...filters, limit: 1000, cursor })
+      setRows((prev) => (cursor ? [...prev, ...page.items] : page.items))
+      liveRef.current = !Object.values(filters).some(Boolean)
+      setNextCursor(page.nextCursor)
     } catch (err) {
       setError(err instanceof Error ? err.message : '讀取失敗')
     } finally {
@@ -80,6 +98,16 @@ export default function PatrolLogsPage() {
     void query()
   }, [])
 
+  useEffect(() => {
+    const source = new EventSource(patrolApi.logStreamUrl())
+    source.addEventListener('checkin', (e) => {
+      if (!liveRef.current) return
+      const log = JSON.parse((e as MessageEvent).data) as PatrolLog
+      setRows((prev) => (prev.some((r) => r.id === log.id) ? prev : [log, ...prev]))
+    })
+    return () => source.close()
+  }, [])
+
   return (
     <div className="space-y-4">
       <h1 className="text-2xl font-semibold">巡邏紀錄</h1>
@@ -125,6 +153,11 @@ export default function PatrolLogsPage() {
           </tbody>
         </table>
       </div>
+      {nextCursor && (
+        <button onClick={() => void query(nextCursor)} disabled={loading} className="rounded border border-slate-300 bg-white px-3 py-1 text-sm">
+          {loading ? '載入中…' : '載入更多'}
+        </button>
+      )}
     </div>
   )
 }
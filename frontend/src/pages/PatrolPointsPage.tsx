@@ -50,6 +50,14 @@ export default function PatrolPointsPage() {
     void loadData()
   }, [])
 
+  const sites = Array.from(
+    new Map(
+      rows
+        .filter((r) => r.site_id != null)
+        .map((r) => [r.site_id as number, { id: r.site_id as number, name: r.site_name || `案場 ${r.site_id}` }]),
+    ).values(),
+  )
+
   function bindEdit(row: PatrolPoint) {
     setEditingId(row.id)
     setForm({
@@ -154,6 +162,22 @@ export default function PatrolPointsPage() {
         </button>
       </form>
       {error && <p className="text-sm text-rose-600">{error}</p>}
+      {sites.length > 0 && (
+        <div className="flex flex-wrap items-center gap-2 text-sm">
+          <span className="text-slate-600">列印 QR 貼紙（PDF）：</span>
+          {sites.map((s) => (
+            <a
+              key={s.id}
+              href={patrolApi.pointsQrSheetUrl(s.id)}
+              target="_blank"
+              rel="noreferrer"
+              className="rounded border border-slate-300 px-2 py-1 hover:bg-slate-100"
+            >
+              {s.name}
+            </a>
+          ))}
+        </div>
+      )}
       <div className="rounded border border-slate-300 bg-white overflow-auto">
         <table className="min-w-full text-sm">
           <thead className="bg-slate-100">
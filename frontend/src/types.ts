@@ -467,6 +467,54 @@ export interface PatrolCheckinResponse {
   created_at: string
 }
 
+export interface PatrolBatchCheckinScan {
+  qr_value: string
+  timestamp: string
+  client_ref?: string
+}
+
+export interface PatrolBatchCheckinItemResult {
+  index: number
+  client_ref?: string | null
+  status: 'created' | 'duplicate' | 'error'
+  status_code: number
+  detail?: string | null
+  cooldown_seconds?: number | null
+  last_scan_at?: string | null
+  log?: PatrolCheckinResponse | null
+}
+
+export interface PatrolBatchCheckinResponse {
+  created: number
+  duplicates: number
+  errors: number
+  results: PatrolBatchCheckinItemResult[]
+}
+
+export interface PatrolCoverageCell {
+  scan_date: string
+  period: string
+  scan_count: number
+  first_scan: string
+  last_scan: string
+}
+
+export interface PatrolCoverage {
+  site_id: number
+  year: number
+  month: number
+  days: string[]
+  periods: string[]
+  points: {
+    point_id: number
+    point_code: string
+    point_name: string
+    is_active: boolean
+    covered_slots: number
+    cells: PatrolCoverageCell[]
+  }[]
+}
+
 export interface PatrolLog {
   id: number
   employee_name: string